@@ -1008,24 +1008,31 @@ function formatInvoiceStatus(status) {
   }
 }
 
-async function loadAllInvoices() {
+async function loadAllInvoices(cursor = null) {
   const tbody = document.getElementById("invoices-table-body");
   if (!tbody) return;
-  tbody.innerHTML =
-    '<tr><td colspan="6" class="text-center text-gray-500 py-4">Đang tải...</td></tr>';
+  document.getElementById("invoices-load-more")?.remove();
+  if (!cursor) {
+    tbody.innerHTML =
+      '<tr><td colspan="6" class="text-center text-gray-500 py-4">Đang tải...</td></tr>';
+  }
 
   try {
-    const invoices = await window.apiRequestCore(
+    // API trả về từng trang, trang kế tiếp lấy bằng next_cursor
+    const page = await window.apiRequestCore(
       window.ADMIN_TOKEN_KEY,
-      "/api/invoices/",
+      cursor
+        ? `/api/invoices/?cursor=${encodeURIComponent(cursor)}`
+        : "/api/invoices/",
       "GET"
     );
-    if (!invoices || invoices.length === 0) {
+    const invoices = page.invoices || [];
+    if (!cursor && invoices.length === 0) {
       tbody.innerHTML =
         '<tr><td colspan="6" class="text-center py-4">Không có hóa đơn.</td></tr>';
       return;
     }
-    tbody.innerHTML = invoices
+    const rows = invoices
       .map((inv) => {
         const statusInfo = formatInvoiceStatus(inv.status);
         return `
@@ -1065,6 +1072,22 @@ async function loadAllInvoices() {
             </tr>`;
       })
       .join("");
+    if (cursor) {
+      tbody.insertAdjacentHTML("beforeend", rows);
+    } else {
+      tbody.innerHTML = rows;
+    }
+    if (page.next_cursor) {
+      tbody.insertAdjacentHTML(
+        "beforeend",
+        `<tr id="invoices-load-more"><td colspan="6" class="text-center py-3">
+            <button class="text-indigo-600 hover:text-indigo-900 font-medium">Tải thêm</button>
+        </td></tr>`
+      );
+      document
+        .querySelector("#invoices-load-more button")
+        .addEventListener("click", () => loadAllInvoices(page.next_cursor));
+    }
   } catch (e) {
     tbody.innerHTML =
       '<tr><td colspan="6" class="text-center text-red-500">Lỗi tải hóa đơn.</td></tr>';
@@ -1153,14 +1176,14 @@ window.closeCreateInvoiceModal = () => {
 window.openCreateInvoiceModal = async () => {
   createInvoiceModal?.classList.remove("hidden");
   try {
-    // Load bookings confirmed chưa có hóa đơn và Inventory
-    const [bookings, invoices, items] = await Promise.all([
+    // Load bookings confirmed và Inventory. Lập hóa đơn xong thì booking chuyển sang completed,
+    // nên không cần tải toàn bộ hóa đơn để lọc; booking đã có hóa đơn sẽ bị API từ chối (409)
+    const [bookings, items] = await Promise.all([
       window.apiRequestCore(
         window.ADMIN_TOKEN_KEY,
         "/api/bookings/items",
         "GET"
       ),
-      window.apiRequestCore(window.ADMIN_TOKEN_KEY, "/api/invoices/", "GET"),
       window.apiRequestCore(
         window.ADMIN_TOKEN_KEY,
         "/api/inventory/items",
@@ -1169,10 +1192,7 @@ window.openCreateInvoiceModal = async () => {
     ]);
     window.inventoryItems = items; // Cache for dropdown
 
-    const invoiceBookingIds = invoices.map((i) => i.booking_id);
-    const available = bookings.filter(
-      (b) => b.status === "confirmed" && !invoiceBookingIds.includes(b.id)
-    );
+    const available = bookings.filter((b) => b.status === "confirmed");
 
     const select = document.getElementById("invoice-booking-id");
     select.innerHTML =
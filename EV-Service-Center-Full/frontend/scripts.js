@@ -632,20 +632,42 @@ function showHistory(type, element) {
 }
 window.showHistory = showHistory;
 
-async function loadMyInvoicesList() {
+async function loadMyInvoicesList(cursor = null) {
   const container = document.getElementById("invoice-list-container");
   if (!container) return;
-  container.innerHTML =
-    '<div class="text-center text-gray-400">Đang tải...</div>';
+  document.getElementById("invoice-load-more")?.remove();
+  if (!cursor) {
+    container.innerHTML =
+      '<div class="text-center text-gray-400">Đang tải...</div>';
+  }
 
   try {
-    const invoices = await apiRequestCore(TOKEN_KEY, "/api/invoices/my", "GET");
-    if (!invoices || invoices.length === 0) {
+    // API trả về từng trang, trang kế tiếp lấy bằng next_cursor
+    const endpoint = cursor
+      ? `/api/invoices/my?cursor=${encodeURIComponent(cursor)}`
+      : "/api/invoices/my";
+    const page = await apiRequestCore(TOKEN_KEY, endpoint, "GET");
+    const invoices = page.invoices || [];
+    if (!cursor && invoices.length === 0) {
       container.innerHTML =
         '<div class="text-center text-gray-500">Chưa có hóa đơn nào.</div>';
       return;
     }
-    container.innerHTML = invoices.map(renderInvoiceCard).join("");
+    const html = invoices.map(renderInvoiceCard).join("");
+    if (cursor) {
+      container.insertAdjacentHTML("beforeend", html);
+    } else {
+      container.innerHTML = html;
+    }
+    if (page.next_cursor) {
+      container.insertAdjacentHTML(
+        "beforeend",
+        `<button id="invoice-load-more" class="w-full text-center text-indigo-600 hover:text-indigo-800 py-2">Tải thêm</button>`
+      );
+      document
+        .getElementById("invoice-load-more")
+        .addEventListener("click", () => loadMyInvoicesList(page.next_cursor));
+    }
   } catch (e) {
     container.innerHTML =
       '<div class="text-center text-red-400">Lỗi tải hóa đơn.</div>';
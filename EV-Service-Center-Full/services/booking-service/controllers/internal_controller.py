@@ -40,3 +40,9 @@ def update_booking_status(booking_id):
         return jsonify({"error": error}), 400
 
     return jsonify(booking.to_dict()), 200
+
+@internal_bp.route("/centers", methods=["GET"])
+def get_service_centers():
+    """Danh sách trung tâm dịch vụ kèm tọa độ (cho inventory-service tính khoảng cách điều chuyển)"""
+    centers = BookingService.get_all_service_centers(active_only=False)
+    return jsonify([c.to_dict() for c in centers]), 200
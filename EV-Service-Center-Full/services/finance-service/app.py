@@ -75,6 +75,20 @@ def create_app():
     app.config["INVENTORY_SERVICE_URL"] = os.getenv("INVENTORY_SERVICE_URL")
     app.config["PAYMENT_SERVICE_URL"] = os.getenv("PAYMENT_SERVICE_URL")
     app.config["MAINTENANCE_SERVICE_URL"] = os.getenv("MAINTENANCE_SERVICE_URL")
+    # Timeout (connect, read) theo host cho Internal API; lời gọi trừ kho được phép chậm hơn
+    app.config["INTERNAL_HTTP_TIMEOUTS"] = {
+        "booking-service": (1.0, 3.0),
+        "maintenance-service": (1.0, 3.0),
+        "inventory-service": (1.0, 5.0),
+        "payment-service": (1.0, 5.0),
+    }
+    # Ngân sách độ trễ cho việc tạo hóa đơn đồng bộ (ms), vượt quá sẽ log cảnh báo
+    app.config["INVOICE_LATENCY_BUDGET_MS"] = int(os.getenv("INVOICE_LATENCY_BUDGET_MS", "3000"))
+    # Kỳ hạn thanh toán hóa đơn (ngày) và chu kỳ job chuyển 'overdue' (giây)
+    app.config["INVOICE_PAYMENT_TERM_DAYS"] = int(os.getenv("INVOICE_PAYMENT_TERM_DAYS", "30"))
+    app.config["INVOICE_DUE_JOB_INTERVAL"] = int(os.getenv("INVOICE_DUE_JOB_INTERVAL", "300"))
+    # Thư mục lưu PDF hóa đơn (mặc định: <app>/storage/invoice_pdfs)
+    app.config["INVOICE_PDF_DIR"] = os.getenv("INVOICE_PDF_DIR")
     
     # ===== KHỞI TẠO EXTENSIONS =====
     db.init_app(app)
@@ -83,7 +97,7 @@ def create_app():
 
     # ===== IMPORT MODELS & TẠO TABLES =====
     with app.app_context():
-        from models.finance_model import Invoice, InvoiceItem 
+        from models.finance_model import Invoice, InvoiceItem, InvoiceSaga, InvoiceSagaStep
         db.create_all()
 
     # ===== ĐĂNG KÝ BLUEPRINTS (Controllers) =====
@@ -93,6 +107,14 @@ def create_app():
     app.register_blueprint(invoice_bp) 
     app.register_blueprint(internal_bp)
 
+    # ===== SAGA RESUME + JOB HẠN THANH TOÁN (chỉ khi chạy Gunicorn, không chạy cho lệnh CLI) =====
+    if is_running_gunicorn:
+        from services.saga_service import InvoiceSagaService
+        InvoiceSagaService.start_resume_loop(app)
+
+        from services.invoice_due_service import InvoiceDueService
+        InvoiceDueService.start_due_loop(app, app.config["INVOICE_DUE_JOB_INTERVAL"])
+
     # ===== HEALTH CHECK =====
     @app.route("/health", methods=["GET"])
     def health_check():
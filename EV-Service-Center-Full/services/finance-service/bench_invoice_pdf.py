@@ -0,0 +1,75 @@
+"""
+Benchmark render hóa đơn PDF trên 1 worker (1 luồng).
+
+Chạy:  python bench_invoice_pdf.py [số_hóa_đơn] [số_dòng_mỗi_hóa_đơn]
+Đo hai đường đi:
+- render: số PDF render được mỗi giây (lần tải đầu tiên)
+- cache hit: số lần băm nội dung + kiểm tra file mỗi giây (các lần tải lại, không render)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.invoice_pdf_service import InvoicePdfService  # noqa: E402
+
+
+def make_payload(invoice_id, line_count):
+    items = [{
+        "id": 1,
+        "description": "Dịch vụ: Bảo dưỡng định kỳ",
+        "item_type": "service",
+        "quantity": 1,
+        "unit_price": 500000.0,
+        "sub_total": 500000.0
+    }]
+    for i in range(line_count - 1):
+        items.append({
+            "id": i + 2,
+            "description": f"Phụ tùng VF8 số {i + 1}",
+            "item_type": "part",
+            "quantity": 2,
+            "unit_price": 450000.0,
+            "sub_total": 900000.0
+        })
+    return {
+        "id": invoice_id,
+        "booking_id": invoice_id,
+        "user_id": 1,
+        "total_amount": sum(item["sub_total"] for item in items),
+        "status": "issued",
+        "created_at": "2025-11-26T10:00:00",
+        "items": items
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    payloads = [make_payload(i + 1, lines) for i in range(count)]
+
+    with tempfile.TemporaryDirectory() as storage_dir:
+        start = time.perf_counter()
+        total_bytes = 0
+        for payload in payloads:
+            digest = InvoicePdfService.digest(payload)
+            content = InvoicePdfService.render_pdf_bytes(payload)
+            InvoicePdfService._write_atomic(InvoicePdfService.path_for(storage_dir, digest), content)
+            total_bytes += len(content)
+        render_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for payload in payloads:
+            digest = InvoicePdfService.digest(payload)
+            assert os.path.exists(InvoicePdfService.path_for(storage_dir, digest))
+        hit_elapsed = time.perf_counter() - start
+
+    print(f"Hóa đơn: {count} x {lines} dòng, font: {InvoicePdfService._font()}")
+    print(f"Render:    {count / render_elapsed:8.1f} PDF/s/worker  (TB {total_bytes / count / 1024:.1f} KB/PDF)")
+    print(f"Cache hit: {count / hit_elapsed:8.1f} lượt/s/worker (không render lại)")
+
+
+if __name__ == "__main__":
+    main()
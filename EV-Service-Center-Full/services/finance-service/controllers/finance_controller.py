@@ -1,7 +1,8 @@
 # File: services/finance-service/controllers/finance_controller.py
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
 from functools import wraps
+from datetime import datetime
 
 from services.finance_service import FinanceService as service
 
@@ -33,12 +34,26 @@ def serialize_invoice(invoice, include_items=False):
     if not invoice: return None
     
     data = invoice.to_dict()
-    # Nếu dùng lazy='dynamic', cần gọi .all()
+    # items nên được eager-load (selectinload) trước khi serialize danh sách để tránh N+1
     if include_items and hasattr(invoice, 'items'):
-        data['items'] = [item.to_dict() for item in invoice.items.all()]
+        data['items'] = [item.to_dict() for item in invoice.items]
     
     return data
 
+def summary_response():
+    """Đọc tham số (period, from, to) và trả về báo cáo tổng hợp hóa đơn"""
+    period = request.args.get("period", "month")
+    try:
+        date_from = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        date_to = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"error": "Tham số from/to phải theo định dạng ISO (YYYY-MM-DD)."}), 400
+
+    summary, error = service.get_invoice_summary(period, date_from, date_to)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(summary), 200
+
 # --- Routes ---
 
 # 1. ADMIN: CREATE INVOICE (POST /api/invoices)
@@ -52,34 +67,98 @@ def create_invoice():
     if not booking_id:
         return jsonify({"error": "Thiếu booking_id"}), 400
 
+    # Chế độ bất đồng bộ: trả về saga ngay, client theo dõi qua /api/invoices/sagas/<id>
+    if data.get("async"):
+        saga, error = service.start_invoice_saga(booking_id)
+        if error:
+            status_code = 409 if "tồn tại" in error else 400
+            return jsonify({"error": error}), status_code
+        return jsonify({
+            "message": "Đang tạo hóa đơn.",
+            "saga": saga.to_dict()
+        }), 202
+
     # Logic: Tạo hóa đơn (phụ tùng sẽ được lấy từ maintenance task)
-    invoice, error = service.create_invoice_from_booking(booking_id)
+    invoice, saga, error = service.create_invoice_from_booking(booking_id)
 
     if error:
         # 409 Conflict: đã tồn tại. 400 Bad Request: lỗi khác.
         status_code = 409 if "tồn tại" in error else 400
         return jsonify({"error": error}), status_code
 
+    if saga.status != "completed":
+        # Hóa đơn đã ghi, chỉ còn bước cập nhật Booking chưa xong
+        return jsonify({
+            "message": "Hóa đơn đã được tạo, nhưng chưa cập nhật được trạng thái Booking.",
+            "invoice": serialize_invoice(invoice, include_items=True),
+            "booking_update": {
+                "status": "retrying" if saga.status == "running" else "failed",
+                "error": saga.error,
+                "saga_id": saga.id
+            }
+        }), 201
+
     return jsonify({
         "message": "Hóa đơn được tạo thành công!",
         "invoice": serialize_invoice(invoice, include_items=True)
     }), 201
 
-# 2. ADMIN: GET ALL INVOICES (GET /api/invoices)
+# 1b. ADMIN: GET INVOICE SAGA STATUS (GET /api/invoices/sagas/<id>)
+@invoice_bp.route("/sagas/<int:saga_id>", methods=["GET"])
+@jwt_required()
+@admin_required()
+def get_invoice_saga(saga_id):
+    from services.saga_service import InvoiceSagaService
+
+    saga = InvoiceSagaService.get_saga(saga_id)
+    if not saga:
+        return jsonify({"error": "Không tìm thấy saga."}), 404
+    return jsonify(saga.to_dict(include_steps=True)), 200
+
+def _page_response(user_id=None):
+    """Đọc tham số phân trang (cursor, limit, include_items) và trả về một trang hóa đơn"""
+    cursor = request.args.get("cursor")
+    limit = max(1, min(request.args.get("limit", 50, type=int), 200))
+    include_items = request.args.get("include_items", "false").lower() == "true"
+
+    page, error = service.list_invoices_page(user_id=user_id, cursor=cursor, limit=limit, include_items=include_items)
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify({
+        "invoices": [serialize_invoice(i, include_items=include_items) for i in page["invoices"]],
+        "next_cursor": page["next_cursor"],
+        "total": page["total"],
+        "total_is_exact": page["total_is_exact"]
+    }), 200
+
+# 2. ADMIN: GET ALL INVOICES (GET /api/invoices?cursor=&limit=&include_items=)
+# Trả về từng trang (mặc định 50 hóa đơn), trang kế tiếp lấy bằng next_cursor; /page là alias cũ
 @invoice_bp.route("/", methods=["GET"])
+@invoice_bp.route("/page", methods=["GET"])
 @jwt_required()
 @admin_required()
 def get_all_invoices():
-    invoices = service.get_all_invoices()
-    return jsonify([serialize_invoice(i) for i in invoices]), 200
+    return _page_response()
+
+# 2c. ADMIN: FINANCE SUMMARY (GET /api/invoices/summary?period=month&from=&to=)
+@invoice_bp.route("/summary", methods=["GET"])
+@jwt_required()
+@admin_required()
+def get_invoice_summary():
+    return summary_response()
 
-# 3. USER: GET MY INVOICES (GET /api/invoices/my)
+# 3. USER: GET MY INVOICES (GET /api/invoices/my?cursor=&limit=&include_items=)
+# Phân trang giống /api/invoices; /my/page là alias cũ
 @invoice_bp.route("/my", methods=["GET"])
+@invoice_bp.route("/my/page", methods=["GET"])
 @jwt_required()
 def get_my_invoices():
-    user_id = get_jwt_identity()
-    invoices = service.get_invoices_by_user(user_id)
-    return jsonify([serialize_invoice(i) for i in invoices]), 200
+    try:
+        user_id = int(get_jwt_identity())
+    except (TypeError, ValueError):
+        return jsonify({"error": "Token không hợp lệ."}), 400
+    return _page_response(user_id=user_id)
 
 # 4. GET INVOICE BY ID (GET /api/invoices/<id>)
 @invoice_bp.route("/<int:invoice_id>", methods=["GET"])
@@ -102,6 +181,39 @@ def get_invoice_details(invoice_id):
 
     return jsonify(invoice_data), 200
 
+# 4b. DOWNLOAD INVOICE PDF (GET /api/invoices/<id>/pdf) - hỗ trợ ETag / If-None-Match / Range
+@invoice_bp.route("/<int:invoice_id>/pdf", methods=["GET"])
+@jwt_required()
+def download_invoice_pdf(invoice_id):
+    from services.invoice_pdf_service import InvoicePdfService
+
+    invoice = service.get_invoice(invoice_id)
+    if not invoice:
+        return jsonify({"error": "Không tìm thấy Hóa đơn."}), 404
+
+    claims = get_jwt()
+    is_admin = claims.get("role") == "admin"
+    is_owner = str(invoice.user_id) == str(get_jwt_identity())
+    if not is_admin and not is_owner:
+        return jsonify(error="Unauthorized access to invoice"), 403
+
+    path, digest = InvoicePdfService.get_pdf(invoice)
+    if not path:
+        # Chưa render xong: client thử lại sau
+        response = jsonify({"message": "Hóa đơn PDF đang được tạo, vui lòng thử lại sau."})
+        response.headers["Retry-After"] = "2"
+        return response, 202
+
+    # conditional=True: Werkzeug tự xử lý If-None-Match (304) và Range (206)
+    return send_file(
+        path,
+        mimetype="application/pdf",
+        download_name=f"hoa-don-{invoice_id}.pdf",
+        conditional=True,
+        etag=digest,
+        max_age=0
+    )
+
 # 5. ADMIN: UPDATE STATUS (PUT /api/invoices/<id>/status)
 @invoice_bp.route("/<int:invoice_id>/status", methods=["PUT"])
 @jwt_required()
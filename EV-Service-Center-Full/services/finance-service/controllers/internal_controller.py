@@ -1,7 +1,8 @@
 # File: services/finance-service/controllers/internal_controller.py
 from flask import Blueprint, request, jsonify, current_app
 from services.finance_service import FinanceService
-from controllers.finance_controller import serialize_invoice # Tái sử dụng helper
+from services.invoice_due_service import InvoiceDueService
+from controllers.finance_controller import serialize_invoice, summary_response # Tái sử dụng helper
 
 internal_bp = Blueprint("internal_invoice", __name__, url_prefix="/internal/invoices")
 
@@ -16,6 +17,41 @@ def verify_internal_token():
         return jsonify({"error": "Unauthorized internal request"}), 403
 
 
+# 0. Lấy trang hóa đơn theo keyset (dùng cho job đối soát của Payment Service)
+@internal_bp.route("/page", methods=["GET"])
+def internal_get_invoices_page():
+    after_id = request.args.get("after_id", 0, type=int)
+    limit = min(request.args.get("limit", 1000, type=int), 5000)
+
+    invoices = FinanceService.get_invoices_page(after_id, limit)
+    return jsonify({
+        "invoices": invoices,
+        "next_after_id": invoices[-1]["id"] if len(invoices) == limit else None
+    }), 200
+
+# 0b. Báo cáo tổng hợp hóa đơn (dùng cho Report Service / dashboard kế toán)
+@internal_bp.route("/summary", methods=["GET"])
+def internal_get_invoice_summary():
+    return summary_response()
+
+# 0c. Hóa đơn sắp đến hạn (dùng cho job nhắc thanh toán của Notification Service)
+@internal_bp.route("/due-soon", methods=["GET"])
+def internal_get_invoices_due_soon():
+    try:
+        days = [int(d) for d in request.args.get("days", "1,3,7").split(",") if d.strip()]
+    except ValueError:
+        return jsonify({"error": "Tham số days phải là danh sách số nguyên, ví dụ: 1,3,7"}), 400
+    after_id = request.args.get("after_id", 0, type=int)
+    limit = min(request.args.get("limit", 500, type=int), 2000)
+
+    invoices = InvoiceDueService.get_due_soon(days, after_id, limit)
+    return jsonify({
+        "success": True,
+        "invoices": invoices,
+        "count": len(invoices),
+        "next_after_id": invoices[-1]["id"] if len(invoices) == limit else None
+    }), 200
+
 # 1. Lấy chi tiết Invoice (dùng cho Payment Service)
 @internal_bp.route("/<int:invoice_id>", methods=["GET"])
 def internal_get_invoice(invoice_id):
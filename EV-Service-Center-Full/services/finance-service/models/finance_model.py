@@ -5,7 +5,7 @@ from sqlalchemy.orm import relationship
 
 # Định nghĩa các trạng thái của Hóa đơn
 INVOICE_STATUSES = db.Enum(
-    "pending", "issued", "paid", "canceled", 
+    "pending", "issued", "paid", "canceled", "overdue",
     name="invoice_statuses"
 )
 # Định nghĩa loại mặt hàng
@@ -26,14 +26,35 @@ class Invoice(db.Model):
         nullable=False,
         default="issued"
     )
+    # Hạn thanh toán (đặt khi lập hóa đơn), quá hạn thì job chuyển sang 'overdue'
+    due_date = db.Column(db.DateTime, nullable=True)
+    # Thời điểm đã gửi thông báo quá hạn (NULL = chưa gửi), dùng để không gửi trùng
+    overdue_notified_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=func.now())
     updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    # lazy="select" (thay vì "dynamic") để có thể eager-load items cho cả trang bằng selectinload
     items = db.relationship(
         "InvoiceItem", 
         back_populates="invoice", 
-        lazy="dynamic", 
+        lazy="select", 
+        order_by="InvoiceItem.id",
         cascade="all, delete-orphan"
     )
+
+    # Index cho phân trang keyset theo (created_at, id), toàn bộ và theo từng user
+    __table_args__ = (
+        db.Index("ix_invoices_created_at_id", "created_at", "id"),
+        db.Index("ix_invoices_user_created_at_id", "user_id", "created_at", "id"),
+        # Covering index cho báo cáo tổng hợp: lọc theo status + khoảng thời gian, đọc total_amount từ index
+        db.Index("ix_invoices_status_created_at", "status", "created_at", postgresql_include=["total_amount"]),
+        # Job hạn thanh toán: quét theo (status, due_date) nên chi phí chỉ phụ thuộc số hóa đơn đến hạn
+        db.Index("ix_invoices_status_due_date", "status", "due_date"),
+        # Hóa đơn quá hạn chưa được thông báo (partial index, thường rất nhỏ)
+        db.Index(
+            "ix_invoices_overdue_unnotified", "id",
+            postgresql_where=db.text("status = 'overdue' AND overdue_notified_at IS NULL")
+        ),
+    )
     def to_dict(self):
         """Chuyển đổi Invoice sang dictionary để trả về API"""
         return {
@@ -42,6 +63,7 @@ class Invoice(db.Model):
             "user_id": self.user_id,
             "total_amount": self.total_amount,
             "status": str(self.status),
+            "due_date": self.due_date.isoformat() if self.due_date else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
@@ -66,4 +88,67 @@ class InvoiceItem(db.Model):
             "quantity": self.quantity,
             "unit_price": self.unit_price,
             "sub_total": self.sub_total
-        }
\ No newline at end of file
+        }
+
+# Trạng thái của Saga lập hóa đơn
+SAGA_STATUSES = db.Enum(
+    "running", "completed", "compensating", "compensated", "failed",
+    name="invoice_saga_statuses"
+)
+
+class InvoiceSaga(db.Model):
+    """Saga lập hóa đơn từ Booking (booking -> parts -> trừ kho -> ghi hóa đơn -> hoàn tất booking)"""
+    __tablename__ = "invoice_sagas"
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    booking_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(SAGA_STATUSES, nullable=False, default="running")
+    current_step = db.Column(db.String(50), nullable=True)
+    # Dữ liệu trung gian giữa các bước (booking, parts, items đã trừ kho, invoice_id...)
+    context_json = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # Lease: worker nào đang giữ saga, hết hạn thì job resume được phép nhận lại
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    steps = db.relationship(
+        "InvoiceSagaStep",
+        back_populates="saga",
+        order_by="InvoiceSagaStep.id",
+        cascade="all, delete-orphan"
+    )
+
+    def to_dict(self, include_steps=False):
+        data = {
+            "id": self.id,
+            "booking_id": self.booking_id,
+            "status": str(self.status),
+            "current_step": self.current_step,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_steps:
+            data["steps"] = [step.to_dict() for step in self.steps]
+        return data
+
+class InvoiceSagaStep(db.Model):
+    """Nhật ký từng bước của Saga (append-only)"""
+    __tablename__ = "invoice_saga_steps"
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    saga_id = db.Column(db.Integer, db.ForeignKey("invoice_sagas.id"), nullable=False, index=True)
+    step_name = db.Column(db.String(50), nullable=False)
+    # started, completed, failed, compensated, compensation_failed
+    status = db.Column(db.String(20), nullable=False)
+    attempt = db.Column(db.Integer, nullable=False, default=1)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    saga = db.relationship("InvoiceSaga", back_populates="steps")
+
+    def to_dict(self):
+        return {
+            "step_name": self.step_name,
+            "status": self.status,
+            "attempt": self.attempt,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
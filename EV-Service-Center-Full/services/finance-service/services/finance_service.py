@@ -1,13 +1,20 @@
 import os
 import requests
+from datetime import datetime
 from flask import current_app
 from app import db
 from models.finance_model import Invoice, InvoiceItem 
-from sqlalchemy import desc # Cần import cho các hàm history (bị thiếu)
+from sqlalchemy import desc, func, text, tuple_ # Cần import cho các hàm history (bị thiếu)
+from sqlalchemy.orm import selectinload
+from services.http_client import InternalHttpClient
 
 class FinanceService:
     """Service xử lý logic nghiệp vụ Tài chính và Hóa đơn"""
 
+    # Dưới ngưỡng này thì đếm chính xác, trên ngưỡng dùng ước lượng từ thống kê của Postgres
+    EXACT_COUNT_THRESHOLD = 10000
+    TASK_PARTS_BATCH_SIZE = 300
+
     @staticmethod
     def _call_internal_api(service_url, endpoint, method="GET", json_data=None):
         """Hàm nội bộ gọi Internal API của các service khác"""
@@ -18,21 +25,21 @@ class FinanceService:
         if not service_url or not internal_token:
              return None, "Lỗi cấu hình Service URL hoặc Internal Token."
 
+        if method not in ("GET", "PUT", "POST"):
+            return None, "Lỗi: Phương thức không hỗ trợ."
+
         try:
-            if method == "GET":
-                response = requests.get(url, headers=headers)
-            elif method == "PUT":
-                response = requests.put(url, headers=headers, json=json_data)
-            elif method == "POST":
-                response = requests.post(url, headers=headers, json=json_data)
-            else:
-                return None, "Lỗi: Phương thức không hỗ trợ."
+            # Session keep-alive dùng chung, có timeout theo host và retry cho GET/PUT
+            response = InternalHttpClient.request(method, url, headers=headers, json=json_data)
 
             if response.status_code == 200 or response.status_code == 201:
                 return response.json(), None
             else:
                 # Trích xuất lỗi từ response body nếu có
-                error_msg = response.json().get('error', f"Lỗi Service (HTTP {response.status_code})")
+                try:
+                    error_msg = response.json().get('error', f"Lỗi Service (HTTP {response.status_code})")
+                except ValueError:
+                    error_msg = f"Lỗi Service (HTTP {response.status_code})"
                 return None, error_msg
         except requests.exceptions.RequestException as e:
             return None, f"Lỗi kết nối Service: {str(e)}"
@@ -51,23 +58,92 @@ class FinanceService:
         return FinanceService._call_internal_api(booking_url, f"/internal/bookings/items/{booking_id}")
     
     @staticmethod
-    def _get_inventory_item(item_id):
-        """Lấy chi tiết Vật tư từ Inventory Service"""
-        inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
-        return FinanceService._call_internal_api(inventory_url, f"/api/inventory/items/{item_id}")
+    def _get_task_parts_by_bookings(booking_ids):
+        """
+        Phụ tùng đã dùng (cộng dồn trên mọi task) của nhiều booking, một lời gọi GET cho mỗi
+        TASK_PARTS_BATCH_SIZE booking (giữ dòng request dưới giới hạn 4094 byte của gunicorn).
+        Trả về ({booking_id: [{"item_id", "quantity"}]}, error); booking chưa có task không có trong kết quả.
+        """
+        maintenance_url = current_app.config.get("MAINTENANCE_SERVICE_URL")
+        booking_ids = sorted(set(booking_ids))
+        batch_size = FinanceService.TASK_PARTS_BATCH_SIZE
+        parts = {}
+        for begin in range(0, len(booking_ids), batch_size):
+            ids = ",".join(str(booking_id) for booking_id in booking_ids[begin:begin + batch_size])
+            data, error = FinanceService._call_internal_api(maintenance_url, f"/internal/maintenance/bookings/parts?ids={ids}")
+            if error:
+                return None, error
+            for booking_id, booking_parts in data.get("parts", {}).items():
+                parts[int(booking_id)] = booking_parts
+        return parts, None
 
     @staticmethod
     def _get_task_parts_by_booking(booking_id):
-        """Lấy danh sách phụ tùng từ task theo booking_id"""
-        maintenance_url = current_app.config.get("MAINTENANCE_SERVICE_URL")
-        return FinanceService._call_internal_api(maintenance_url, f"/api/maintenance/bookings/{booking_id}/parts")
+        """Lấy danh sách phụ tùng từ các task của booking_id"""
+        parts, error = FinanceService._get_task_parts_by_bookings([booking_id])
+        if error:
+            return None, error
+        if booking_id not in parts:
+            return None, "Task không tồn tại cho booking này"
+        return parts[booking_id], None
 
     @staticmethod
-    def _update_inventory_quantity(item_id, new_quantity):
-        """Cập nhật tồn kho bằng cách gọi PUT Inventory Service (dùng Internal Token)"""
+    def _deduct_inventory_batch(lines, booking_id=None):
+        """
+        Trừ kho nguyên tử cho toàn bộ phụ tùng của hóa đơn bằng MỘT lời gọi Inventory Service.
+        Trả về danh sách vật tư (kèm tên, giá) theo item_id.
+        """
         inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
-        endpoint = f"/api/inventory/items/{item_id}"
-        return FinanceService._call_internal_api(inventory_url, endpoint, "PUT", {"quantity": new_quantity})
+        return FinanceService._call_internal_api(
+            inventory_url, "/internal/inventory/deduct", "POST",
+            {"items": lines, "reference_type": "booking", "reference_id": booking_id}
+        )
+
+    @staticmethod
+    def _restock_inventory_batch(lines, booking_id=None):
+        """Hoàn kho (bù trừ cho _deduct_inventory_batch) bằng một lời gọi Inventory Service"""
+        inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
+        return FinanceService._call_internal_api(
+            inventory_url, "/internal/inventory/restock", "POST",
+            {"items": lines, "reference_type": "booking", "reference_id": booking_id}
+        )
+
+    @staticmethod
+    def _get_booking_deductions(booking_id):
+        """
+        Đối chiếu sổ cái Inventory Service: số lượng còn đang bị trừ cho booking
+        (deduct trừ đi restock), dùng khi không chắc lời gọi trừ kho đã được áp dụng hay chưa.
+        Trả về (dict item_id -> số lượng, error)
+        """
+        inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
+        net = {}
+        after_id = 0
+        while after_id is not None:
+            data, error = FinanceService._call_internal_api(
+                inventory_url,
+                f"/internal/inventory/movements?reference_type=booking&reference_id={booking_id}&after_id={after_id}",
+                "GET"
+            )
+            if error:
+                return None, error
+            for movement in data.get("movements", []):
+                if movement.get("reason") in ("deduct", "restock"):
+                    item_id = movement.get("inventory_id")
+                    net[item_id] = net.get(item_id, 0) + movement.get("delta", 0)
+            after_id = data.get("next_after_id")
+        return {item_id: -delta for item_id, delta in net.items() if delta < 0}, None
+
+    @staticmethod
+    def _get_inventory_items(item_ids):
+        """Lấy tên/giá nhiều vật tư bằng một lời gọi Inventory Service. Trả về (dict item_id -> vật tư, error)"""
+        if not item_ids:
+            return {}, None
+        inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
+        ids_param = ",".join(str(item_id) for item_id in item_ids)
+        data, error = FinanceService._call_internal_api(inventory_url, f"/internal/inventory/items?ids={ids_param}", "GET")
+        if error:
+            return None, error
+        return {item.get("id"): item for item in data.get("items", [])}, None
 
     @staticmethod
     def initiate_payment(invoice_id, method, user_id):
@@ -110,130 +186,182 @@ class FinanceService:
         """
         Tạo Hóa đơn mới từ Booking ID, bao gồm cả việc trừ tồn kho.
         Phụ tùng sẽ được lấy từ maintenance task (do KTV đã thêm).
+        Toàn bộ quy trình chạy dưới dạng saga (xem services/saga_service.py):
+        nếu thất bại giữa chừng, tồn kho đã trừ sẽ được hoàn lại.
+        Trả về (invoice, saga, error). Khi hóa đơn đã được ghi (qua điểm pivot) thì luôn trả về
+        invoice; saga.status khác "completed" nghĩa là bước cập nhật Booking chưa xong
+        ("running": job resume sẽ thử lại, "failed": đã hết số lần thử, saga.error ghi lý do).
         """
-        # 1. Lấy chi tiết Booking
-        booking_data, error = FinanceService._get_booking_details(booking_id)
-        if error:
-            return None, f"Lỗi khi lấy Booking: {error}"
+        from services.saga_service import InvoiceSagaService
 
-        user_id = booking_data.get('user_id')
-
-        # Kiểm tra trùng lặp
-        if Invoice.query.filter_by(booking_id=booking_id).first():
-            return None, "Hóa đơn cho Booking này đã tồn tại."
+        saga, error = InvoiceSagaService.start(booking_id)
+        if error:
+            return None, None, error
 
-        # 2. Lấy danh sách phụ tùng từ maintenance task
-        task_parts_data, parts_error = FinanceService._get_task_parts_by_booking(booking_id)
-        if parts_error:
-            # Nếu không có task hoặc không có parts, vẫn tạo hóa đơn nhưng chỉ có service
-            task_parts_data = []
+        # Saga ở running/failed sau pivot vẫn giữ hóa đơn; compensating/compensated thì hóa đơn bị xóa
+        invoice = Invoice.query.filter_by(booking_id=booking_id).first()
+        if invoice and saga.status in ("completed", "running", "failed"):
+            return invoice, saga, None
 
-        # TẠO TRANSACTION CHUNG
-        try:
-            total_amount = 0.0
+        return None, saga, saga.error or "Lỗi khi tạo hóa đơn."
 
-            new_invoice = Invoice(
-                booking_id=booking_id,
-                user_id=user_id,
-                total_amount=0.0
-            )
-            db.session.add(new_invoice)
-            db.session.flush() # Lấy ID của Invoice mới
-
-            # 3. Thêm Dịch vụ (Service Item)
-            service_price = 500000.0 # Giá công thợ cố định
-            service_item = InvoiceItem(
-                invoice_id=new_invoice.id,
-                item_type="service",
-                description=f"Dịch vụ: {booking_data.get('service_type', 'Kiểm tra tổng quát')}",
-                quantity=1,
-                unit_price=service_price,
-                sub_total=service_price
-            )
-            db.session.add(service_item)
-            total_amount += service_price
-
-            # 4. Thêm Phụ tùng (Part Items) từ task VÀ TRỪ TỒN KHO
-            for part in task_parts_data:
-                item_id = part.get('item_id')
-                quantity = part.get('quantity')
-                
-                if not item_id or not isinstance(quantity, int) or quantity <= 0:
-                    continue 
-
-                # Lấy thông tin vật tư
-                inventory_item, error = FinanceService._get_inventory_item(item_id)
-                if error:
-                    db.session.rollback()
-                    return None, f"Lỗi: Không tìm thấy phụ tùng ID {item_id} hoặc Inventory Service lỗi."
-                
-                current_quantity = inventory_item.get('quantity', 0)
-                new_quantity = current_quantity - quantity
-
-                if new_quantity < 0:
-                    db.session.rollback()
-                    return None, f"Lỗi: Tồn kho cho phụ tùng ID {item_id} không đủ. Cần {quantity}, hiện có {current_quantity}."
-
-                # GỌI API ĐỂ TRỪ TỒN KHO THỰC TẾ
-                update_response, update_error = FinanceService._update_inventory_quantity(item_id, new_quantity)
-
-                if update_error:
-                    db.session.rollback()
-                    return None, f"Lỗi khi cập nhật tồn kho ID {item_id}: {update_error}"
-                
-                # Tính toán và lưu Invoice Item
-                unit_price = inventory_item.get('price', 0.0)
-                sub_total = unit_price * quantity
-                
-                part_item = InvoiceItem(
-                    invoice_id=new_invoice.id,
-                    item_type="part",
-                    description=inventory_item.get('name', 'Phụ tùng không tên'),
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    sub_total=sub_total
-                )
-                db.session.add(part_item)
-                total_amount += sub_total
-            
-            # 4. Cập nhật tổng tiền và Commit
-            new_invoice.total_amount = total_amount
-            db.session.commit()
-            
-            # 5. Cập nhật trạng thái Booking sang 'completed' (sau khi lập hóa đơn)
-            booking_update_url = current_app.config.get("BOOKING_SERVICE_URL")
-            FinanceService._call_internal_api(booking_update_url, f"/api/bookings/items/{booking_id}/status", "PUT", {"status": "completed"})
+    @staticmethod
+    def start_invoice_saga(booking_id):
+        """Tạo hóa đơn bất đồng bộ: trả về saga ngay, các bước chạy ở thread nền"""
+        from services.saga_service import InvoiceSagaService
+        return InvoiceSagaService.start(booking_id, run_async=True)
 
-            return new_invoice, None
+    @staticmethod
+    def get_invoice(invoice_id):
+        return Invoice.query.get(invoice_id)
 
-        except Exception as e:
-            db.session.rollback()
-            return None, f"Lỗi khi tạo hóa đơn: {str(e)}"
-    
     @staticmethod
     def get_invoice_with_items(invoice_id):
         invoice = Invoice.query.get(invoice_id)
         if not invoice:
             return None, "Không tìm thấy Hóa đơn."
         
-        items_list = [item.to_dict() for item in invoice.items.all()]
+        items_list = [item.to_dict() for item in invoice.items]
 
         result = invoice.to_dict()
         result["items"] = items_list
         return result, None
 
     @staticmethod
-    def get_all_invoices():
-        return Invoice.query.order_by(Invoice.created_at.desc()).all()
-    
+    def get_invoices_page(after_id=0, limit=1000):
+        """
+        Lấy một trang hóa đơn theo keyset (id > after_id), sắp xếp theo id.
+        Dùng cho job đối soát của Payment Service: chỉ lấy các cột cần thiết,
+        không offset nên chi phí mỗi trang là hằng số dù bảng lớn đến đâu.
+        """
+        rows = db.session.query(Invoice.id, Invoice.status, Invoice.total_amount)\
+            .filter(Invoice.id > after_id)\
+            .order_by(Invoice.id.asc())\
+            .limit(limit).all()
+        return [
+            {"id": r.id, "status": str(r.status), "total_amount": r.total_amount}
+            for r in rows
+        ]
+
     @staticmethod
-    def get_invoices_by_user(user_id):
-        try:
-            user_id_int = int(user_id)
-        except ValueError:
-            return []
+    def _encode_cursor(invoice):
+        return f"{invoice.created_at.isoformat()}_{invoice.id}"
 
-        return Invoice.query.filter_by(user_id=user_id_int).order_by(Invoice.created_at.desc()).all()
+    @staticmethod
+    def _decode_cursor(cursor):
+        created_at, invoice_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(invoice_id)
+
+    @staticmethod
+    def _estimate_invoice_count(user_id=None):
+        """
+        Tổng số hóa đơn cho phân trang. Trả về (total, is_exact).
+        - Theo user: đếm chính xác (dùng index user_id, số lượng nhỏ).
+        - Toàn bảng: đọc reltuples từ pg_class, chỉ đếm chính xác khi bảng còn nhỏ.
+        """
+        if user_id is not None:
+            return Invoice.query.filter_by(user_id=user_id).count(), True
+
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {"table": Invoice.__tablename__}
+        ).scalar()
+        if estimate is None or estimate < FinanceService.EXACT_COUNT_THRESHOLD:
+            return db.session.query(func.count(Invoice.id)).scalar(), True
+        return int(estimate), False
+
+    @staticmethod
+    def list_invoices_page(user_id=None, cursor=None, limit=50, include_items=False):
+        """
+        Phân trang hóa đơn theo keyset (created_at, id) giảm dần.
+        Items của cả trang được nạp bằng MỘT câu IN (selectinload) => 2 truy vấn mỗi trang.
+        Tổng số chỉ được tính ở trang đầu (không có cursor, thêm 1-2 truy vấn đếm); các trang sau
+        trả về total=None, client giữ tổng của trang đầu.
+        Trả về (page_dict, error), page_dict chứa các đối tượng Invoice chưa serialize.
+        """
+        query = Invoice.query
+        if user_id is not None:
+            query = query.filter(Invoice.user_id == user_id)
+
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = FinanceService._decode_cursor(cursor)
+            except (ValueError, AttributeError):
+                return None, "Cursor không hợp lệ."
+            query = query.filter(tuple_(Invoice.created_at, Invoice.id) < tuple_(cursor_created_at, cursor_id))
+
+        if include_items:
+            query = query.options(selectinload(Invoice.items))
+
+        rows = query.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit + 1).all()
+        invoices = rows[:limit]
+        total, total_is_exact = (None, None) if cursor else FinanceService._estimate_invoice_count(user_id)
+
+        return {
+            "invoices": invoices,
+            "next_cursor": FinanceService._encode_cursor(invoices[-1]) if len(rows) > limit else None,
+            "total": total,
+            "total_is_exact": total_is_exact
+        }, None
+
+    @staticmethod
+    def get_invoice_summary(period="month", date_from=None, date_to=None):
+        """
+        Tổng hợp tài chính tính hoàn toàn bằng SQL GROUP BY:
+        - Công nợ phải thu (hóa đơn pending/issued)
+        - Tổng tiền theo trạng thái cho từng kỳ (day/week/month)
+        - Doanh thu đã thu theo loại mặt hàng (service/part)
+        """
+        if period not in ("day", "week", "month"):
+            return None, "Tham số period phải là: day, week, month"
+
+        def _apply_range(query):
+            if date_from:
+                query = query.filter(Invoice.created_at >= date_from)
+            if date_to:
+                query = query.filter(Invoice.created_at < date_to)
+            return query
+
+        # 1. Công nợ phải thu
+        outstanding = _apply_range(db.session.query(
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0)
+        ).filter(Invoice.status.in_(("pending", "issued", "overdue")))).one()
+
+        # 2. Tổng theo kỳ và trạng thái
+        bucket = func.date_trunc(period, Invoice.created_at).label("bucket")
+        period_rows = _apply_range(db.session.query(
+            bucket,
+            Invoice.status,
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_amount), 0.0)
+        )).group_by(bucket, Invoice.status).order_by(bucket).all()
+
+        periods = {}
+        for bucket_start, status, count, amount in period_rows:
+            key = bucket_start.isoformat()
+            entry = periods.setdefault(key, {"period_start": key, "by_status": {}})
+            entry["by_status"][str(status)] = {"count": count, "total_amount": float(amount)}
+
+        # 3. Doanh thu đã thu theo loại mặt hàng
+        item_rows = _apply_range(db.session.query(
+            InvoiceItem.item_type,
+            func.coalesce(func.sum(InvoiceItem.quantity), 0),
+            func.coalesce(func.sum(InvoiceItem.sub_total), 0.0)
+        ).join(Invoice, Invoice.id == InvoiceItem.invoice_id)
+         .filter(Invoice.status == "paid")).group_by(InvoiceItem.item_type).all()
+
+        return {
+            "period": period,
+            "date_from": date_from.isoformat() if date_from else None,
+            "date_to": date_to.isoformat() if date_to else None,
+            "outstanding": {"count": outstanding[0], "total_amount": float(outstanding[1])},
+            "periods": list(periods.values()),
+            "revenue_by_item_type": {
+                str(item_type): {"quantity": int(quantity), "revenue": float(revenue)}
+                for item_type, quantity, revenue in item_rows
+            }
+        }, None
 
     @staticmethod
     def update_invoice_status(invoice_id, new_status):
@@ -242,13 +370,18 @@ class FinanceService:
             return None, "Không tìm thấy Hóa đơn."
 
         # Valid invoice statuses defined in the model
-        valid_statuses = ["pending", "issued", "paid", "canceled"]
+        valid_statuses = ["pending", "issued", "paid", "canceled", "overdue"]
         if new_status not in valid_statuses:
             return None, f"Trạng thái '{new_status}' không hợp lệ. Phải là: {', '.join(valid_statuses)}"
         
         try:
             invoice.status = new_status
             db.session.commit()
+
+            if new_status == "paid":
+                # Render lại PDF với trạng thái đã thanh toán (ở nền)
+                from services.invoice_pdf_service import InvoicePdfService
+                InvoicePdfService.enqueue(invoice.id)
             return invoice, None
         except Exception as e:
             db.session.rollback()
@@ -256,10 +389,10 @@ class FinanceService:
     @staticmethod
     def _notify_invoice_created(invoice):
         """Thông báo hóa đơn mới"""
-        from notification_helper import NotificationHelper
+        from services.notification_helper import NotificationHelper
         
         return NotificationHelper.send_notification(
-            user_id=invoice.customer_id,
+            user_id=invoice.user_id,
             notification_type="payment",
             title="📄 Hóa đơn mới",
             message=f"Hóa đơn #{invoice.id} với số tiền {invoice.total_amount:,.0f} VNĐ đã được tạo. Vui lòng thanh toán.",
@@ -274,17 +407,40 @@ class FinanceService:
         )
     
     @staticmethod
-    def _notify_invoice_overdue(invoice):
-        """Thông báo hóa đơn quá hạn"""
-        from notification_helper import NotificationHelper
-        
-        return NotificationHelper.send_notification(
-            user_id=invoice.customer_id,
-            notification_type="payment",
-            title="⚠️ Hóa đơn quá hạn",
-            message=f"Hóa đơn #{invoice.id} với số tiền {invoice.total_amount:,.0f} VNĐ đã quá hạn thanh toán. Vui lòng thanh toán ngay!",
-            channel="in_app",
-            priority="urgent",
-            related_entity_type="invoice",
-            related_entity_id=invoice.id
-        )
+    def _notify_invoice_overdue(invoices):
+        """
+        Thông báo hóa đơn quá hạn theo lô: mỗi khách hàng nhận MỘT thông báo
+        (gộp mọi hóa đơn quá hạn của họ), gửi bằng một lời gọi bulk.
+        invoices: danh sách dict {id, user_id, total_amount, due_date}
+        """
+        from services.notification_helper import NotificationHelper
+
+        by_user = {}
+        for invoice in invoices:
+            by_user.setdefault(invoice["user_id"], {})[invoice["id"]] = invoice  # Bỏ trùng theo id
+
+        notifications = []
+        for user_id, user_invoices in by_user.items():
+            rows = sorted(user_invoices.values(), key=lambda row: row["id"])
+            total = sum(row["total_amount"] or 0.0 for row in rows)
+            if len(rows) == 1:
+                message = f"Hóa đơn #{rows[0]['id']} với số tiền {total:,.0f} VNĐ đã quá hạn thanh toán. Vui lòng thanh toán ngay!"
+            else:
+                invoice_refs = ", ".join(f"#{row['id']}" for row in rows)
+                message = f"Bạn có {len(rows)} hóa đơn quá hạn ({invoice_refs}), tổng {total:,.0f} VNĐ. Vui lòng thanh toán ngay!"
+            notifications.append({
+                "user_id": user_id,
+                "notification_type": "payment",
+                "title": "⚠️ Hóa đơn quá hạn",
+                "message": message,
+                "channel": "in_app",
+                "priority": "urgent",
+                "related_entity_type": "invoice",
+                "related_entity_id": rows[0]["id"],
+                "metadata": {
+                    "invoice_ids": [row["id"] for row in rows],
+                    "total_amount": total
+                }
+            })
+
+        return NotificationHelper.send_bulk(notifications)
@@ -0,0 +1,153 @@
+"""
+Hạn thanh toán và trạng thái quá hạn của hóa đơn.
+
+Finance Service là nơi duy nhất lưu due_date. Job định kỳ:
+1. Chuyển các hóa đơn đã quá hạn sang 'overdue' bằng MỘT câu UPDATE (theo index status, due_date).
+2. Nhận (claim) các hóa đơn quá hạn chưa được thông báo theo lô, gộp theo khách hàng
+   và gửi bằng một lời gọi bulk. Gửi lỗi thì nhả claim để lần chạy sau gửi lại.
+Chi phí mỗi lần chạy chỉ phụ thuộc số hóa đơn đến hạn, không phụ thuộc tổng số hóa đơn.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from app import db
+from models.finance_model import Invoice
+from services.finance_service import FinanceService
+
+
+class InvoiceDueService:
+    """Service quản lý hạn thanh toán hóa đơn"""
+
+    DEFAULT_PAYMENT_TERM_DAYS = 30
+    NOTIFY_BATCH_SIZE = 500
+    UNPAID_STATUSES = ("pending", "issued")
+    REMIND_DAYS = (1, 3, 7)  # Nhắc trước 1, 3, 7 ngày
+
+    @staticmethod
+    def due_date_for(issued_at=None):
+        """Hạn thanh toán = ngày lập + số ngày của kỳ hạn (INVOICE_PAYMENT_TERM_DAYS)"""
+        term_days = current_app.config.get("INVOICE_PAYMENT_TERM_DAYS", InvoiceDueService.DEFAULT_PAYMENT_TERM_DAYS)
+        return (issued_at or datetime.now()) + timedelta(days=term_days)
+
+    # ===== QUÁ HẠN =====
+    @staticmethod
+    def mark_overdue(now=None):
+        """Chuyển các hóa đơn chưa thanh toán đã quá hạn sang 'overdue'. Trả về số hóa đơn"""
+        now = now or datetime.now()
+        result = db.session.execute(
+            update(Invoice)
+            .where(Invoice.status.in_(InvoiceDueService.UNPAID_STATUSES), Invoice.due_date < now)
+            .values(status="overdue")
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def _claim_unnotified(now, limit):
+        """Đánh dấu một lô hóa đơn quá hạn chưa thông báo là 'đã thông báo' và trả về lô đó"""
+        candidates = db.session.query(Invoice.id).filter(
+            Invoice.status == "overdue",
+            Invoice.overdue_notified_at.is_(None)
+        ).order_by(Invoice.id).limit(limit).with_for_update(skip_locked=True).scalar_subquery()
+
+        rows = db.session.execute(
+            update(Invoice)
+            .where(Invoice.id.in_(candidates))
+            .values(overdue_notified_at=now)
+            .returning(Invoice.id, Invoice.user_id, Invoice.total_amount, Invoice.due_date)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return [
+            {"id": row.id, "user_id": row.user_id, "total_amount": row.total_amount, "due_date": row.due_date}
+            for row in rows
+        ]
+
+    @staticmethod
+    def _release_claim(invoice_ids):
+        db.session.execute(
+            update(Invoice)
+            .where(Invoice.id.in_(invoice_ids))
+            .values(overdue_notified_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    @staticmethod
+    def notify_overdue(now=None, batch_size=None):
+        """Gửi thông báo quá hạn (mỗi hóa đơn đúng một lần). Trả về số hóa đơn đã thông báo"""
+        now = now or datetime.now()
+        batch_size = batch_size or InvoiceDueService.NOTIFY_BATCH_SIZE
+        notified = 0
+        while True:
+            invoices = InvoiceDueService._claim_unnotified(now, batch_size)
+            if not invoices:
+                break
+            result = FinanceService._notify_invoice_overdue(invoices)
+            if not result.get("success"):
+                InvoiceDueService._release_claim([invoice["id"] for invoice in invoices])
+                current_app.logger.warning(f"Gửi thông báo quá hạn thất bại, sẽ thử lại ({len(invoices)} hóa đơn)")
+                break
+            notified += len(invoices)
+            if len(invoices) < batch_size:
+                break
+        return notified
+
+    @staticmethod
+    def run_once():
+        overdue = InvoiceDueService.mark_overdue()
+        notified = InvoiceDueService.notify_overdue()
+        if overdue or notified:
+            current_app.logger.info(f"Invoice due job: {overdue} hóa đơn quá hạn, {notified} đã thông báo")
+        return {"marked_overdue": overdue, "notified": notified}
+
+    @staticmethod
+    def start_due_loop(app, interval_seconds=300):
+        """Chạy job hạn thanh toán định kỳ trong thread nền của worker"""
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                with app.app_context():
+                    try:
+                        InvoiceDueService.run_once()
+                    except Exception as e:
+                        app.logger.error(f"Invoice due job error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    # ===== SẮP ĐẾN HẠN =====
+    @staticmethod
+    def get_due_soon(days=None, after_id=0, limit=500, now=None):
+        """
+        Hóa đơn chưa thanh toán có hạn rơi đúng vào ngày thứ N kể từ hôm nay (N thuộc days),
+        phân trang keyset theo id. Mỗi khoảng ngày là một range scan trên (status, due_date).
+        """
+        days = days or InvoiceDueService.REMIND_DAYS
+        today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        windows = [
+            and_(Invoice.due_date >= today + timedelta(days=d), Invoice.due_date < today + timedelta(days=d + 1))
+            for d in days
+        ]
+        invoices = Invoice.query.filter(
+            Invoice.status.in_(InvoiceDueService.UNPAID_STATUSES),
+            or_(*windows),
+            Invoice.id > after_id
+        ).order_by(Invoice.id).limit(limit).all()
+
+        return [{
+            "id": invoice.id,
+            "user_id": invoice.user_id,
+            "amount": invoice.total_amount,
+            "due_date": invoice.due_date.isoformat(),
+            "days_left": (invoice.due_date - today).days,
+            "status": str(invoice.status),
+            "service_name": f"Hóa đơn #{invoice.id}"
+        } for invoice in invoices]
@@ -0,0 +1,186 @@
+"""
+Xuất hóa đơn PDF.
+
+PDF được render ở thread nền (không chiếm gunicorn worker đang phục vụ request) khi hóa
+đơn được tạo hoặc được thanh toán, và lưu trên đĩa theo địa chỉ nội dung: tên file là
+sha256 của dữ liệu hóa đơn + phiên bản template. Cùng một nội dung thì không bao giờ
+render lại; hóa đơn thay đổi (ví dụ sang 'paid') sẽ sinh ra file mới.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from flask import current_app
+from app import db
+from models.finance_model import Invoice
+
+# Thread nền render PDF cho worker hiện tại
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="invoice-pdf")
+_pending = set()
+_pending_lock = Lock()
+_font_name = None
+
+
+class InvoicePdfService:
+    """Service render, lưu trữ và phục vụ hóa đơn PDF"""
+
+    # Tăng khi đổi template để toàn bộ PDF cũ được render lại
+    TEMPLATE_VERSION = "1"
+    FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+    # ===== ĐỊA CHỈ NỘI DUNG =====
+    @staticmethod
+    def _storage_dir():
+        return current_app.config.get("INVOICE_PDF_DIR") or os.path.join(current_app.root_path, "storage", "invoice_pdfs")
+
+    @staticmethod
+    def invoice_payload(invoice):
+        """Dữ liệu dùng để render (và để băm ra địa chỉ nội dung)"""
+        data = invoice.to_dict()
+        data.pop("updated_at", None)  # Không ảnh hưởng nội dung PDF
+        data["items"] = [item.to_dict() for item in invoice.items]
+        return data
+
+    @staticmethod
+    def digest(payload):
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(f"{InvoicePdfService.TEMPLATE_VERSION}:{canonical}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def path_for(storage_dir, digest):
+        return os.path.join(storage_dir, digest[:2], f"{digest}.pdf")
+
+    # ===== RENDER =====
+    @staticmethod
+    def _font():
+        """Font hỗ trợ tiếng Việt nếu có (DejaVuSans), fallback Helvetica"""
+        global _font_name
+        if _font_name is None:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            try:
+                pdfmetrics.registerFont(TTFont("DejaVuSans", InvoicePdfService.FONT_PATH))
+                _font_name = "DejaVuSans"
+            except Exception:
+                _font_name = "Helvetica"
+        return _font_name
+
+    @staticmethod
+    def render_pdf_bytes(payload):
+        """Render PDF từ payload (thuần, không truy cập DB) và trả về bytes"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        font = InvoicePdfService._font()
+        buffer = BytesIO()
+        # invariant=1: không nhúng timestamp => cùng input cho cùng output
+        pdf = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+        width, height = A4
+        margin = 50
+        y = height - margin
+
+        pdf.setTitle(f"Hoa don #{payload['id']}")
+        pdf.setFont(font, 18)
+        pdf.drawString(margin, y, f"HÓA ĐƠN #{payload['id']}")
+        y -= 28
+
+        pdf.setFont(font, 10)
+        for line in (
+            "EV Service Center",
+            f"Booking: #{payload.get('booking_id')}    Khách hàng: #{payload.get('user_id')}",
+            f"Ngày lập: {payload.get('created_at') or ''}    Trạng thái: {payload.get('status')}",
+        ):
+            pdf.drawString(margin, y, line)
+            y -= 16
+        y -= 10
+
+        columns = (margin, margin + 270, margin + 320, margin + 410)
+
+        def draw_header(current_y):
+            pdf.setFont(font, 10)
+            for x, title in zip(columns, ("Mô tả", "SL", "Đơn giá", "Thành tiền")):
+                pdf.drawString(x, current_y, title)
+            pdf.line(margin, current_y - 4, width - margin, current_y - 4)
+            return current_y - 18
+
+        y = draw_header(y)
+        for item in payload.get("items", []):
+            if y < margin + 40:
+                pdf.showPage()
+                y = draw_header(height - margin)
+            pdf.setFont(font, 9)
+            pdf.drawString(columns[0], y, str(item.get("description", ""))[:60])
+            pdf.drawRightString(columns[1] + 20, y, str(item.get("quantity", 0)))
+            pdf.drawRightString(columns[2] + 75, y, f"{item.get('unit_price', 0):,.0f}")
+            pdf.drawRightString(width - margin, y, f"{item.get('sub_total', 0):,.0f}")
+            y -= 14
+
+        pdf.line(margin, y + 4, width - margin, y + 4)
+        pdf.setFont(font, 12)
+        pdf.drawRightString(width - margin, y - 14, f"Tổng cộng: {payload.get('total_amount', 0):,.0f} VNĐ")
+
+        pdf.showPage()
+        pdf.save()
+        return buffer.getvalue()
+
+    @staticmethod
+    def _write_atomic(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    # ===== HÀNG ĐỢI =====
+    @staticmethod
+    def enqueue(invoice_id):
+        """Đưa hóa đơn vào hàng đợi render (bỏ qua nếu đang chờ render)"""
+        with _pending_lock:
+            if invoice_id in _pending:
+                return False
+            _pending.add(invoice_id)
+        app = current_app._get_current_object()
+        _executor.submit(InvoicePdfService._render_job, app, invoice_id)
+        return True
+
+    @staticmethod
+    def _render_job(app, invoice_id):
+        with app.app_context():
+            try:
+                InvoicePdfService.render_invoice(invoice_id)
+            except Exception as e:
+                app.logger.error(f"Render PDF cho Invoice {invoice_id} lỗi: {str(e)}")
+            finally:
+                with _pending_lock:
+                    _pending.discard(invoice_id)
+                db.session.remove()
+
+    @staticmethod
+    def render_invoice(invoice_id):
+        """Render PDF cho hóa đơn nếu nội dung hiện tại chưa có trên đĩa. Trả về (path, digest)"""
+        invoice = Invoice.query.get(invoice_id)
+        if not invoice:
+            return None, None
+        payload = InvoicePdfService.invoice_payload(invoice)
+        digest = InvoicePdfService.digest(payload)
+        path = InvoicePdfService.path_for(InvoicePdfService._storage_dir(), digest)
+        if not os.path.exists(path):
+            InvoicePdfService._write_atomic(path, InvoicePdfService.render_pdf_bytes(payload))
+        return path, digest
+
+    # ===== PHỤC VỤ =====
+    @staticmethod
+    def get_pdf(invoice):
+        """
+        Trả về (path, digest) nếu PDF cho nội dung hiện tại đã sẵn sàng,
+        ngược lại đưa vào hàng đợi và trả về (None, digest).
+        """
+        payload = InvoicePdfService.invoice_payload(invoice)
+        digest = InvoicePdfService.digest(payload)
+        path = InvoicePdfService.path_for(InvoicePdfService._storage_dir(), digest)
+        if os.path.exists(path):
+            return path, digest
+        InvoicePdfService.enqueue(invoice.id)
+        return None, digest
@@ -0,0 +1,118 @@
+import requests
+import os
+from typing import Optional, Dict, Any
+from flask import current_app
+
+class NotificationHelper:
+    """Helper class để gửi notifications từ các services"""
+    
+    NOTIFICATION_SERVICE_URL = "http://notification-service:8005"
+    BULK_MAX_ITEMS = 10000
+    
+    @staticmethod
+    def send_notification(
+        user_id: int,
+        notification_type: str,
+        title: str,
+        message: str,
+        channel: str = "in_app",
+        priority: str = "medium",
+        related_entity_type: Optional[str] = None,
+        related_entity_id: Optional[int] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Send notification to user
+        
+        Args:
+            user_id: User ID to send notification to
+            notification_type: booking_status, inventory_alert, payment, reminder, system
+            title: Notification title
+            message: Notification message
+            channel: in_app, email, sms, push
+            priority: low, medium, high, urgent
+            related_entity_type: booking, invoice, inventory, etc.
+            related_entity_id: ID of related entity
+            metadata: Additional data as dict
+        """
+        try:
+            url = f"{NotificationHelper.NOTIFICATION_SERVICE_URL}/internal/notifications/create"
+            headers = {
+                "X-Internal-Token": os.getenv("INTERNAL_SERVICE_TOKEN"),
+                "Content-Type": "application/json"
+            }
+            data = {
+                "user_id": user_id,
+                "notification_type": notification_type,
+                "title": title,
+                "message": message,
+                "channel": channel,
+                "priority": priority,
+                "related_entity_type": related_entity_type,
+                "related_entity_id": related_entity_id,
+                "metadata": metadata
+            }
+            
+            response = requests.post(url, json=data, headers=headers, timeout=5)
+            
+            if response.status_code == 201:
+                current_app.logger.info(f"Notification sent to user {user_id}: {title}")
+                return True
+            else:
+                current_app.logger.warning(f"Failed to send notification: {response.text}")
+                return False
+                
+        except Exception as e:
+            current_app.logger.error(f"Error sending notification: {str(e)}")
+            return False
+    
+    @staticmethod
+    def send_to_multiple_users(
+        user_ids: list,
+        notification_type: str,
+        title: str,
+        message: str,
+        **kwargs
+    ) -> Dict[str, int]:
+        """Send notification to multiple users (một request bulk thay vì một request mỗi người)"""
+        result = NotificationHelper.send_bulk([
+            dict(kwargs, user_id=user_id, notification_type=notification_type, title=title, message=message)
+            for user_id in user_ids
+        ])
+        return {"success": result["created"], "failed": len(user_ids) - result["created"]}
+
+    @staticmethod
+    def send_bulk(notifications: list) -> Dict[str, Any]:
+        """
+        Send many notifications in one request (POST /internal/notifications/bulk)
+
+        Args:
+            notifications: list of dicts with the same fields as send_notification
+
+        Returns:
+            {"success": bool, "created": int, "ids": [notification id, same order as input]}
+        """
+        if not notifications:
+            return {"success": True, "created": 0, "ids": []}
+        url = f"{NotificationHelper.NOTIFICATION_SERVICE_URL}/internal/notifications/bulk"
+        headers = {
+            "X-Internal-Token": os.getenv("INTERNAL_SERVICE_TOKEN"),
+            "Content-Type": "application/json"
+        }
+        ids = []
+        try:
+            # Notification Service nhận tối đa BULK_MAX_ITEMS phần tử mỗi request
+            for begin in range(0, len(notifications), NotificationHelper.BULK_MAX_ITEMS):
+                chunk = notifications[begin:begin + NotificationHelper.BULK_MAX_ITEMS]
+                response = requests.post(url, json={"notifications": chunk}, headers=headers, timeout=30)
+                if response.status_code != 201:
+                    current_app.logger.warning(f"Failed to send bulk notifications: {response.text}")
+                    return {"success": False, "created": len(ids), "ids": ids}
+                ids.extend(response.json().get("ids", []))
+
+            current_app.logger.info(f"Bulk notifications sent: {len(ids)}")
+            return {"success": True, "created": len(ids), "ids": ids}
+
+        except Exception as e:
+            current_app.logger.error(f"Error sending bulk notifications: {str(e)}")
+            return {"success": False, "created": len(ids), "ids": ids}
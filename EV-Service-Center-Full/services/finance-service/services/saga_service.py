@@ -0,0 +1,408 @@
+"""
+Saga lập hóa đơn từ Booking.
+
+Mỗi bước chạy trong transaction cục bộ ngắn của riêng nó và được ghi vào nhật ký
+invoice_saga_steps, nên không còn giữ một DB transaction mở xuyên suốt nhiều lời gọi
+remote. Nếu một bước trước điểm pivot (ghi hóa đơn) thất bại, các bước đã hoàn tất
+được bù trừ theo thứ tự ngược lại (hoàn kho, xóa hóa đơn). Các bước sau pivot chỉ
+được thử lại, saga sẽ được job resume nhận lại sau khi lease hết hạn.
+Bước trừ kho bị gián đoạn (hoặc lỗi kết nối) được đối chiếu với sổ cái kho theo booking
+trước khi chạy lại hay bù trừ; bù trừ lỗi được ghi 'compensation_failed' và thử lại ở lần resume sau.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from models.finance_model import Invoice, InvoiceItem, InvoiceSaga, InvoiceSagaStep
+from services.finance_service import FinanceService
+from services.http_client import InternalHttpClient
+from services.invoice_due_service import InvoiceDueService
+from services.invoice_pdf_service import InvoicePdfService
+
+# Executor dùng chung cho các saga chạy bất đồng bộ trong worker hiện tại
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="invoice-saga")
+
+
+class InvoiceSagaService:
+    """Điều phối Saga lập hóa đơn"""
+
+    SERVICE_PRICE = 500000.0  # Giá công thợ cố định
+    LEASE_SECONDS = 120
+    MAX_FORWARD_ATTEMPTS = 3
+    PIVOT_STEP = "write_invoice"
+
+    # ===== CÁC BƯỚC =====
+    @staticmethod
+    def _step_fetch_context(saga, ctx):
+        # Booking và Task Parts không phụ thuộc nhau => gọi song song
+        (booking_data, error), (task_parts_data, parts_error) = InternalHttpClient.run_concurrently(
+            (FinanceService._get_booking_details, saga.booking_id),
+            (FinanceService._get_task_parts_by_booking, saga.booking_id)
+        )
+        if error:
+            return f"Lỗi khi lấy Booking: {error}"
+        ctx["booking"] = {
+            "user_id": booking_data.get("user_id"),
+            "service_type": booking_data.get("service_type")
+        }
+
+        if parts_error:
+            # Nếu không có task hoặc không có parts, vẫn tạo hóa đơn nhưng chỉ có service
+            task_parts_data = []
+        ctx["part_lines"] = [
+            {"item_id": part.get("item_id"), "quantity": part.get("quantity")}
+            for part in task_parts_data
+            if part.get("item_id") and isinstance(part.get("quantity"), int) and part.get("quantity") > 0
+        ]
+        return None
+
+    @staticmethod
+    def _step_reserve_stock(saga, ctx):
+        if not ctx.get("part_lines"):
+            ctx["deducted_items"] = []
+            return None
+        deduct_response, deduct_error = FinanceService._deduct_inventory_batch(ctx["part_lines"], saga.booking_id)
+        if deduct_error:
+            return f"Lỗi khi trừ tồn kho: {deduct_error}"
+        ctx["deducted_items"] = deduct_response.get("items", [])
+        return None
+
+    @staticmethod
+    def _compensate_reserve_stock(saga, ctx):
+        # Hoàn đúng phần sổ cái kho còn ghi nhận cho booking (không dựa vào ctx), nên chạy lại
+        # sau một lần hoàn kho lỗi/timeout cũng không cộng kho hai lần
+        deducted, error = FinanceService._get_booking_deductions(saga.booking_id)
+        if error:
+            return f"Không đối chiếu được sổ cái kho: {error}"
+        lines = [{"item_id": item_id, "quantity": quantity} for item_id, quantity in deducted.items()]
+        if not lines:
+            return None
+        _, error = FinanceService._restock_inventory_batch(lines, saga.booking_id)
+        return error
+
+    @staticmethod
+    def _recover_reserve_stock(saga, ctx):
+        """
+        Không biết lời gọi trừ kho đã được áp dụng hay chưa: đọc sổ cái kho theo booking.
+        Trả về (đã trừ hay chưa, error). Nếu đã trừ, dựng lại ctx["deducted_items"].
+        """
+        deducted, error = FinanceService._get_booking_deductions(saga.booking_id)
+        if error:
+            return False, f"Không đối chiếu được sổ cái kho: {error}"
+        if not deducted:
+            return False, None
+        items, error = FinanceService._get_inventory_items(list(deducted))
+        if error:
+            return False, f"Không lấy được thông tin vật tư: {error}"
+
+        deducted_items = []
+        for item_id, quantity in deducted.items():
+            entry = {"item_id": item_id, "quantity_deducted": quantity}
+            if item_id in items:
+                entry.update(name=items[item_id].get("name"), price=items[item_id].get("price"))
+            deducted_items.append(entry)
+        ctx["deducted_items"] = deducted_items
+        return True, None
+
+    @staticmethod
+    def _step_write_invoice(saga, ctx):
+        existing = Invoice.query.filter_by(booking_id=saga.booking_id).first()
+        if existing:
+            if ctx.get("invoice_id") == existing.id:
+                return None  # Đã ghi ở lần chạy trước (resume)
+            return "Hóa đơn cho Booking này đã tồn tại."
+
+        booking = ctx.get("booking", {})
+        try:
+            new_invoice = Invoice(
+                booking_id=saga.booking_id,
+                user_id=booking.get("user_id"),
+                total_amount=0.0,
+                due_date=InvoiceDueService.due_date_for()
+            )
+            db.session.add(new_invoice)
+            db.session.flush()
+
+            service_price = InvoiceSagaService.SERVICE_PRICE
+            items = [InvoiceItem(
+                invoice_id=new_invoice.id,
+                item_type="service",
+                description=f"Dịch vụ: {booking.get('service_type') or 'Kiểm tra tổng quát'}",
+                quantity=1,
+                unit_price=service_price,
+                sub_total=service_price
+            )]
+            for inventory_item in ctx.get("deducted_items", []):
+                quantity = inventory_item.get("quantity_deducted", 0)
+                unit_price = inventory_item.get("price", 0.0)
+                items.append(InvoiceItem(
+                    invoice_id=new_invoice.id,
+                    item_type="part",
+                    description=inventory_item.get("name", "Phụ tùng không tên"),
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    sub_total=unit_price * quantity
+                ))
+            db.session.add_all(items)
+
+            new_invoice.total_amount = sum(item.sub_total for item in items)
+            ctx["invoice_id"] = new_invoice.id
+            saga.context_json = json.dumps(ctx)
+            db.session.commit()
+
+            # Render PDF ở nền ngay khi hóa đơn được tạo
+            InvoicePdfService.enqueue(new_invoice.id)
+            return None
+        except Exception as e:
+            db.session.rollback()
+            ctx.pop("invoice_id", None)
+            return f"Lỗi khi tạo hóa đơn: {str(e)}"
+
+    @staticmethod
+    def _compensate_write_invoice(saga, ctx):
+        invoice_id = ctx.get("invoice_id")
+        if not invoice_id:
+            return None
+        invoice = Invoice.query.get(invoice_id)
+        if invoice:
+            db.session.delete(invoice)
+            db.session.commit()
+        return None
+
+    @staticmethod
+    def _step_complete_booking(saga, ctx):
+        booking_url = current_app.config.get("BOOKING_SERVICE_URL")
+        _, error = FinanceService._call_internal_api(
+            booking_url, f"/internal/bookings/items/{saga.booking_id}/status", "PUT", {"status": "completed"}
+        )
+        return error
+
+    # (tên bước, hành động, bù trừ)
+    STEPS = [
+        ("fetch_context", "_step_fetch_context", None),
+        ("reserve_stock", "_step_reserve_stock", "_compensate_reserve_stock"),
+        ("write_invoice", "_step_write_invoice", "_compensate_write_invoice"),
+        ("complete_booking", "_step_complete_booking", None),
+    ]
+    # Các bước gọi remote có side-effect: nếu bị crash giữa chừng thì không biết đã áp dụng hay chưa,
+    # phải đối chiếu với service đích (tên bước -> hàm đối chiếu) trước khi chạy lại hoặc bù trừ
+    UNSAFE_TO_REPLAY = {"reserve_stock": "_recover_reserve_stock"}
+
+    # ===== NHẬT KÝ / LEASE =====
+    @staticmethod
+    def _log_step(saga, step_name, status, attempt=1, error=None):
+        db.session.add(InvoiceSagaStep(
+            saga_id=saga.id, step_name=step_name, status=status, attempt=attempt, error=error
+        ))
+        saga.current_step = step_name
+        db.session.commit()
+
+    @staticmethod
+    def _last_step_states(saga_id):
+        """Trạng thái mới nhất của từng bước (đọc từ nhật ký append-only)"""
+        states = {}
+        for step in InvoiceSagaStep.query.filter_by(saga_id=saga_id).order_by(InvoiceSagaStep.id.asc()):
+            states[step.step_name] = step
+        return states
+
+    @staticmethod
+    def _claim(saga_id):
+        """Nhận quyền chạy saga (UPDATE có điều kiện nên chỉ một worker nhận được)"""
+        now = datetime.utcnow()
+        claimed = InvoiceSaga.query.filter(
+            InvoiceSaga.id == saga_id,
+            InvoiceSaga.status.in_(("running", "compensating")),
+            or_(InvoiceSaga.lease_expires_at.is_(None), InvoiceSaga.lease_expires_at < now)
+        ).update(
+            {"lease_expires_at": now + timedelta(seconds=InvoiceSagaService.LEASE_SECONDS)},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+
+    @staticmethod
+    def _finish(saga, status, error=None):
+        saga.status = status
+        saga.error = error
+        saga.lease_expires_at = None
+        db.session.commit()
+
+    # ===== ĐIỀU PHỐI =====
+    @staticmethod
+    def start(booking_id, run_async=False):
+        """Tạo saga mới cho booking. Trả về (saga, error)"""
+        if Invoice.query.filter_by(booking_id=booking_id).first():
+            return None, "Hóa đơn cho Booking này đã tồn tại."
+        if InvoiceSaga.query.filter(
+            InvoiceSaga.booking_id == booking_id,
+            InvoiceSaga.status.in_(("running", "compensating"))
+        ).first():
+            return None, "Hóa đơn cho Booking này đang được tạo (đã tồn tại saga đang chạy)."
+
+        saga = InvoiceSaga(
+            booking_id=booking_id,
+            status="running",
+            context_json=json.dumps({}),
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=InvoiceSagaService.LEASE_SECONDS)
+        )
+        db.session.add(saga)
+        db.session.commit()
+
+        if run_async:
+            app = current_app._get_current_object()
+            _executor.submit(InvoiceSagaService._execute_in_context, app, saga.id)
+            return saga, None
+
+        started = time.perf_counter()
+        InvoiceSagaService.execute(saga.id)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        budget_ms = current_app.config.get("INVOICE_LATENCY_BUDGET_MS", 3000)
+        if elapsed_ms > budget_ms:
+            current_app.logger.warning(
+                f"Saga {saga.id} (Booking {booking_id}) mất {elapsed_ms:.0f} ms, vượt ngân sách {budget_ms} ms"
+            )
+        else:
+            current_app.logger.info(f"Saga {saga.id} (Booking {booking_id}) hoàn tất trong {elapsed_ms:.0f} ms")
+        db.session.refresh(saga)
+        return saga, None
+
+    @staticmethod
+    def _execute_in_context(app, saga_id):
+        with app.app_context():
+            try:
+                InvoiceSagaService.execute(saga_id)
+            except Exception as e:
+                current_app.logger.error(f"Saga {saga_id} crashed: {str(e)}")
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def execute(saga_id):
+        """Chạy (hoặc chạy tiếp) các bước còn lại của saga"""
+        saga = InvoiceSaga.query.get(saga_id)
+        if not saga:
+            return
+        ctx = json.loads(saga.context_json or "{}")
+
+        if saga.status == "compensating":
+            return InvoiceSagaService._compensate(saga, ctx, saga.error)
+
+        states = InvoiceSagaService._last_step_states(saga.id)
+        step_names = [name for name, _, _ in InvoiceSagaService.STEPS]
+        pivot_index = step_names.index(InvoiceSagaService.PIVOT_STEP)
+
+        for index, (name, action_name, _) in enumerate(InvoiceSagaService.STEPS):
+            last = states.get(name)
+            if last and last.status == "completed":
+                continue
+
+            if last and last.status == "started" and name in InvoiceSagaService.UNSAFE_TO_REPLAY:
+                # Crash giữa lúc gọi remote: đối chiếu để biết bước đã được áp dụng hay chưa
+                applied, error = getattr(InvoiceSagaService, InvoiceSagaService.UNSAFE_TO_REPLAY[name])(saga, ctx)
+                if error:
+                    # Chưa đối chiếu được: nhả lease để job resume thử lại sau
+                    saga.error = error
+                    saga.lease_expires_at = None
+                    db.session.commit()
+                    return
+                if applied:
+                    saga.context_json = json.dumps(ctx)
+                    InvoiceSagaService._log_step(saga, name, "completed", last.attempt)
+                    continue
+                # Chưa được áp dụng => chạy lại bước như bình thường
+
+            attempt = (last.attempt + 1) if last else 1
+            InvoiceSagaService._log_step(saga, name, "started", attempt)
+            error = getattr(InvoiceSagaService, action_name)(saga, ctx)
+
+            if error:
+                InvoiceSagaService._log_step(saga, name, "failed", attempt, error)
+                if index <= pivot_index:
+                    saga.context_json = json.dumps(ctx)
+                    return InvoiceSagaService._compensate(saga, ctx, error)
+                if attempt >= InvoiceSagaService.MAX_FORWARD_ATTEMPTS:
+                    return InvoiceSagaService._finish(saga, "failed", error)
+                # Sau pivot: nhả lease để job resume thử lại sau
+                saga.error = error
+                saga.context_json = json.dumps(ctx)
+                saga.lease_expires_at = None
+                db.session.commit()
+                return
+
+            saga.context_json = json.dumps(ctx)
+            InvoiceSagaService._log_step(saga, name, "completed", attempt)
+
+        InvoiceSagaService._finish(saga, "completed")
+
+    @staticmethod
+    def _compensate(saga, ctx, error):
+        """Bù trừ các bước đã hoàn tất theo thứ tự ngược lại"""
+        saga.status = "compensating"
+        saga.error = error
+        db.session.commit()
+
+        states = InvoiceSagaService._last_step_states(saga.id)
+        for name, _, compensation_name in reversed(InvoiceSagaService.STEPS):
+            last = states.get(name)
+            if not compensation_name or not last:
+                continue
+            # Bước không an toàn báo lỗi (ví dụ timeout) vẫn có thể đã được áp dụng ở service đích,
+            # nên cũng được bù trừ (hàm bù trừ của nó tự đối chiếu, không có gì để hoàn thì bỏ qua)
+            unsafe_failed = last.status == "failed" and name in InvoiceSagaService.UNSAFE_TO_REPLAY
+            if last.status not in ("completed", "compensation_failed") and not unsafe_failed:
+                continue
+            comp_error = getattr(InvoiceSagaService, compensation_name)(saga, ctx)
+            if comp_error:
+                # Giữ trạng thái compensating để job resume thử bù trừ lại bước này
+                InvoiceSagaService._log_step(
+                    saga, name, "compensation_failed", last.attempt, f"Bù trừ lỗi: {comp_error}"
+                )
+                saga.lease_expires_at = None
+                db.session.commit()
+                return
+            InvoiceSagaService._log_step(saga, name, "compensated", last.attempt)
+
+        InvoiceSagaService._finish(saga, "compensated", error)
+
+    @staticmethod
+    def resume_stale_sagas(limit=20):
+        """Nhận lại các saga bị bỏ dở (worker crash hoặc bước sau pivot cần thử lại)"""
+        now = datetime.utcnow()
+        saga_ids = [row.id for row in db.session.query(InvoiceSaga.id).filter(
+            InvoiceSaga.status.in_(("running", "compensating")),
+            or_(InvoiceSaga.lease_expires_at.is_(None), InvoiceSaga.lease_expires_at < now)
+        ).order_by(InvoiceSaga.id.asc()).limit(limit)]
+
+        resumed = 0
+        for saga_id in saga_ids:
+            if InvoiceSagaService._claim(saga_id):
+                InvoiceSagaService.execute(saga_id)
+                resumed += 1
+        return resumed
+
+    @staticmethod
+    def start_resume_loop(app, interval_seconds=60):
+        """Chạy job resume định kỳ trong thread nền của worker"""
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                with app.app_context():
+                    try:
+                        InvoiceSagaService.resume_stale_sagas()
+                    except Exception as e:
+                        app.logger.error(f"Saga resume error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def get_saga(saga_id):
+        return InvoiceSaga.query.get(saga_id)
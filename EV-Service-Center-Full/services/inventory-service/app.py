@@ -29,6 +29,24 @@ def create_app():
     if internal_token:
         app.config["INTERNAL_SERVICE_TOKEN"] = internal_token.strip()
 
+    # Thời hạn giữ chỗ vật tư cho task (giây) và chu kỳ job dọn giữ chỗ hết hạn
+    app.config["RESERVATION_TTL_SECONDS"] = int(os.getenv("RESERVATION_TTL_SECONDS", str(24 * 3600)))
+    app.config["RESERVATION_SWEEP_INTERVAL"] = int(os.getenv("RESERVATION_SWEEP_INTERVAL", "60"))
+    # Chu kỳ tối đa dựng lại chỉ mục gợi ý phụ tùng trong bộ nhớ (giây)
+    app.config["COMPAT_INDEX_TTL_SECONDS"] = int(os.getenv("COMPAT_INDEX_TTL_SECONDS", "30"))
+    # Redis dùng chung cho cache vật tư (không có thì chỉ dùng cache trong bộ nhớ)
+    app.config["REDIS_URL"] = os.getenv("REDIS_URL", "redis://redis:6379")
+    # Booking Service cung cấp tọa độ chi nhánh cho gợi ý điều chuyển vật tư
+    app.config["BOOKING_SERVICE_URL"] = os.getenv("BOOKING_SERVICE_URL", "http://booking-service:8001")
+    # Cửa sổ gom cảnh báo tồn kho thấp / hết hàng thành digest (giây)
+    app.config["STOCK_ALERT_WINDOW_SECONDS"] = int(os.getenv("STOCK_ALERT_WINDOW_SECONDS", "60"))
+    # Dự báo nhu cầu / điểm đặt hàng lại (chạy mỗi đêm sau FORECAST_RUN_HOUR giờ)
+    app.config["FORECAST_RUN_HOUR"] = int(os.getenv("FORECAST_RUN_HOUR", "2"))
+    app.config["FORECAST_HISTORY_DAYS"] = int(os.getenv("FORECAST_HISTORY_DAYS", "182"))
+    app.config["FORECAST_LEAD_TIME_DAYS"] = int(os.getenv("FORECAST_LEAD_TIME_DAYS", "7"))
+    app.config["FORECAST_REVIEW_DAYS"] = int(os.getenv("FORECAST_REVIEW_DAYS", "7"))
+    app.config["FORECAST_SERVICE_LEVEL_Z"] = float(os.getenv("FORECAST_SERVICE_LEVEL_Z", "1.65"))
+
     # ===== KHỞI TẠO EXTENSIONS =====
     db.init_app(app)
     # Cấu hình migration riêng cho Inventory Service
@@ -37,19 +55,37 @@ def create_app():
     # ===== IMPORT MODELS & TẠO TABLES =====
     with app.app_context():
         # Đảm bảo bạn có file models/inventory_model.py
-        from models.inventory_model import Inventory 
+        from models.inventory_model import Inventory, InventoryMovement, StockReservation, InventoryVehicleModel, StockAlert, ReorderSuggestion, PartStock
         
         # Tạo tables (nếu chưa có)
         db.create_all()
 
+        # Chuẩn hóa compatible_models cũ sang bảng (inventory_id, vehicle_model) nếu chưa có
+        from services.inventory_service import InventoryService
+        InventoryService.backfill_vehicle_models()
+
+        # Dựng view tồn kho liên chi nhánh nếu chưa có
+        from services.stock_view_service import StockViewService
+        StockViewService.backfill()
+
     # ===== ĐĂNG KÝ BLUEPRINTS (Controllers) =====
     # Đảm bảo bạn đã viết file controllers/inventory_controller.py
     from controllers.inventory_controller import inventory_bp
-    from controllers.internal_controller import internal_bp
+    from controllers.internal_controller import internal_bp, stock_bp
 
     # Đăng ký blueprint (route sẽ là /api/inventory/...)
     app.register_blueprint(inventory_bp)
     app.register_blueprint(internal_bp) 
+    app.register_blueprint(stock_bp)
+
+    # ===== JOB NỀN: DỌN GIỮ CHỖ HẾT HẠN, DIGEST CẢNH BÁO TỒN KHO, DỰ BÁO ĐÊM (chỉ khi chạy Gunicorn, không chạy cho lệnh CLI) =====
+    if os.environ.get('GUNICORN_ENV') == 'true':
+        from services.reservation_service import ReservationService
+        from services.stock_alert_service import StockAlertService
+        from services.forecast_service import ForecastService
+        ReservationService.start_expiry_loop(app, app.config["RESERVATION_SWEEP_INTERVAL"])
+        StockAlertService.start_alert_loop(app, app.config["STOCK_ALERT_WINDOW_SECONDS"])
+        ForecastService.start_forecast_loop(app, app.config["FORECAST_RUN_HOUR"])
 
     # ===== HEALTH CHECK =====
     @app.route("/health", methods=["GET"])
@@ -0,0 +1,97 @@
+"""
+Benchmark nhập/xuất danh mục vật tư qua API (POST /api/inventory/import, GET /api/inventory/export).
+
+Chạy:  python bench_catalog_import.py [số_SKU] [csv|ndjson]
+Dùng DATABASE_URL nếu có (nên trỏ vào Postgres thật), nếu không dùng SQLite tạm.
+Đo bốn đường đi, mục tiêu >= 50.000 SKU/phút cho nhập:
+- nhập mới: toàn bộ SKU chưa tồn tại (INSERT)
+- nhập lại: cùng file với số lượng/giá đổi (ON CONFLICT DO UPDATE + sổ cái "set")
+- nhập multipart: như nhập lại nhưng gửi dạng upload field "file" (Werkzeug lưu vào
+  SpooledTemporaryFile, file > 500 KB được ghi ra đĩa)
+- xuất: stream toàn bộ danh mục
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TARGET_PER_MINUTE = 50000
+MODELS = ("VF3", "VF5", "VF6", "VF7", "VF8", "VF9", "VFE34")
+CATEGORIES = ("brake", "tire", "battery", "filter", "suspension", "lighting")
+
+
+def make_file(count, fmt, center_id, revision):
+    records = []
+    for i in range(count):
+        records.append({
+            "part_number": f"BENCH-{center_id}-{i:06d}",
+            "name": f"Phụ tùng benchmark {i}",
+            "quantity": (i * 7 + revision) % 200,
+            "min_quantity": 10,
+            "price": 100000 + (i % 50) * 1000 + revision,
+            "center_id": center_id,
+            "compatible_models": ", ".join(MODELS[(i + k) % len(MODELS)] for k in range(2)),
+            "category": CATEGORIES[i % len(CATEGORIES)]
+        })
+    if fmt == "ndjson":
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode()
+    header = ",".join(records[0])
+    lines = [",".join(f'"{v}"' if isinstance(v, str) else str(v) for v in r.values()) for r in records]
+    return (header + "\n" + "\n".join(lines) + "\n").encode()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    fmt = sys.argv[2] if len(sys.argv) > 2 else "csv"
+    tmp_db = None
+    if not os.getenv("DATABASE_URL"):
+        tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_db}"
+
+    from app import create_app  # noqa: E402
+    app = create_app()
+    client = app.test_client()
+    center_id = 9000 + int(time.time()) % 1000
+
+    try:
+        results = []
+        for label, revision, multipart in (("Nhập mới", 0, False), ("Nhập lại", 1, False), ("Multipart", 2, True)):
+            body = make_file(count, fmt, center_id, revision)
+            start = time.perf_counter()
+            if multipart:
+                resp = client.post(
+                    f"/api/inventory/import?format={fmt}",
+                    data={"file": (io.BytesIO(body), f"catalog.{fmt}")},
+                    content_type="multipart/form-data"
+                )
+            else:
+                resp = client.post(f"/api/inventory/import?format={fmt}", data=io.BytesIO(body))
+            elapsed = time.perf_counter() - start
+            report = resp.get_json()
+            assert resp.status_code == 200 and not report["failed"], report
+            results.append((label, elapsed, report))
+
+        start = time.perf_counter()
+        resp = client.get(f"/api/inventory/export?format={fmt}&center_id={center_id}")
+        exported = sum(chunk.count(b"\n") for chunk in resp.response) - (1 if fmt == "csv" else 0)
+        export_elapsed = time.perf_counter() - start
+        assert exported == count, exported
+    finally:
+        if tmp_db:
+            os.unlink(tmp_db)
+
+    print(f"SKU: {count}, định dạng: {fmt}, DB: {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+    for label, elapsed, report in results:
+        rate = count / elapsed * 60
+        verdict = "ĐẠT" if rate >= TARGET_PER_MINUTE else "CHƯA ĐẠT"
+        print(f"{label}: {elapsed:6.2f}s  {rate:10.0f} SKU/phút  ({verdict})  "
+              f"inserted={report['inserted']} updated={report['updated']}")
+    print(f"Xuất:     {export_elapsed:6.2f}s  {count / export_elapsed * 60:10.0f} SKU/phút")
+
+
+if __name__ == "__main__":
+    main()
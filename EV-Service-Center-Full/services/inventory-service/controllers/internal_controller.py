@@ -1,9 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
 from services.inventory_service import InventoryService
+from services.reservation_service import ReservationService
+from services.item_cache import ItemCache
+from services.stock_alert_service import StockAlertService
+from services.forecast_service import ForecastService
 
 internal_bp = Blueprint("internal_inventory", __name__, url_prefix="/internal/parts")
 
+stock_bp = Blueprint("internal_stock", __name__, url_prefix="/internal/inventory")
+
 @internal_bp.before_request
+@stock_bp.before_request
 def verify_internal_token():
     """Xác thực Internal Service Token"""
     token = request.headers.get("X-Internal-Token")
@@ -17,3 +24,174 @@ def get_all_parts():
     """Lấy tất cả parts (cho report-service)"""
     parts = InventoryService.get_all_parts()
     return jsonify([p.to_dict() for p in parts]), 200
+
+
+@stock_bp.route("/deduct", methods=["POST"])
+def deduct_stock_batch():
+    """
+    Trừ kho nguyên tử cho nhiều vật tư (cho finance-service khi lập hóa đơn)
+
+    Body:
+        {"items": [{"item_id": 1, "quantity": 2}, ...], "reference_type": "booking", "reference_id": 12}
+    """
+    data = request.get_json(silent=True) or {}
+    items, error, failed_items = InventoryService.deduct_items_batch(
+        data.get("items"), data.get("reference_type"), data.get("reference_id")
+    )
+    if error:
+        status_code = 409 if failed_items else 400
+        return jsonify({"error": error, "failed_items": failed_items}), status_code
+
+    return jsonify({"items": items}), 200
+
+
+@stock_bp.route("/restock", methods=["POST"])
+def restock_batch():
+    """
+    Hoàn kho cho nhiều vật tư (bù trừ khi saga lập hóa đơn thất bại)
+
+    Body:
+        {"items": [{"item_id": 1, "quantity": 2}, ...], "reference_type": "booking", "reference_id": 12}
+    """
+    data = request.get_json(silent=True) or {}
+    items, error = InventoryService.restock_items_batch(
+        data.get("items"), data.get("reference_type"), data.get("reference_id")
+    )
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify({"items": items}), 200
+
+
+@stock_bp.route("/adjust", methods=["POST"])
+def adjust_stock_batch():
+    """
+    Điều chỉnh tồn kho theo delta có dấu (nhập hàng, kiểm kê, hàng hỏng...)
+
+    Body:
+        {"items": [{"item_id": 1, "delta": 5}, {"item_id": 2, "delta": -1}],
+         "reference_type": "stocktake", "reference_id": 3, "note": "..."}
+    """
+    data = request.get_json(silent=True) or {}
+    items, error, failed_items = InventoryService.adjust_items_batch(
+        data.get("items"), data.get("reference_type"), data.get("reference_id"), data.get("note")
+    )
+    if error:
+        status_code = 409 if failed_items else 400
+        return jsonify({"error": error, "failed_items": failed_items}), status_code
+
+    return jsonify({"items": items}), 200
+
+
+@stock_bp.route("/movements", methods=["GET"])
+def get_stock_movements():
+    """Lịch sử biến động tồn kho (?item_id=&reference_type=&reference_id=&after_id=&limit=)"""
+    limit = min(request.args.get("limit", 500, type=int), 5000)
+    movements = InventoryService.get_movements(
+        item_id=request.args.get("item_id", type=int),
+        reference_type=request.args.get("reference_type"),
+        reference_id=request.args.get("reference_id", type=int),
+        after_id=request.args.get("after_id", 0, type=int),
+        limit=limit
+    )
+    return jsonify({
+        "movements": [m.to_dict() for m in movements],
+        "next_after_id": movements[-1].id if len(movements) == limit else None
+    }), 200
+
+
+@stock_bp.route("/reservations", methods=["POST"])
+def create_reservations():
+    """
+    Giữ chỗ vật tư có thời hạn cho một task (cho maintenance-service)
+
+    Body:
+        {"items": [{"item_id": 1, "quantity": 2}], "reference_type": "task", "reference_id": 7,
+         "booking_id": 12, "ttl_seconds": 86400}
+    """
+    data = request.get_json(silent=True) or {}
+    reservations, error, failed_items = ReservationService.reserve(
+        data.get("items"), data.get("reference_type"), data.get("reference_id"),
+        data.get("booking_id"), data.get("ttl_seconds")
+    )
+    if error:
+        status_code = 409 if failed_items else 400
+        return jsonify({"error": error, "failed_items": failed_items}), status_code
+
+    return jsonify({"reservations": [r.to_dict() for r in reservations]}), 201
+
+
+@stock_bp.route("/reservations/release", methods=["POST"])
+def release_reservations():
+    """
+    Nhả giữ chỗ khi task bị hủy hoặc bỏ phụ tùng
+
+    Body:
+        {"reference_type": "task", "reference_id": 7, "item_id": 1}  (item_id tùy chọn)
+    """
+    data = request.get_json(silent=True) or {}
+    if not data.get("reference_type") or not data.get("reference_id"):
+        return jsonify({"error": "Thiếu reference_type hoặc reference_id"}), 400
+
+    released, error = ReservationService.release(data["reference_type"], data["reference_id"], data.get("item_id"))
+    if error:
+        return jsonify({"error": error}), 500
+
+    return jsonify({"released": [{"item_id": k, "quantity": v} for k, v in released.items()]}), 200
+
+
+@stock_bp.route("/reservations", methods=["GET"])
+def get_reservations():
+    """Danh sách giữ chỗ (?reference_type=&reference_id=&booking_id=&status=active)"""
+    reservations = ReservationService.get_reservations(
+        reference_type=request.args.get("reference_type"),
+        reference_id=request.args.get("reference_id", type=int),
+        booking_id=request.args.get("booking_id", type=int),
+        status=request.args.get("status", "active")
+    )
+    return jsonify({"reservations": [r.to_dict() for r in reservations]}), 200
+
+
+@stock_bp.route("/reservations/expire", methods=["POST"])
+def expire_reservations():
+    """Chạy ngay job dọn giữ chỗ hết hạn"""
+    expired = ReservationService.expire()
+    return jsonify({"expired_quantity": expired}), 200
+
+
+@stock_bp.route("/alerts/flush", methods=["POST"])
+def flush_stock_alerts():
+    """Gửi ngay digest cảnh báo tồn kho đang chờ (không đợi hết cửa sổ gom)"""
+    sent = StockAlertService.flush()
+    return jsonify({"sent_alerts": sent}), 200
+
+
+@stock_bp.route("/forecast/run", methods=["POST"])
+def run_forecast():
+    """Chạy ngay job dự báo nhu cầu / điểm đặt hàng lại cho mọi vật tư"""
+    return jsonify(ForecastService.run_once()), 200
+
+
+@stock_bp.route("/items", methods=["GET"])
+def get_items_batch():
+    """Lấy nhiều vật tư một lần, ưu tiên từ cache (?ids=1,2,3)"""
+    try:
+        item_ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        return jsonify({"error": "Tham số ids phải là danh sách số nguyên, ví dụ: 1,2,3"}), 400
+    if not item_ids:
+        return jsonify({"error": "Thiếu tham số ids"}), 400
+    if len(item_ids) > 1000:
+        return jsonify({"error": "Tối đa 1000 vật tư mỗi lần"}), 400
+
+    found = ItemCache.get_many(item_ids)
+    return jsonify({
+        "items": [found[i] for i in dict.fromkeys(item_ids) if i in found],
+        "missing": [i for i in dict.fromkeys(item_ids) if i not in found]
+    }), 200
+
+
+@stock_bp.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Tỉ lệ hit và độ cũ của cache vật tư (theo worker)"""
+    return jsonify(ItemCache.stats()), 200
@@ -1,5 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from services.inventory_service import InventoryService as service 
+from services.item_cache import ItemCache
+from services.catalog_service import CatalogService
+from services.forecast_service import ForecastService
+from services.stock_view_service import StockViewService
 
 inventory_bp = Blueprint("inventory", __name__, url_prefix="/api/inventory")
 
@@ -39,10 +43,11 @@ def get_low_stock():
 # ✅ 4. GET ITEM BY ID (GET /api/inventory/items/<int:item_id>)
 @inventory_bp.route("/items/<int:item_id>", methods=["GET"])
 def get_item(item_id):
-    item = service.get_item_by_id(item_id)
+    # Đọc qua cache (LRU + Redis), tự mất hiệu lực khi vật tư thay đổi
+    item = ItemCache.get(item_id)
     if not item:
         return jsonify({"error": "Item not found"}), 404
-    return jsonify(item.to_dict()), 200
+    return jsonify(item), 200
 
 # ✅ 5. UPDATE ITEM (PUT /api/inventory/items/<int:item_id>)
 @inventory_bp.route("/items/<int:item_id>", methods=["PUT"])
@@ -74,12 +79,15 @@ def suggest_replacement_parts():
     data = request.get_json()
     vehicle_model = data.get("vehicle_model")
     category = data.get("category") 
+    limit = data.get("limit")
 
     if not vehicle_model:
         return jsonify({"error": "vehicle_model is required"}), 400
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0):
+        return jsonify({"error": "limit must be a positive integer"}), 400
     
-    suggestions = service.suggest_parts(vehicle_model, category)
-    return jsonify([item.to_dict() for item in suggestions]), 200
+    suggestions = service.suggest_parts(vehicle_model, category, limit)
+    return jsonify(suggestions), 200
 
 # ✅ 8. SEED DEMO DATA (POST /api/inventory/seed-ai-data)
 @inventory_bp.route("/seed-ai-data", methods=["POST"])
@@ -87,3 +95,74 @@ def seed_ai_data():
     """API để tạo dữ liệu mẫu phục vụ demo AI"""
     service.seed_demo_data()
     return jsonify({"message": "Đã nạp dữ liệu mẫu AI thành công!"}), 201
+
+# ✅ 9. BULK IMPORT CATALOGUE (POST /api/inventory/import?format=csv|ndjson&center_id=1)
+@inventory_bp.route("/import", methods=["POST"])
+def import_catalogue():
+    """
+    Nhập danh mục vật tư hàng loạt (upsert theo part_number + center_id).
+    Body là file CSV/NDJSON thô hoặc multipart với field "file"; lỗi được báo theo từng dòng.
+    """
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    fmt = (request.args.get("format") or "").lower()
+    if not fmt:
+        hint = (upload.filename if upload else "") or request.content_type or ""
+        fmt = "ndjson" if ("ndjson" in hint or "jsonl" in hint or "json-lines" in hint) else "csv"
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format phải là csv hoặc ndjson"}), 400
+
+    report = CatalogService.import_items(stream, fmt, request.args.get("center_id", 1, type=int))
+    status = 200 if report["inserted"] or report["updated"] or not report["failed"] else 400
+    return jsonify(report), status
+
+# ✅ 10. STREAMING EXPORT CATALOGUE (GET /api/inventory/export?format=csv|ndjson&center_id=1)
+@inventory_bp.route("/export", methods=["GET"])
+def export_catalogue():
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format phải là csv hoặc ndjson"}), 400
+
+    center_id = request.args.get("center_id", type=int)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"inventory_{center_id or 'all'}.{fmt}"
+    return Response(
+        stream_with_context(CatalogService.iter_export(fmt, center_id)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# ✅ 11. REORDER SUGGESTIONS (GET /api/inventory/reorder-suggestions?center_id=1&needs_reorder=true)
+@inventory_bp.route("/reorder-suggestions", methods=["GET"])
+def get_reorder_suggestions():
+    """Điểm đặt hàng lại và số lượng đặt gợi ý từ job dự báo đêm (phân trang bằng after_id)"""
+    limit = min(request.args.get("limit", 500, type=int), 5000)
+    suggestions = ForecastService.get_suggestions(
+        center_id=request.args.get("center_id", type=int),
+        needs_reorder=request.args.get("needs_reorder", "false").lower() == "true",
+        after_id=request.args.get("after_id", 0, type=int),
+        limit=limit
+    )
+    return jsonify({
+        "suggestions": suggestions,
+        "next_after_id": suggestions[-1]["inventory_id"] if len(suggestions) == limit else None
+    }), 200
+
+# ✅ 12. CROSS-CENTER AVAILABILITY (GET /api/inventory/availability/<part_number>?center_id=1)
+@inventory_bp.route("/availability/<path:part_number>", methods=["GET"])
+def get_part_availability(part_number):
+    """Tồn kho của một mã phụ tùng trên mọi chi nhánh; có center_id thì sắp theo khoảng cách tới chi nhánh đó"""
+    availability = StockViewService.get_availability(part_number, request.args.get("center_id", type=int))
+    if not availability:
+        return jsonify({"error": "Không tìm thấy mã phụ tùng"}), 404
+    return jsonify(availability), 200
+
+# ✅ 13. TRANSFER SUGGESTIONS (GET /api/inventory/transfer-suggestions?part_number=X | ?center_id=1)
+@inventory_bp.route("/transfer-suggestions", methods=["GET"])
+def get_transfer_suggestions():
+    """Gợi ý điều chuyển từ chi nhánh dư sang chi nhánh thiếu gần nhất"""
+    part_number = request.args.get("part_number")
+    center_id = request.args.get("center_id", type=int)
+    if not part_number and center_id is None:
+        return jsonify({"error": "Cần part_number hoặc center_id"}), 400
+    return jsonify(StockViewService.suggest_transfers(part_number, center_id)), 200
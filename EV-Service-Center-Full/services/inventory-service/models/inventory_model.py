@@ -12,6 +12,8 @@ class Inventory(db.Model):
     
     name = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=0)
+    # Tổng số lượng đang được giữ chỗ (reservation active), duy trì cùng transaction với stock_reservations
+    reserved_quantity = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     min_quantity = db.Column(db.Integer, nullable=False, default=10)
     price = db.Column(db.Float, nullable=False)
 
@@ -32,6 +34,8 @@ class Inventory(db.Model):
             "name": self.name,
             "part_number": self.part_number,
             "quantity": self.quantity,
+            "reserved_quantity": self.reserved_quantity,
+            "available_quantity": self.quantity - (self.reserved_quantity or 0),
             "min_quantity": self.min_quantity,
             "price": self.price,
             "center_id": self.center_id,
@@ -53,3 +57,201 @@ class InventoryCompatibility(db.Model):
     category = db.Column(db.String(100), nullable=True)
 
     created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+class InventoryVehicleModel(db.Model):
+    """Ánh xạ chuẩn hóa (vật tư, model xe): mỗi model trong compatible_models là một dòng"""
+    __tablename__ = "inventory_vehicle_models"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
+    # Đã chuẩn hóa: bỏ khoảng trắng thừa, viết hoa (ví dụ: "VF8")
+    vehicle_model = db.Column(db.String(100), nullable=False)
+
+    __table_args__ = (
+        # Tra cứu theo model xe (so khớp chính xác, VF8 không còn khớp VF85)
+        UniqueConstraint('vehicle_model', 'inventory_id', name='uix_vehicle_model_inventory'),
+        db.Index("ix_inventory_vehicle_models_inventory_id", "inventory_id"),
+    )
+
+# Lý do biến động tồn kho
+MOVEMENT_REASONS = ("initial", "set", "adjust", "deduct", "restock")
+
+class InventoryMovement(db.Model):
+    """Sổ cái biến động tồn kho (append-only): mỗi lần số lượng thay đổi là một dòng với delta có dấu"""
+    __tablename__ = "inventory_movements"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    # Không dùng ForeignKey để lịch sử vẫn còn khi vật tư bị xóa
+    inventory_id = db.Column(db.Integer, nullable=False)
+    center_id = db.Column(db.Integer, nullable=False, default=1)
+
+    delta = db.Column(db.Integer, nullable=False)
+    quantity_after = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+
+    # Chứng từ gây ra biến động (ví dụ: booking 12, task 7)
+    reference_type = db.Column(db.String(50), nullable=True)
+    reference_id = db.Column(db.Integer, nullable=True)
+    note = db.Column(db.String(255), nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        db.Index("ix_inventory_movements_item_id", "inventory_id", "id"),
+        db.Index("ix_inventory_movements_reference", "reference_type", "reference_id"),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "inventory_id": self.inventory_id,
+            "center_id": self.center_id,
+            "delta": self.delta,
+            "quantity_after": self.quantity_after,
+            "reason": self.reason,
+            "reference_type": self.reference_type,
+            "reference_id": self.reference_id,
+            "note": self.note,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+# Trạng thái giữ chỗ vật tư
+RESERVATION_STATUSES = db.Enum(
+    "active", "converted", "released", "expired",
+    name="stock_reservation_statuses"
+)
+
+class StockReservation(db.Model):
+    """Giữ chỗ vật tư có thời hạn (TTL) cho một task bảo dưỡng"""
+    __tablename__ = "stock_reservations"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    inventory_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(RESERVATION_STATUSES, nullable=False, default="active")
+
+    # Chứng từ giữ chỗ (ví dụ: task 7) và booking để chuyển thành xuất kho khi lập hóa đơn
+    reference_type = db.Column(db.String(50), nullable=False)
+    reference_id = db.Column(db.Integer, nullable=False)
+    booking_id = db.Column(db.Integer, nullable=True, index=True)
+
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        db.Index("ix_stock_reservations_reference", "reference_type", "reference_id"),
+        # Job dọn giữ chỗ hết hạn chỉ quét các reservation còn active
+        db.Index(
+            "ix_stock_reservations_active_expires_at", "expires_at",
+            postgresql_where=db.text("status = 'active'")
+        ),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "inventory_id": self.inventory_id,
+            "quantity": self.quantity,
+            "status": str(self.status),
+            "reference_type": self.reference_type,
+            "reference_id": self.reference_id,
+            "booking_id": self.booking_id,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class StockAlert(db.Model):
+    """Sự kiện vật tư vượt ngưỡng tồn kho (thấp / hết hàng), được gom theo chi nhánh và gửi thành digest"""
+    __tablename__ = "stock_alerts"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    inventory_id = db.Column(db.Integer, nullable=False)
+    center_id = db.Column(db.Integer, nullable=False, default=1)
+    alert_type = db.Column(db.String(20), nullable=False)  # low_stock | out_of_stock
+
+    # Ảnh chụp lúc vượt ngưỡng, để digest không phải đọc lại bảng inventory
+    part_number = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    min_quantity = db.Column(db.Integer, nullable=False)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    notified_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Job gửi digest chỉ quét các sự kiện chưa gửi
+        db.Index(
+            "ix_stock_alerts_pending", "id",
+            postgresql_where=db.text("notified_at IS NULL")
+        ),
+    )
+
+class ReorderSuggestion(db.Model):
+    """Điểm đặt hàng lại / số lượng đặt gợi ý cho từng vật tư (mỗi chi nhánh), do job dự báo ghi đè mỗi đêm"""
+    __tablename__ = "reorder_suggestions"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    inventory_id = db.Column(db.Integer, nullable=False, unique=True)
+    center_id = db.Column(db.Integer, nullable=False, default=1)
+
+    avg_daily_demand = db.Column(db.Float, nullable=False)
+    lead_time_demand = db.Column(db.Float, nullable=False)  # Nhu cầu dự báo trong thời gian chờ hàng
+    safety_stock = db.Column(db.Float, nullable=False)
+    reorder_point = db.Column(db.Integer, nullable=False)
+    order_quantity = db.Column(db.Integer, nullable=False)  # 0 nếu chưa cần đặt
+
+    # Tham số mô hình đã chọn và sai số dự báo 1 ngày (RMSE) trên lịch sử
+    alpha = db.Column(db.Float, nullable=False)
+    gamma = db.Column(db.Float, nullable=False)
+    rmse = db.Column(db.Float, nullable=False)
+
+    computed_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        db.Index("ix_reorder_suggestions_center_order", "center_id", "order_quantity"),
+    )
+
+    def to_dict(self):
+        return {
+            "inventory_id": self.inventory_id,
+            "center_id": self.center_id,
+            "avg_daily_demand": round(self.avg_daily_demand, 3),
+            "lead_time_demand": round(self.lead_time_demand, 2),
+            "safety_stock": round(self.safety_stock, 2),
+            "reorder_point": self.reorder_point,
+            "order_quantity": self.order_quantity,
+            "alpha": self.alpha,
+            "gamma": self.gamma,
+            "rmse": round(self.rmse, 3),
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None
+        }
+
+class PartStock(db.Model):
+    """
+    View vật chất hóa tồn kho theo mã phụ tùng trên mọi chi nhánh (một dòng mỗi part_number).
+    Được cộng delta trong cùng transaction với mọi thay đổi tồn kho / giữ chỗ của mã đó (StockViewService);
+    chi tiết từng chi nhánh đọc từ inventory theo unique index (part_number, center_id).
+    """
+    __tablename__ = "part_stock_view"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    part_number = db.Column(db.String(100), nullable=False, unique=True)
+
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_reserved = db.Column(db.Integer, nullable=False, default=0)
+    total_available = db.Column(db.Integer, nullable=False, default=0)
+    center_count = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        return {
+            "part_number": self.part_number,
+            "total_quantity": self.total_quantity,
+            "total_reserved": self.total_reserved,
+            "total_available": self.total_available,
+            "center_count": self.center_count,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,329 @@
+"""
+Nhập / xuất danh mục vật tư hàng loạt (onboarding chi nhánh mới).
+
+Nhập: đọc luồng CSV hoặc NDJSON từng dòng (không nạp cả file vào bộ nhớ), kiểm tra từng dòng,
+gom thành lô CHUNK_SIZE dòng và ghi mỗi lô bằng vài câu lệnh theo tập:
+- 1 SELECT ... FOR UPDATE các vật tư đã tồn tại (để giữ giá trị cũ cho cột bị bỏ trống và
+  tính delta cho sổ cái)
+- 1 INSERT ... ON CONFLICT (part_number, center_id) DO UPDATE ... RETURNING
+- xóa/ghi lại compatibility + bảng model xe chuẩn hóa cho các dòng có cột tương thích
+- 1 INSERT sổ cái (initial / set) rồi commit lô
+Lỗi dữ liệu được báo theo số dòng và không làm hỏng các dòng hợp lệ; lỗi DB chỉ làm hỏng lô đó.
+
+Xuất: duyệt theo khóa (id > after_id) từng trang, stream ra CSV/NDJSON cùng định dạng với file nhập.
+"""
+import codecs
+import csv
+import io
+import json
+import time
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from models.inventory_model import Inventory, InventoryCompatibility, InventoryVehicleModel
+from services.compatibility_index import CompatibilityIndex
+from services.inventory_service import InventoryService
+from services.item_cache import ItemCache
+from services.stock_alert_service import StockAlertService
+from services.stock_view_service import StockViewService
+
+# Cột của file nhập/xuất (file xuất có thêm id, reserved_quantity; khi nhập các cột này bị bỏ qua)
+IMPORT_COLUMNS = ("part_number", "name", "quantity", "min_quantity", "price", "center_id", "compatible_models", "category")
+EXPORT_COLUMNS = ("id",) + IMPORT_COLUMNS[:3] + ("reserved_quantity",) + IMPORT_COLUMNS[3:]
+
+
+class CatalogService:
+    """Service nhập/xuất danh mục vật tư"""
+
+    CHUNK_SIZE = 1000
+    EXPORT_PAGE_SIZE = 2000
+    MAX_REPORTED_ERRORS = 1000
+
+    # ===== ĐỌC FILE =====
+    @staticmethod
+    def _iter_lines(stream, chunk_size=64 * 1024):
+        """
+        Giải mã luồng bytes UTF-8 (bỏ BOM) thành từng dòng, giữ ký tự xuống dòng.
+        Chỉ cần stream.read(): file upload của Werkzeug (SpooledTemporaryFile) trên Python 3.9
+        không có readable() nên không bọc được bằng io.TextIOWrapper. Chỉ tách theo "\n" như
+        newline="" (csv tự xử lý "\r\n" và xuống dòng trong ô có ngoặc kép).
+        """
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        pending = ""
+        while True:
+            chunk = stream.read(chunk_size)
+            pending += decoder.decode(chunk or b"", final=not chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line + "\n"
+            if not chunk:
+                if pending:
+                    yield pending
+                return
+
+    @staticmethod
+    def iter_rows(stream, fmt):
+        """Sinh (số dòng, dict) từ luồng bytes CSV/NDJSON. Dòng NDJSON hỏng trả về (số dòng, None)"""
+        text = CatalogService._iter_lines(stream)
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+
+    @staticmethod
+    def _parse_row(row, default_center_id):
+        """Chuẩn hóa một dòng. Trả về (dict, error); cột bỏ trống là None (giữ giá trị cũ nếu đã tồn tại)"""
+        if row is None:
+            return None, "Dòng không phải JSON object hợp lệ"
+
+        def text(key):
+            value = row.get(key)
+            value = str(value).strip() if value is not None else ""
+            return value or None
+
+        def number(key, cast):
+            value = text(key)
+            if value is None:
+                return None
+            result = cast(value)
+            if result < 0:
+                raise ValueError(f"{key} không được âm")
+            return result
+
+        try:
+            parsed = {
+                "part_number": text("part_number"),
+                "name": text("name"),
+                "quantity": number("quantity", int),
+                "min_quantity": number("min_quantity", int),
+                "price": number("price", float),
+                "center_id": number("center_id", int) or default_center_id,
+                "compatible_models": text("compatible_models"),
+                "category": text("category"),
+            }
+        except ValueError as e:
+            return None, f"Giá trị không hợp lệ: {e}"
+
+        if not parsed["part_number"]:
+            return None, "Thiếu part_number"
+        if len(parsed["part_number"]) > 100 or len(parsed["name"] or "") > 255:
+            return None, "part_number hoặc name quá dài"
+        return parsed, None
+
+    # ===== NHẬP =====
+    @staticmethod
+    def _upsert_statement():
+        """
+        Câu upsert dùng chung cho mọi lô: thực thi kiểu executemany để SQLAlchemy gộp thành
+        INSERT nhiều VALUES (insertmanyvalues) mà không phải biên dịch lại câu lệnh cho từng lô
+        """
+        insert_fn = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert_fn(Inventory.__table__)
+        return stmt.on_conflict_do_update(
+            index_elements=[Inventory.part_number, Inventory.center_id],
+            set_={
+                "name": stmt.excluded.name,
+                "quantity": stmt.excluded.quantity,
+                "min_quantity": stmt.excluded.min_quantity,
+                "price": stmt.excluded.price,
+                "updated_at": func.now(),
+            }
+        ).returning(Inventory.id, Inventory.part_number, Inventory.center_id)
+
+    @staticmethod
+    def _write_chunk(chunk, report):
+        """Ghi một lô {(part_number, center_id): (số dòng, dict)} trong một transaction"""
+        keys = list(chunk)
+        existing = {
+            (row.part_number, row.center_id): row
+            for row in db.session.query(
+                Inventory.id, Inventory.part_number, Inventory.center_id, Inventory.name,
+                Inventory.quantity, Inventory.min_quantity, Inventory.price
+            ).filter(tuple_(Inventory.part_number, Inventory.center_id).in_(keys))
+            .order_by(Inventory.id).with_for_update()
+        }
+
+        rows = []
+        for key in keys:
+            line_no, data = chunk[key]
+            old = existing.get(key)
+            if old is None and not data["name"]:
+                CatalogService._add_error(report, line_no, "Vật tư mới phải có name")
+                del chunk[key]
+                continue
+            rows.append({
+                "part_number": data["part_number"],
+                "center_id": data["center_id"],
+                "name": data["name"] or old.name,
+                "quantity": data["quantity"] if data["quantity"] is not None else (old.quantity if old else 0),
+                "min_quantity": data["min_quantity"] if data["min_quantity"] is not None else (old.min_quantity if old else 10),
+                "price": data["price"] if data["price"] is not None else (old.price if old else 0),
+            })
+        if not rows:
+            return []
+
+        ids = {
+            (part_number, center_id): inventory_id
+            for inventory_id, part_number, center_id in db.session.execute(CatalogService._upsert_statement(), rows)
+        }
+
+        movements = []
+        crossings = []
+        view_changes = []
+        compat_rows = []
+        vehicle_rows = []
+        for row in rows:
+            key = (row["part_number"], row["center_id"])
+            inventory_id = ids[key]
+            old = existing.get(key)
+            delta = row["quantity"] - (old.quantity if old else 0)
+            view_changes.append({"part_number": row["part_number"], "quantity": delta, "centers": 0 if old else 1})
+            if delta:
+                movements.append({
+                    "inventory_id": inventory_id,
+                    "center_id": row["center_id"],
+                    "delta": delta,
+                    "quantity_after": row["quantity"],
+                    "reason": "set" if old else "initial",
+                    "reference_type": "import",
+                    "note": "Nhập danh mục hàng loạt"
+                })
+            if old:
+                crossings.append(dict(row, item_id=inventory_id, old_quantity=old.quantity))
+            data = chunk[key][1]
+            if data["compatible_models"] or data["category"]:
+                compat_rows.append({
+                    "inventory_id": inventory_id,
+                    "compatible_models": data["compatible_models"],
+                    "category": data["category"]
+                })
+                vehicle_rows.extend(
+                    {"inventory_id": inventory_id, "vehicle_model": model}
+                    for model in CompatibilityIndex.split_models(data["compatible_models"])
+                )
+
+        if compat_rows:
+            compat_ids = [r["inventory_id"] for r in compat_rows]
+            InventoryCompatibility.query.filter(InventoryCompatibility.inventory_id.in_(compat_ids)).delete(synchronize_session=False)
+            InventoryVehicleModel.query.filter(InventoryVehicleModel.inventory_id.in_(compat_ids)).delete(synchronize_session=False)
+            db.session.execute(InventoryCompatibility.__table__.insert(), compat_rows)
+            if vehicle_rows:
+                db.session.execute(InventoryVehicleModel.__table__.insert(), vehicle_rows)
+        InventoryService._record_movements(movements)
+        StockAlertService.record_crossings(crossings)
+        StockViewService.apply_deltas(view_changes)
+        db.session.commit()
+
+        inserted = sum(1 for row in rows if (row["part_number"], row["center_id"]) not in existing)
+        report["inserted"] += inserted
+        report["updated"] += len(rows) - inserted
+        return list(ids.values())
+
+    @staticmethod
+    def _add_error(report, line_no, message):
+        report["failed"] += 1
+        if len(report["errors"]) < CatalogService.MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_no, "error": message})
+
+    @staticmethod
+    def _flush(chunk, report):
+        try:
+            item_ids = CatalogService._write_chunk(chunk, report)
+        except Exception as e:
+            db.session.rollback()
+            for line_no, _ in chunk.values():
+                CatalogService._add_error(report, line_no, f"Lỗi ghi lô: {str(e)}")
+            return
+        ItemCache.invalidate(item_ids)
+
+    @staticmethod
+    def import_items(stream, fmt, default_center_id=1):
+        """
+        Nhập danh mục từ luồng CSV/NDJSON theo lô upsert.
+        Trả về báo cáo {processed, inserted, updated, duplicates, failed, errors[{line, error}], elapsed_ms}.
+        """
+        started = time.perf_counter()
+        report = {"processed": 0, "inserted": 0, "updated": 0, "duplicates": 0, "failed": 0, "errors": []}
+        chunk = {}
+        for line_no, row in CatalogService.iter_rows(stream, fmt):
+            report["processed"] += 1
+            data, error = CatalogService._parse_row(row, default_center_id)
+            if error:
+                CatalogService._add_error(report, line_no, error)
+                continue
+
+            # ON CONFLICT không cho cập nhật một dòng hai lần trong cùng câu lệnh: dòng sau ghi đè dòng trước
+            key = (data["part_number"], data["center_id"])
+            if key in chunk:
+                report["duplicates"] += 1
+            chunk[key] = (line_no, data)
+            if len(chunk) >= CatalogService.CHUNK_SIZE:
+                CatalogService._flush(chunk, report)
+                chunk = {}
+
+        if chunk:
+            CatalogService._flush(chunk, report)
+        if report["inserted"] or report["updated"]:
+            CompatibilityIndex.invalidate()
+
+        report["errors"].sort(key=lambda e: e["line"])
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return report
+
+    # ===== XUẤT =====
+    @staticmethod
+    def iter_export(fmt, center_id=None):
+        """Sinh từng đoạn CSV/NDJSON của danh mục, đọc theo trang id tăng dần"""
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        after_id = 0
+        while True:
+            query = db.session.query(
+                Inventory.id, Inventory.part_number, Inventory.name, Inventory.quantity, Inventory.reserved_quantity,
+                Inventory.min_quantity, Inventory.price, Inventory.center_id
+            ).filter(Inventory.id > after_id)
+            if center_id is not None:
+                query = query.filter(Inventory.center_id == center_id)
+            page = query.order_by(Inventory.id).limit(CatalogService.EXPORT_PAGE_SIZE).all()
+            if not page:
+                break
+
+            compat = {}
+            for inventory_id, compatible_models, category in db.session.query(
+                InventoryCompatibility.inventory_id, InventoryCompatibility.compatible_models, InventoryCompatibility.category
+            ).filter(InventoryCompatibility.inventory_id.in_([row.id for row in page])):
+                compat.setdefault(inventory_id, (compatible_models, category))
+
+            records = []
+            for row in page:
+                compatible_models, category = compat.get(row.id, (None, None))
+                record = row._asdict()
+                record["compatible_models"] = compatible_models
+                record["category"] = category
+                records.append(record)
+
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+                writer.writerows(records)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+            after_id = page[-1].id
+            # Trả kết nối về pool giữa các trang để stream dài không giữ transaction mở
+            db.session.commit()
@@ -0,0 +1,162 @@
+"""
+Chỉ mục ngược trong bộ nhớ cho gợi ý phụ tùng (suggest_parts).
+
+model xe -> danh sách part ID, category -> tập part ID. Mỗi danh sách đã được sắp sẵn theo
+điểm xếp hạng (tồn kho khả dụng + lượng tiêu thụ gần đây), nên một lần gợi ý chỉ là duyệt
+danh sách của model và lọc theo category: không truy vấn DB, dưới 1 ms kể cả khi có hàng chục
+nghìn SKU.
+
+Chỉ mục được dựng lại ngay khi danh mục thay đổi trong worker hiện tại (tạo/sửa/xóa vật tư,
+invalidate) và tối đa sau COMPAT_INDEX_TTL_SECONDS giây cho thay đổi tồn kho hoặc thay đổi
+đến từ worker khác (xuất/nhập kho không dựng lại chỉ mục để gợi ý luôn nhanh giờ cao điểm).
+"""
+import math
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from models.inventory_model import Inventory, InventoryCompatibility, InventoryMovement, InventoryVehicleModel
+
+_lock = Lock()
+# snapshot = (items, by_model, by_category), thay thế nguyên khối để luồng đọc luôn thấy dữ liệu nhất quán
+_state = {"built_at": 0.0, "dirty": True, "snapshot": ({}, {}, {})}
+
+
+class CompatibilityIndex:
+    """Chỉ mục model/category -> phụ tùng, xếp hạng theo tồn kho và lượng dùng"""
+
+    DEFAULT_TTL_SECONDS = 30
+    USAGE_WINDOW_DAYS = 90
+    USAGE_WEIGHT = 1.5
+    OUT_OF_STOCK_PENALTY = 100.0
+
+    @staticmethod
+    def normalize_model(vehicle_model):
+        return " ".join((vehicle_model or "").split()).upper()
+
+    @staticmethod
+    def split_models(compatible_models):
+        """'VF8, vf9 ,VF8' -> ['VF8', 'VF9']"""
+        models = []
+        for raw in (compatible_models or "").split(","):
+            model = CompatibilityIndex.normalize_model(raw)
+            if model and model not in models:
+                models.append(model)
+        return models
+
+    @staticmethod
+    def invalidate():
+        _state["dirty"] = True
+
+    @staticmethod
+    def _usage_by_item():
+        """Lượng xuất kho cho sửa chữa trong USAGE_WINDOW_DAYS ngày gần nhất, theo vật tư (từ sổ cái)"""
+        since = datetime.now() - timedelta(days=CompatibilityIndex.USAGE_WINDOW_DAYS)
+        rows = db.session.query(
+            InventoryMovement.inventory_id,
+            func.sum(-InventoryMovement.delta)
+        ).filter(
+            InventoryMovement.reason == "deduct",
+            InventoryMovement.created_at >= since
+        ).group_by(InventoryMovement.inventory_id).all()
+        return {inventory_id: int(total or 0) for inventory_id, total in rows}
+
+    @staticmethod
+    def _score(available, usage):
+        score = math.log1p(max(available, 0)) + CompatibilityIndex.USAGE_WEIGHT * math.log1p(usage)
+        return score if available > 0 else score - CompatibilityIndex.OUT_OF_STOCK_PENALTY
+
+    @staticmethod
+    def _build():
+        # Hạ cờ trước khi đọc DB: invalidate xảy ra trong lúc dựng sẽ khiến lần sau dựng lại
+        _state["dirty"] = False
+        usage = CompatibilityIndex._usage_by_item()
+
+        # Đọc theo cột (không dựng ORM object) để dựng nhanh với hàng chục nghìn SKU
+        items = {}
+        for row in db.session.query(
+            Inventory.id, Inventory.name, Inventory.part_number, Inventory.quantity,
+            Inventory.reserved_quantity, Inventory.min_quantity, Inventory.price, Inventory.center_id,
+            Inventory.created_at, Inventory.updated_at
+        ):
+            available = row.quantity - (row.reserved_quantity or 0)
+            item_usage = usage.get(row.id, 0)
+            # Cùng các trường với Inventory.to_dict(), thêm usage_count/score
+            items[row.id] = {
+                "id": row.id,
+                "name": row.name,
+                "part_number": row.part_number,
+                "quantity": row.quantity,
+                "reserved_quantity": row.reserved_quantity,
+                "available_quantity": available,
+                "min_quantity": row.min_quantity,
+                "price": row.price,
+                "center_id": row.center_id,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+                "usage_count": item_usage,
+                "score": CompatibilityIndex._score(available, item_usage)
+            }
+
+        by_model = {}
+        for inventory_id, vehicle_model in db.session.query(
+            InventoryVehicleModel.inventory_id, InventoryVehicleModel.vehicle_model
+        ):
+            if inventory_id in items:
+                by_model.setdefault(vehicle_model, []).append(inventory_id)
+
+        by_category = {}
+        for inventory_id, category in db.session.query(
+            InventoryCompatibility.inventory_id, InventoryCompatibility.category
+        ).filter(InventoryCompatibility.category.isnot(None)):
+            if inventory_id in items:
+                by_category.setdefault(category, set()).add(inventory_id)
+
+        for ids in by_model.values():
+            ids.sort(key=lambda item_id: items[item_id]["score"], reverse=True)
+
+        _state["snapshot"] = (items, by_model, by_category)
+        _state["built_at"] = time.monotonic()
+
+    @staticmethod
+    def _ensure_fresh():
+        ttl = current_app.config.get("COMPAT_INDEX_TTL_SECONDS", CompatibilityIndex.DEFAULT_TTL_SECONDS)
+        if not _state["dirty"] and time.monotonic() - _state["built_at"] < ttl:
+            return
+        # Đã có snapshot: nếu luồng khác đang dựng lại thì dùng tạm snapshot cũ thay vì chờ
+        if not _lock.acquire(blocking=not _state["built_at"]):
+            return
+        try:
+            if _state["dirty"] or time.monotonic() - _state["built_at"] >= ttl:
+                CompatibilityIndex._build()
+        finally:
+            _lock.release()
+
+    @staticmethod
+    def suggest(vehicle_model, category=None, limit=None):
+        """Danh sách vật tư (dict) tương thích với model xe, đã xếp hạng; limit là số nguyên dương hoặc None"""
+        CompatibilityIndex._ensure_fresh()
+        items, by_model, by_category = _state["snapshot"]
+
+        model = CompatibilityIndex.normalize_model(vehicle_model)
+        if model in by_model:
+            candidates = by_model[model]
+        else:
+            # "VinFast VF8" -> thử từng từ là một model đã biết (vẫn so khớp chính xác từng model)
+            seen = set()
+            candidates = []
+            for token in model.split():
+                for item_id in by_model.get(token, ()):
+                    if item_id not in seen:
+                        seen.add(item_id)
+                        candidates.append(item_id)
+            candidates.sort(key=lambda item_id: items[item_id]["score"], reverse=True)
+
+        if category:
+            allowed = by_category.get(category, set())
+            candidates = [item_id for item_id in candidates if item_id in allowed]
+        if limit:
+            candidates = candidates[:limit]
+        return [items[item_id] for item_id in candidates]
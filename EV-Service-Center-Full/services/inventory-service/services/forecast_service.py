@@ -0,0 +1,274 @@
+"""
+Dự báo nhu cầu vật tư và điểm đặt hàng lại (reorder point), chạy mỗi đêm.
+
+1. Chuỗi tiêu thụ theo ngày cho mọi vật tư (mỗi vật tư thuộc một chi nhánh) trong FORECAST_HISTORY_DAYS
+   ngày, lấy từ sổ cái: xuất kho lập hóa đơn (deduct, gồm cả phụ tùng của task bảo dưỡng đã giữ chỗ),
+   trừ đi phần nhập lại khi hóa đơn bị hủy (restock theo booking).
+   Một query GROUP BY (vật tư, ngày) đổ vào ma trận NumPy [số vật tư, số ngày].
+2. Làm trơn hàm mũ có mùa vụ theo thứ trong tuần (ETS cộng, chu kỳ 7, dạng hiệu chỉnh sai số):
+       e_t = y_t - (l + s[d]);  l += alpha * e_t;  s[d] += gamma * e_t
+   Mọi chuỗi và mọi cặp (alpha, gamma) trong lưới được chạy cùng lúc bằng phép toán vector,
+   vòng lặp Python chỉ chạy theo số ngày. Mỗi chuỗi chọn cặp tham số có SSE nhỏ nhất.
+3. Nhu cầu trong thời gian chờ hàng L ngày = tổng dự báo L ngày tới; tồn kho an toàn = z * RMSE * sqrt(L);
+   reorder point = nhu cầu + an toàn; khi số lượng khả dụng <= reorder point thì đặt đủ lên
+   reorder point + nhu cầu của chu kỳ xem xét (FORECAST_REVIEW_DAYS ngày).
+Kết quả ghi đè bảng reorder_suggestions trong một transaction; min_quantity do người dùng nhập không bị đổi.
+"""
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, func, insert, or_
+from app import db
+from models.inventory_model import Inventory, InventoryMovement, ReorderSuggestion
+
+
+class ForecastService:
+    """Service dự báo nhu cầu và gợi ý đặt hàng"""
+
+    DEFAULT_HISTORY_DAYS = 182
+    DEFAULT_LEAD_TIME_DAYS = 7
+    DEFAULT_REVIEW_DAYS = 7
+    DEFAULT_SERVICE_LEVEL_Z = 1.65  # ~95% không hết hàng trong thời gian chờ
+    SEASON = 7
+    ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+    GAMMAS = (0.05, 0.1, 0.2)
+    FIT_CHUNK_SIZE = 20000  # Giới hạn bộ nhớ: [số cặp tham số, chunk, 7] float64
+    WRITE_CHUNK_SIZE = 5000
+
+    # ===== DỮ LIỆU =====
+    @staticmethod
+    def _load_items():
+        """(ids, center_ids, available) của mọi vật tư, sắp theo id"""
+        rows = db.session.query(
+            Inventory.id, Inventory.center_id, Inventory.quantity - Inventory.reserved_quantity
+        ).order_by(Inventory.id).all()
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        centers = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        available = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        return ids, centers, available
+
+    @staticmethod
+    def _load_series(ids, start, days):
+        """Ma trận tiêu thụ theo ngày [len(ids), days] từ sổ cái"""
+        series = np.zeros((len(ids), days), dtype=np.float64)
+        if not len(ids):
+            return series
+
+        day = func.date(InventoryMovement.created_at)
+        rows = db.session.query(
+            InventoryMovement.inventory_id, day, func.sum(-InventoryMovement.delta)
+        ).filter(
+            InventoryMovement.created_at >= start,
+            or_(
+                InventoryMovement.reason == "deduct",
+                and_(InventoryMovement.reason == "restock", InventoryMovement.reference_type == "booking")
+            )
+        ).group_by(InventoryMovement.inventory_id, day).all()
+
+        if rows:
+            item_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            start_date = start.date()
+            offsets = np.fromiter((
+                ((row[1] if isinstance(row[1], date) else date.fromisoformat(str(row[1]))) - start_date).days
+                for row in rows
+            ), dtype=np.int64, count=len(rows))
+            amounts = np.fromiter((row[2] or 0 for row in rows), dtype=np.float64, count=len(rows))
+
+            # Vật tư đã bị xóa (sổ cái không có FK) và ngày ngoài cửa sổ bị bỏ qua
+            positions = np.searchsorted(ids, item_ids)
+            positions[positions >= len(ids)] = 0
+            keep = (ids[positions] == item_ids) & (offsets >= 0) & (offsets < days)
+            np.add.at(series, (positions[keep], offsets[keep]), amounts[keep])
+
+        # Nhập lại nhiều hơn xuất trong cùng ngày không phải là nhu cầu âm
+        np.maximum(series, 0, out=series)
+        return series
+
+    # ===== MÔ HÌNH =====
+    @staticmethod
+    def fit(series, start_weekday):
+        """
+        Làm trơn hàm mũ có mùa vụ theo thứ cho mọi chuỗi cùng lúc.
+        Trả về (level [N], season [7, N] theo thứ trong tuần (0 = thứ Hai), alpha [N], gamma [N], rmse [N]).
+        """
+        n, days = series.shape
+        grid_alpha = np.repeat(ForecastService.ALPHAS, len(ForecastService.GAMMAS))[:, None]
+        grid_gamma = np.tile(ForecastService.GAMMAS, len(ForecastService.ALPHAS))[:, None]
+        grid_size = grid_alpha.shape[0]
+
+        # Khởi tạo từ 2 tuần đầu: level = trung bình, mùa vụ = trung bình theo thứ - level
+        warmup = min(2 * ForecastService.SEASON, days)
+        level0 = series[:, :warmup].mean(axis=1)
+        season0 = np.zeros((ForecastService.SEASON, n))
+        for offset in range(min(ForecastService.SEASON, warmup)):
+            season0[(start_weekday + offset) % ForecastService.SEASON] = series[:, offset:warmup:ForecastService.SEASON].mean(axis=1) - level0
+
+        level = np.repeat(level0[None, :], grid_size, axis=0)
+        season = np.repeat(season0[:, None, :], grid_size, axis=1)  # [7, grid, N]
+        sse = np.zeros((grid_size, n))
+        counted = 0
+        for t in range(days):
+            weekday = (start_weekday + t) % ForecastService.SEASON
+            error = series[:, t] - (level + season[weekday])
+            if t >= ForecastService.SEASON:  # Tuần đầu còn phụ thuộc giá trị khởi tạo
+                sse += error * error
+                counted += 1
+            level += grid_alpha * error
+            season[weekday] += grid_gamma * error
+
+        best = sse.argmin(axis=0)
+        columns = np.arange(n)
+        rmse = np.sqrt(sse[best, columns] / max(counted, 1))
+        return (
+            level[best, columns],
+            season[:, best, columns],
+            grid_alpha[best, 0],
+            grid_gamma[best, 0],
+            rmse
+        )
+
+    @staticmethod
+    def forecast(level, season, first_weekday, horizon):
+        """Tổng nhu cầu dự báo cho `horizon` ngày bắt đầu từ thứ `first_weekday` (không âm từng ngày)"""
+        total = np.zeros_like(level)
+        for h in range(horizon):
+            total += np.maximum(level + season[(first_weekday + h) % ForecastService.SEASON], 0)
+        return total
+
+    @staticmethod
+    def compute(series, available, start_weekday, lead_time_days, review_days, service_z):
+        """Dự báo + reorder point cho mọi chuỗi, chia chunk để giới hạn bộ nhớ. Trả về dict các mảng [N]"""
+        n, days = series.shape
+        next_weekday = (start_weekday + days) % ForecastService.SEASON
+        parts = []
+        for begin in range(0, n, ForecastService.FIT_CHUNK_SIZE):
+            chunk = series[begin:begin + ForecastService.FIT_CHUNK_SIZE]
+            level, season, alpha, gamma, rmse = ForecastService.fit(chunk, start_weekday)
+            lead_demand = ForecastService.forecast(level, season, next_weekday, lead_time_days)
+            review_demand = ForecastService.forecast(
+                level, season, (next_weekday + lead_time_days) % ForecastService.SEASON, review_days
+            )
+            parts.append((lead_demand, review_demand, alpha, gamma, rmse))
+
+        lead_demand, review_demand, alpha, gamma, rmse = (
+            np.concatenate([part[i] for part in parts]) if parts else np.zeros(0) for i in range(5)
+        )
+        safety_stock = service_z * rmse * math.sqrt(lead_time_days)
+        reorder_point = np.ceil(lead_demand + safety_stock - 1e-9)
+        order_up_to = np.ceil(reorder_point + review_demand - 1e-9)
+        order_quantity = np.where(available <= reorder_point, np.maximum(order_up_to - available, 0), 0)
+        return {
+            "avg_daily_demand": series.mean(axis=1) if days else np.zeros(n),
+            "lead_time_demand": lead_demand,
+            "safety_stock": safety_stock,
+            "reorder_point": reorder_point.astype(np.int64),
+            "order_quantity": order_quantity.astype(np.int64),
+            "alpha": alpha,
+            "gamma": gamma,
+            "rmse": rmse
+        }
+
+    # ===== JOB =====
+    @staticmethod
+    def _write(ids, centers, result, computed_at):
+        """Ghi đè toàn bộ bảng gợi ý trong một transaction (người đọc luôn thấy một lần chạy trọn vẹn)"""
+        columns = ("avg_daily_demand", "lead_time_demand", "safety_stock", "reorder_point",
+                   "order_quantity", "alpha", "gamma", "rmse")
+        values = [result[column].tolist() for column in columns]
+        id_list, center_list = ids.tolist(), centers.tolist()
+
+        db.session.query(ReorderSuggestion).delete(synchronize_session=False)
+        for begin in range(0, len(id_list), ForecastService.WRITE_CHUNK_SIZE):
+            end = begin + ForecastService.WRITE_CHUNK_SIZE
+            rows = [
+                dict(zip(columns, row), inventory_id=inventory_id, center_id=center_id, computed_at=computed_at)
+                for inventory_id, center_id, *row in zip(id_list[begin:end], center_list[begin:end],
+                                                         *(column[begin:end] for column in values))
+            ]
+            db.session.execute(insert(ReorderSuggestion), rows)
+        db.session.commit()
+
+    @staticmethod
+    def run_once(now=None):
+        """Chạy dự báo cho mọi vật tư. Trả về thống kê lần chạy"""
+        config = current_app.config
+        now = now or datetime.now()
+        days = int(config.get("FORECAST_HISTORY_DAYS", ForecastService.DEFAULT_HISTORY_DAYS))
+        lead_time_days = int(config.get("FORECAST_LEAD_TIME_DAYS", ForecastService.DEFAULT_LEAD_TIME_DAYS))
+        review_days = int(config.get("FORECAST_REVIEW_DAYS", ForecastService.DEFAULT_REVIEW_DAYS))
+        service_z = float(config.get("FORECAST_SERVICE_LEVEL_Z", ForecastService.DEFAULT_SERVICE_LEVEL_Z))
+
+        started = time.perf_counter()
+        # Chỉ dùng các ngày đã trọn vẹn: cửa sổ kết thúc trước hôm nay
+        start = datetime.combine(now.date() - timedelta(days=days), datetime.min.time())
+        ids, centers, available = ForecastService._load_items()
+        series = ForecastService._load_series(ids, start, days)
+        loaded = time.perf_counter()
+
+        result = ForecastService.compute(series, available, start.weekday(), lead_time_days, review_days, service_z)
+        fitted = time.perf_counter()
+
+        ForecastService._write(ids, centers, result, now)
+        finished = time.perf_counter()
+
+        return {
+            "series": int(len(ids)),
+            "history_days": days,
+            "needs_reorder": int((result["order_quantity"] > 0).sum()),
+            "load_ms": round((loaded - started) * 1000, 1),
+            "fit_ms": round((fitted - loaded) * 1000, 1),
+            "write_ms": round((finished - fitted) * 1000, 1)
+        }
+
+    @staticmethod
+    def get_suggestions(center_id=None, needs_reorder=False, after_id=0, limit=500):
+        """Gợi ý đặt hàng kèm thông tin vật tư, phân trang keyset theo inventory_id"""
+        query = db.session.query(ReorderSuggestion, Inventory).join(
+            Inventory, Inventory.id == ReorderSuggestion.inventory_id
+        ).filter(ReorderSuggestion.inventory_id > after_id)
+        if center_id is not None:
+            query = query.filter(ReorderSuggestion.center_id == center_id)
+        if needs_reorder:
+            query = query.filter(ReorderSuggestion.order_quantity > 0)
+
+        suggestions = []
+        for suggestion, item in query.order_by(ReorderSuggestion.inventory_id).limit(limit):
+            data = suggestion.to_dict()
+            data.update({
+                "part_number": item.part_number,
+                "name": item.name,
+                "quantity": item.quantity,
+                "available_quantity": item.quantity - (item.reserved_quantity or 0),
+                "min_quantity": item.min_quantity
+            })
+            suggestions.append(data)
+        return suggestions
+
+    @staticmethod
+    def start_forecast_loop(app, run_hour=2, check_interval_seconds=600):
+        """Chạy dự báo mỗi đêm (sau run_hour giờ) trong thread nền; bỏ qua nếu hôm nay đã có worker chạy"""
+        def loop():
+            while True:
+                time.sleep(check_interval_seconds)
+                now = datetime.now()
+                if now.hour < run_hour:
+                    continue
+                with app.app_context():
+                    try:
+                        last_run = db.session.query(func.max(ReorderSuggestion.computed_at)).scalar()
+                        if last_run and last_run.date() >= now.date():
+                            continue
+                        stats = ForecastService.run_once(now)
+                        app.logger.info(f"Forecast job: {stats}")
+                    except Exception as e:
+                        app.logger.error(f"Forecast job error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
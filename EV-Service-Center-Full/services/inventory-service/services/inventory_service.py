@@ -1,14 +1,12 @@
 import requests
 import os
 from app import db
-from models.inventory_model import Inventory, InventoryCompatibility
-from sqlalchemy import and_
-
-# Cố gắng import NotificationHelper
-try:
-    from helpers.notification_helper import NotificationHelper
-except ImportError:
-    NotificationHelper = None
+from models.inventory_model import Inventory, InventoryCompatibility, InventoryMovement, InventoryVehicleModel
+from services.compatibility_index import CompatibilityIndex
+from services.item_cache import ItemCache
+from services.stock_alert_service import StockAlertService
+from services.stock_view_service import StockViewService
+from sqlalchemy import and_, insert, update
 
 class InventoryService:
     """Service xử lý logic nghiệp vụ liên quan đến Inventory"""
@@ -62,6 +60,16 @@ class InventoryService:
 
         try:
             db.session.add(new_item)
+            db.session.flush()
+            if new_item.quantity:
+                InventoryService._record_movements([{
+                    "inventory_id": new_item.id,
+                    "center_id": new_item.center_id,
+                    "delta": new_item.quantity,
+                    "quantity_after": new_item.quantity,
+                    "reason": "initial"
+                }])
+            StockViewService.apply_deltas([{"part_number": new_item.part_number, "quantity": new_item.quantity, "centers": 1}])
             db.session.commit()
             
             comp_models = data.get("compatible_models")
@@ -73,8 +81,10 @@ class InventoryService:
                     category=category
                 )
                 db.session.add(new_comp)
+                InventoryService._sync_vehicle_models(new_item.id, comp_models)
                 db.session.commit()
 
+            CompatibilityIndex.invalidate()
             return new_item, None
         except Exception as e:
             db.session.rollback()
@@ -82,7 +92,11 @@ class InventoryService:
 
     @staticmethod
     def update_item(item_id, data):
-        item = InventoryService.get_item_by_id(item_id)
+        # Khóa dòng khi ghi đè số lượng để delta ghi vào sổ cái khớp với giá trị thực tế
+        query = Inventory.query.filter_by(id=item_id)
+        if "quantity" in data:
+            query = query.with_for_update()
+        item = query.first()
         if not item:
             return None, "Không tìm thấy vật tư"
         
@@ -102,50 +116,286 @@ class InventoryService:
                     comp = InventoryCompatibility(inventory_id=item_id)
                     db.session.add(comp)
                 
-                if "compatible_models" in data: comp.compatible_models = data["compatible_models"]
+                if "compatible_models" in data:
+                    comp.compatible_models = data["compatible_models"]
+                    InventoryService._sync_vehicle_models(item_id, data["compatible_models"])
                 if "category" in data: comp.category = data["category"]
 
+            if item.quantity != old_quantity:
+                InventoryService._record_movements([{
+                    "inventory_id": item.id,
+                    "center_id": item.center_id,
+                    "delta": item.quantity - old_quantity,
+                    "quantity_after": item.quantity,
+                    "reason": "set",
+                    "note": data.get("note")
+                }])
+                StockAlertService.record_crossings([{
+                    "item_id": item.id,
+                    "center_id": item.center_id,
+                    "part_number": item.part_number,
+                    "name": item.name,
+                    "old_quantity": old_quantity,
+                    "quantity": item.quantity,
+                    "min_quantity": item.min_quantity
+                }])
+                StockViewService.apply_deltas([{"part_number": item.part_number, "quantity": item.quantity - old_quantity}])
+
             db.session.commit()
-            
-            if NotificationHelper:
-                if item.quantity == 0 and old_quantity > 0:
-                    InventoryService._notify_out_of_stock(item)
-                elif item.quantity < item.min_quantity and old_quantity >= item.min_quantity:
-                    InventoryService._notify_low_stock(item)
-            
+            CompatibilityIndex.invalidate()
+            ItemCache.invalidate([item.id])
             return item, None
         except Exception as e:
             db.session.rollback()
             return None, f"Lỗi cập nhật: {str(e)}"
 
+    @staticmethod
+    def _sync_vehicle_models(inventory_id, compatible_models):
+        """Đồng bộ bảng chuẩn hóa (inventory_id, vehicle_model) từ chuỗi compatible_models (không commit)"""
+        InventoryVehicleModel.query.filter_by(inventory_id=inventory_id).delete(synchronize_session=False)
+        rows = [
+            {"inventory_id": inventory_id, "vehicle_model": model}
+            for model in CompatibilityIndex.split_models(compatible_models)
+        ]
+        if rows:
+            db.session.execute(insert(InventoryVehicleModel), rows)
+
+    @staticmethod
+    def backfill_vehicle_models():
+        """Tạo bảng chuẩn hóa từ dữ liệu compatible_models cũ (chỉ chạy khi bảng còn trống)"""
+        if db.session.query(InventoryVehicleModel.id).first():
+            return 0
+        rows = []
+        for inventory_id, compatible_models in db.session.query(
+            InventoryCompatibility.inventory_id, InventoryCompatibility.compatible_models
+        ).filter(InventoryCompatibility.compatible_models.isnot(None)):
+            rows.extend(
+                {"inventory_id": inventory_id, "vehicle_model": model}
+                for model in CompatibilityIndex.split_models(compatible_models)
+            )
+        # Một vật tư có thể có nhiều dòng compatibility: bỏ trùng trước khi insert
+        rows = list({(r["inventory_id"], r["vehicle_model"]): r for r in rows}.values())
+        if rows:
+            db.session.execute(insert(InventoryVehicleModel), rows)
+            db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _normalize_lines(lines):
+        """Gộp các dòng trùng item_id và kiểm tra số lượng. Trả về (dict item_id -> qty, error)"""
+        merged = {}
+        for line in lines or []:
+            try:
+                item_id = int(line.get("item_id"))
+                quantity = int(line.get("quantity"))
+            except (TypeError, ValueError, AttributeError):
+                return None, f"Dòng không hợp lệ: {line}"
+            if quantity <= 0:
+                return None, f"Số lượng phải lớn hơn 0 (item_id {item_id})"
+            merged[item_id] = merged.get(item_id, 0) + quantity
+        if not merged:
+            return None, "Danh sách vật tư trống"
+        return merged, None
+
+    @staticmethod
+    def _normalize_deltas(lines):
+        """Gộp các dòng {item_id, delta} (delta có dấu, khác 0). Trả về (dict item_id -> delta, error)"""
+        merged = {}
+        for line in lines or []:
+            try:
+                item_id = int(line.get("item_id"))
+                delta = int(line.get("delta"))
+            except (TypeError, ValueError, AttributeError):
+                return None, f"Dòng không hợp lệ: {line}"
+            if delta == 0:
+                return None, f"Delta phải khác 0 (item_id {item_id})"
+            merged[item_id] = merged.get(item_id, 0) + delta
+        merged = {item_id: delta for item_id, delta in merged.items() if delta != 0}
+        if not merged:
+            return None, "Danh sách vật tư trống"
+        return merged, None
+
+    @staticmethod
+    def _record_movements(rows):
+        """Ghi nhiều dòng sổ cái bằng một câu INSERT (trong transaction hiện tại)"""
+        if rows:
+            db.session.execute(insert(InventoryMovement), rows)
+
+    @staticmethod
+    def _apply_deltas(deltas, reason, reference_type=None, reference_id=None, note=None, released=None):
+        """
+        Áp dụng delta có dấu cho nhiều vật tư trong MỘT transaction và ghi sổ cái.
+        Mỗi dòng là một câu UPDATE có điều kiện (delta âm chỉ áp dụng khi số lượng khả dụng
+        quantity - reserved_quantity >= |delta|), nên các consumer đồng thời không làm mất cập nhật
+        của nhau và không cần xếp hàng sau một writer duy nhất; nếu bất kỳ dòng nào không áp dụng
+        được thì rollback toàn bộ.
+        released: item_id -> số lượng giữ chỗ vừa được chuyển thành xuất kho (trừ khỏi reserved_quantity).
+        Trả về (danh sách vật tư sau cập nhật, error, failed_items).
+        """
+        released = released or {}
+        results = []
+        movements = []
+        view_changes = []
+        try:
+            # Khóa theo thứ tự item_id tăng dần để tránh deadlock giữa các batch đồng thời
+            for item_id in sorted(set(deltas) | set(released)):
+                delta = deltas.get(item_id, 0)
+                release = released.get(item_id, 0)
+                statement = update(Inventory).where(Inventory.id == item_id)
+                if delta < 0:
+                    statement = statement.where(Inventory.quantity - Inventory.reserved_quantity + release >= -delta)
+                row = db.session.execute(
+                    statement
+                    .values(quantity=Inventory.quantity + delta, reserved_quantity=Inventory.reserved_quantity - release)
+                    .returning(Inventory.id, Inventory.name, Inventory.part_number, Inventory.price,
+                               Inventory.quantity, Inventory.min_quantity, Inventory.center_id)
+                ).first()
+
+                if row is None:
+                    db.session.rollback()
+                    item = InventoryService.get_item_by_id(item_id)
+                    failed = {"item_id": item_id, "requested": -delta, "available": None}
+                    if not item:
+                        return None, f"Không tìm thấy vật tư ID {item_id}", [failed]
+                    failed["available"] = item.quantity - item.reserved_quantity
+                    return None, f"Tồn kho cho phụ tùng ID {item_id} không đủ. Cần {-delta}, khả dụng {failed['available']}.", [failed]
+
+                view_changes.append({"part_number": row.part_number, "quantity": delta, "reserved": -release})
+                if delta == 0:
+                    continue  # Chỉ nhả giữ chỗ, không đổi tồn kho
+                results.append({
+                    "item_id": row.id,
+                    "name": row.name,
+                    "part_number": row.part_number,
+                    "price": row.price,
+                    "delta": delta,
+                    "remaining_quantity": row.quantity,
+                    "min_quantity": row.min_quantity,
+                    "center_id": row.center_id
+                })
+                movements.append({
+                    "inventory_id": row.id,
+                    "center_id": row.center_id,
+                    "delta": delta,
+                    "quantity_after": row.quantity,
+                    "reason": reason,
+                    "reference_type": reference_type,
+                    "reference_id": reference_id,
+                    "note": note
+                })
+
+            InventoryService._record_movements(movements)
+            # Cảnh báo vượt ngưỡng được ghi cùng transaction, gửi digest bất đồng bộ (StockAlertService)
+            StockAlertService.record_crossings([
+                dict(r, old_quantity=r["remaining_quantity"] - r["delta"], quantity=r["remaining_quantity"])
+                for r in results
+            ])
+            StockViewService.apply_deltas(view_changes)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Lỗi cập nhật tồn kho: {str(e)}", []
+
+        ItemCache.invalidate(set(deltas) | set(released))
+        return results, None, []
+
+    @staticmethod
+    def adjust_items_batch(lines, reference_type=None, reference_id=None, note=None):
+        """Điều chỉnh tồn kho theo delta có dấu ({item_id, delta}). Trả về (items, error, failed_items)"""
+        deltas, error = InventoryService._normalize_deltas(lines)
+        if error:
+            return None, error, []
+        return InventoryService._apply_deltas(deltas, "adjust", reference_type, reference_id, note)
+
+    @staticmethod
+    def deduct_items_batch(lines, reference_type=None, reference_id=None):
+        """
+        Trừ kho nguyên tử cho nhiều vật tư trong MỘT transaction (cho finance-service khi lập hóa đơn).
+        Nếu chứng từ là booking, phần đã giữ chỗ cho booking được dùng trước, phần còn lại lấy từ khả dụng.
+        Trả về (danh sách vật tư kèm giá/tên, error, failed_items).
+        """
+        merged, error = InventoryService._normalize_lines(lines)
+        if error:
+            return None, error, []
+
+        deltas = {item_id: -quantity for item_id, quantity in merged.items()}
+        released = {}
+        if reference_type == "booking" and reference_id:
+            # Giữ chỗ của các task thuộc booking được chuyển thành xuất kho trong cùng transaction
+            from services.reservation_service import ReservationService
+            released = ReservationService.convert_for_booking(reference_id)
+        results, error, failed_items = InventoryService._apply_deltas(
+            deltas, "deduct", reference_type, reference_id, released=released
+        )
+        if error:
+            return None, error, failed_items
+        for r in results:
+            r["quantity_deducted"] = -r.pop("delta")
+        return results, None, []
+
+    @staticmethod
+    def restock_items_batch(lines, reference_type=None, reference_id=None):
+        """
+        Cộng lại tồn kho cho nhiều vật tư trong MỘT transaction (bù trừ cho deduct_items_batch,
+        ví dụ khi saga lập hóa đơn bị hủy giữa chừng). Trả về (danh sách vật tư, error).
+        """
+        merged, error = InventoryService._normalize_lines(lines)
+        if error:
+            return None, error
+
+        results, error, _ = InventoryService._apply_deltas(merged, "restock", reference_type, reference_id)
+        if error:
+            return None, error
+        return [
+            {"item_id": r["item_id"], "quantity_added": r["delta"], "remaining_quantity": r["remaining_quantity"]}
+            for r in results
+        ], None
+
+    @staticmethod
+    def get_movements(item_id=None, reference_type=None, reference_id=None, after_id=0, limit=500):
+        """Đọc sổ cái theo vật tư và/hoặc chứng từ, phân trang keyset theo id"""
+        query = InventoryMovement.query.filter(InventoryMovement.id > after_id)
+        if item_id:
+            query = query.filter(InventoryMovement.inventory_id == item_id)
+        if reference_type:
+            query = query.filter(InventoryMovement.reference_type == reference_type)
+        if reference_id:
+            query = query.filter(InventoryMovement.reference_id == reference_id)
+        return query.order_by(InventoryMovement.id.asc()).limit(limit).all()
+
     @staticmethod
     def delete_item(item_id):
         item = InventoryService.get_item_by_id(item_id)
         if not item:
             return False, "Không tìm thấy vật tư"
 
+        view_change = {
+            "part_number": item.part_number,
+            "quantity": -item.quantity,
+            "reserved": -(item.reserved_quantity or 0),
+            "centers": -1
+        }
         try:
             InventoryCompatibility.query.filter_by(inventory_id=item_id).delete()
+            InventoryVehicleModel.query.filter_by(inventory_id=item_id).delete()
             db.session.delete(item)
+            db.session.flush()
+            StockViewService.apply_deltas([view_change])
             db.session.commit()
+            CompatibilityIndex.invalidate()
+            ItemCache.invalidate([item_id])
             return True, "Đã xóa vật tư thành công"
         except Exception as e:
             db.session.rollback()
             return False, f"Lỗi xóa vật tư: {str(e)}"
     
     @staticmethod
-    def suggest_parts(vehicle_model, category=None):
-        """AI Logic"""
-        query = db.session.query(Inventory).join(InventoryCompatibility, Inventory.id == InventoryCompatibility.inventory_id)
-
-        if category:
-            query = query.filter(InventoryCompatibility.category == category)
-        
-        if vehicle_model:
-            search_term = f"%{vehicle_model}%"
-            query = query.filter(InventoryCompatibility.compatible_models.ilike(search_term))
-        
-        return query.order_by(Inventory.quantity.desc()).all()
+    def suggest_parts(vehicle_model, category=None, limit=None):
+        """
+        AI Logic: phụ tùng tương thích với model xe (so khớp chính xác model đã chuẩn hóa),
+        xếp hạng theo tồn kho khả dụng và lượng tiêu thụ gần đây. Đọc từ chỉ mục trong bộ nhớ.
+        """
+        return CompatibilityIndex.suggest(vehicle_model, category, limit)
 
     @staticmethod
     def seed_demo_data():
@@ -184,23 +434,3 @@ class InventoryService:
                 print(f"✅ Seeded: {data['name']}")
             else:
                 print(f"⏩ Skipped: {data['name']} (Already exists)")
-
-    @staticmethod
-    def _get_admin_user_ids():
-        return [1]
-
-    @staticmethod
-    def _notify_low_stock(item):
-        if not NotificationHelper: return
-        admin_ids = InventoryService._get_admin_user_ids()
-        title = "⚠️ Cảnh báo tồn kho thấp"
-        message = f"Phụ tùng '{item.name}' (#{item.part_number}) tại Chi nhánh {item.center_id} sắp hết (Còn {item.quantity})."
-        NotificationHelper.send_to_multiple_users(admin_ids, "inventory_alert", title, message, "high", "inventory", item.id)
-
-    @staticmethod
-    def _notify_out_of_stock(item):
-        if not NotificationHelper: return
-        admin_ids = InventoryService._get_admin_user_ids()
-        title = "🚨 HẾT HÀNG KHẨN CẤP"
-        message = f"Phụ tùng '{item.name}' (#{item.part_number}) tại Chi nhánh {item.center_id} ĐÃ HẾT HÀNG!"
-        NotificationHelper.send_to_multiple_users(admin_ids, "inventory_alert", title, message, "urgent", "inventory", item.id)
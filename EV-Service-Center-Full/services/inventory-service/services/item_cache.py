@@ -0,0 +1,229 @@
+"""
+Cache đọc-xuyên (read-through) cho vật tư: LRU trong bộ nhớ worker + Redis dùng chung.
+
+Mỗi vật tư có một version stamp trong Redis (inv:item:ver:<id>). Ghi (update_item, delete_item,
+xuất/nhập kho, giữ chỗ) sẽ INCR version sau khi commit, nên các bản cache cũ tự mất hiệu lực
+ở mọi worker mà không cần xóa từng key:
+- LRU cục bộ chỉ dùng khi version của entry bằng version hiện tại
+- Giá trị trong Redis được lưu theo key inv:item:<id>:<version>
+Một lần đọc nhiều vật tư tốn 1 MGET version (+ 1 MGET giá trị nếu LRU trượt) và 1 query DB
+cho phần còn thiếu. Không có Redis: chỉ dùng LRU cục bộ với TTL ngắn.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app
+from models.inventory_model import Inventory, InventoryCompatibility
+
+# Redis là tùy chọn: thiếu thư viện hoặc không kết nối được thì chỉ dùng LRU cục bộ
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_lock = Lock()
+_lru = OrderedDict()  # item_id -> (version, data, cached_at)
+_redis = {"client": None, "checked_at": 0.0}
+_stats = {
+    "local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0, "redis_errors": 0,
+    "served_age_sum": 0.0, "served_age_max": 0.0, "served": 0
+}
+
+
+class ItemCache:
+    """Cache vật tư theo version stamp"""
+
+    LRU_SIZE = 5000
+    REDIS_TTL_SECONDS = 3600
+    LOCAL_TTL_SECONDS = 5  # Chỉ áp dụng khi không có Redis (giới hạn độ cũ giữa các worker)
+    RECONNECT_SECONDS = 30
+    VERSION_KEY = "inv:item:ver:{}"
+    VALUE_KEY = "inv:item:{}:{}"
+
+    # ===== REDIS =====
+    @staticmethod
+    def _client():
+        if redis is None:
+            return None
+        if _redis["client"] is None and time.monotonic() - _redis["checked_at"] >= ItemCache.RECONNECT_SECONDS:
+            _redis["checked_at"] = time.monotonic()
+            try:
+                client = redis.from_url(
+                    current_app.config.get("REDIS_URL") or "redis://redis:6379",
+                    socket_timeout=0.2, socket_connect_timeout=0.2
+                )
+                client.ping()
+                _redis["client"] = client
+            except Exception as e:
+                current_app.logger.warning(f"Item cache: không kết nối được Redis, chỉ dùng LRU cục bộ ({e})")
+        return _redis["client"]
+
+    @staticmethod
+    def _redis_failed(e):
+        _stats["redis_errors"] += 1
+        _redis["client"] = None
+        _redis["checked_at"] = time.monotonic()
+        current_app.logger.warning(f"Item cache: lỗi Redis ({e})")
+
+    # ===== LRU CỤC BỘ =====
+    @staticmethod
+    def _local_get(item_id, version):
+        with _lock:
+            entry = _lru.get(item_id)
+            if entry is None or entry[0] != version:
+                return None
+            if version is None and time.time() - entry[2] > ItemCache.LOCAL_TTL_SECONDS:
+                return None
+            _lru.move_to_end(item_id)
+            return entry
+
+    @staticmethod
+    def _local_put(item_id, version, data, cached_at):
+        with _lock:
+            _lru[item_id] = (version, data, cached_at)
+            _lru.move_to_end(item_id)
+            while len(_lru) > ItemCache.LRU_SIZE:
+                _lru.popitem(last=False)
+
+    @staticmethod
+    def _record_hit(kind, cached_at):
+        age = max(time.time() - cached_at, 0.0)
+        _stats[kind] += 1
+        _stats["served"] += 1
+        _stats["served_age_sum"] += age
+        _stats["served_age_max"] = max(_stats["served_age_max"], age)
+
+    # ===== ĐỌC =====
+    @staticmethod
+    def _load_from_db(item_ids):
+        items = Inventory.query.filter(Inventory.id.in_(item_ids)).all()
+        compat = {
+            c.inventory_id: c
+            for c in InventoryCompatibility.query.filter(InventoryCompatibility.inventory_id.in_(item_ids))
+        }
+        result = {}
+        for item in items:
+            data = item.to_dict()
+            comp = compat.get(item.id)
+            data["compatible_models"] = comp.compatible_models if comp else None
+            data["category"] = comp.category if comp else None
+            result[item.id] = data
+        return result
+
+    @staticmethod
+    def get_many(item_ids):
+        """Trả về dict item_id -> dict vật tư (kèm compatibility); id không tồn tại sẽ không có trong dict"""
+        item_ids = list(dict.fromkeys(int(i) for i in item_ids))
+        if not item_ids:
+            return {}
+
+        client = ItemCache._client()
+        versions = {}
+        if client is not None:
+            try:
+                raw = client.mget([ItemCache.VERSION_KEY.format(i) for i in item_ids])
+                versions = {i: int(v) if v is not None else 0 for i, v in zip(item_ids, raw)}
+            except Exception as e:
+                ItemCache._redis_failed(e)
+                client = None
+        if client is None:
+            versions = {i: None for i in item_ids}
+
+        found = {}
+        pending = []
+        for item_id in item_ids:
+            entry = ItemCache._local_get(item_id, versions[item_id])
+            if entry:
+                found[item_id] = entry[1]
+                ItemCache._record_hit("local_hits", entry[2])
+            else:
+                pending.append(item_id)
+
+        if pending and client is not None:
+            try:
+                raw = client.mget([ItemCache.VALUE_KEY.format(i, versions[i]) for i in pending])
+                still_pending = []
+                for item_id, value in zip(pending, raw):
+                    if value is None:
+                        still_pending.append(item_id)
+                        continue
+                    payload = json.loads(value)
+                    found[item_id] = payload["data"]
+                    ItemCache._local_put(item_id, versions[item_id], payload["data"], payload["cached_at"])
+                    ItemCache._record_hit("redis_hits", payload["cached_at"])
+                pending = still_pending
+            except Exception as e:
+                ItemCache._redis_failed(e)
+                client = None
+
+        if pending:
+            _stats["misses"] += len(pending)
+            loaded = ItemCache._load_from_db(pending)
+            cached_at = time.time()
+            pipe = client.pipeline(transaction=False) if client is not None else None
+            for item_id, data in loaded.items():
+                found[item_id] = data
+                ItemCache._local_put(item_id, versions[item_id], data, cached_at)
+                if pipe is not None:
+                    pipe.setex(
+                        ItemCache.VALUE_KEY.format(item_id, versions[item_id]),
+                        ItemCache.REDIS_TTL_SECONDS,
+                        json.dumps({"data": data, "cached_at": cached_at})
+                    )
+            if pipe is not None:
+                try:
+                    pipe.execute()
+                except Exception as e:
+                    ItemCache._redis_failed(e)
+
+        return found
+
+    @staticmethod
+    def get(item_id):
+        return ItemCache.get_many([item_id]).get(int(item_id))
+
+    # ===== GHI =====
+    @staticmethod
+    def invalidate(item_ids):
+        """Gọi SAU khi commit: tăng version của các vật tư để mọi bản cache cũ mất hiệu lực"""
+        item_ids = list(dict.fromkeys(int(i) for i in item_ids))
+        if not item_ids:
+            return
+        _stats["invalidations"] += len(item_ids)
+        with _lock:
+            for item_id in item_ids:
+                _lru.pop(item_id, None)
+
+        client = ItemCache._client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for item_id in item_ids:
+                pipe.incr(ItemCache.VERSION_KEY.format(item_id))
+            pipe.execute()
+        except Exception as e:
+            ItemCache._redis_failed(e)
+
+    # ===== METRICS =====
+    @staticmethod
+    def stats():
+        hits = _stats["local_hits"] + _stats["redis_hits"]
+        lookups = hits + _stats["misses"]
+        return {
+            "pid": os.getpid(),
+            "redis_connected": _redis["client"] is not None,
+            "lru_size": len(_lru),
+            "lookups": lookups,
+            "local_hits": _stats["local_hits"],
+            "redis_hits": _stats["redis_hits"],
+            "misses": _stats["misses"],
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "invalidations": _stats["invalidations"],
+            "redis_errors": _stats["redis_errors"],
+            # Độ cũ (giây) của dữ liệu trả về từ cache, tính từ lúc đọc DB
+            "staleness_avg_seconds": round(_stats["served_age_sum"] / _stats["served"], 3) if _stats["served"] else None,
+            "staleness_max_seconds": round(_stats["served_age_max"], 3)
+        }
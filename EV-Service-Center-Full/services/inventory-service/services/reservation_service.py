@@ -0,0 +1,201 @@
+"""
+Giữ chỗ vật tư có thời hạn cho task bảo dưỡng.
+
+Số lượng khả dụng = quantity - reserved_quantity, trong đó reserved_quantity là bộ đếm được
+cập nhật trong cùng transaction với bảng stock_reservations. Vì vậy kiểm tra khả dụng luôn là
+O(1) mỗi vật tư, không phụ thuộc số reservation đang mở.
+
+Vòng đời: active -> converted (lập hóa đơn) | released (hủy task / bỏ phụ tùng) | expired (hết TTL).
+Mọi chuyển trạng thái đều là UPDATE theo tập (... WHERE status = 'active' RETURNING), sau đó
+trừ bộ đếm theo tổng từng vật tư.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from app import db
+from models.inventory_model import Inventory, StockReservation
+from services.inventory_service import InventoryService
+from services.item_cache import ItemCache
+from services.stock_view_service import StockViewService
+
+
+class ReservationService:
+    """Service giữ chỗ vật tư"""
+
+    DEFAULT_TTL_SECONDS = 24 * 3600
+    SWEEP_BATCH_SIZE = 1000
+
+    @staticmethod
+    def reserve(lines, reference_type, reference_id, booking_id=None, ttl_seconds=None):
+        """
+        Giữ chỗ nhiều vật tư trong MỘT transaction, tất cả hoặc không.
+        Trả về (danh sách reservation, error, failed_items).
+        """
+        merged, error = InventoryService._normalize_lines(lines)
+        if error:
+            return None, error, []
+        if not reference_type or not reference_id:
+            return None, "Thiếu reference_type hoặc reference_id", []
+
+        ttl = int(ttl_seconds or current_app.config.get("RESERVATION_TTL_SECONDS", ReservationService.DEFAULT_TTL_SECONDS))
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+        reservations = []
+        view_changes = []
+        try:
+            # Khóa theo thứ tự item_id tăng dần (giống _apply_deltas) để tránh deadlock
+            for item_id in sorted(merged):
+                quantity = merged[item_id]
+                row = db.session.execute(
+                    update(Inventory)
+                    .where(Inventory.id == item_id, Inventory.quantity - Inventory.reserved_quantity >= quantity)
+                    .values(reserved_quantity=Inventory.reserved_quantity + quantity)
+                    .returning(Inventory.id, Inventory.part_number)
+                ).first()
+
+                if row is None:
+                    db.session.rollback()
+                    item = InventoryService.get_item_by_id(item_id)
+                    if not item:
+                        return None, f"Không tìm thấy vật tư ID {item_id}", [{"item_id": item_id, "requested": quantity, "available": None}]
+                    available = item.quantity - item.reserved_quantity
+                    return None, f"Số lượng vượt quá tồn kho. Có sẵn: {available}", [
+                        {"item_id": item_id, "requested": quantity, "available": available}
+                    ]
+
+                view_changes.append({"part_number": row.part_number, "reserved": quantity})
+                reservations.append(StockReservation(
+                    inventory_id=item_id,
+                    quantity=quantity,
+                    status="active",
+                    reference_type=reference_type,
+                    reference_id=reference_id,
+                    booking_id=booking_id,
+                    expires_at=expires_at
+                ))
+
+            db.session.add_all(reservations)
+            StockViewService.apply_deltas(view_changes)
+            db.session.commit()
+            ItemCache.invalidate(merged)
+            return reservations, None, []
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Lỗi giữ chỗ vật tư: {str(e)}", []
+
+    @staticmethod
+    def _close(conditions, new_status, limit=None):
+        """
+        Đóng các reservation active thỏa điều kiện (set-based) và trừ bộ đếm reserved_quantity.
+        Không commit. Trả về dict inventory_id -> tổng số lượng đã đóng.
+        """
+        target = StockReservation.id.in_(
+            db.session.query(StockReservation.id)
+            .filter(StockReservation.status == "active", *conditions)
+            .order_by(StockReservation.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        ) if limit else StockReservation.status == "active"
+
+        rows = db.session.execute(
+            update(StockReservation)
+            .where(target, *conditions)
+            .values(status=new_status, updated_at=datetime.now())
+            .returning(StockReservation.inventory_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        totals = {}
+        for inventory_id, quantity in rows:
+            totals[inventory_id] = totals.get(inventory_id, 0) + quantity
+        return totals
+
+    @staticmethod
+    def _decrement_reserved(totals):
+        """Trừ bộ đếm giữ chỗ và cập nhật view liên chi nhánh của các mã bị ảnh hưởng (không commit)"""
+        view_changes = []
+        for inventory_id in sorted(totals):
+            part_number = db.session.execute(
+                update(Inventory)
+                .where(Inventory.id == inventory_id)
+                .values(reserved_quantity=Inventory.reserved_quantity - totals[inventory_id])
+                .returning(Inventory.part_number)
+            ).scalar()
+            view_changes.append({"part_number": part_number, "reserved": -totals[inventory_id]})
+        StockViewService.apply_deltas(view_changes)
+
+    @staticmethod
+    def release(reference_type, reference_id, item_id=None):
+        """Nhả giữ chỗ của một chứng từ (hủy task / bỏ phụ tùng). Trả về (dict item_id -> số lượng, error)"""
+        conditions = [StockReservation.reference_type == reference_type, StockReservation.reference_id == reference_id]
+        if item_id:
+            conditions.append(StockReservation.inventory_id == item_id)
+        try:
+            totals = ReservationService._close(conditions, "released")
+            ReservationService._decrement_reserved(totals)
+            db.session.commit()
+            ItemCache.invalidate(totals)
+            return totals, None
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Lỗi nhả giữ chỗ: {str(e)}"
+
+    @staticmethod
+    def convert_for_booking(booking_id):
+        """
+        Chuyển mọi giữ chỗ active của booking sang 'converted' (không commit, chạy trong transaction
+        xuất kho của deduct_items_batch). Trả về dict item_id -> số lượng đã giữ chỗ.
+        """
+        return ReservationService._close([StockReservation.booking_id == booking_id], "converted")
+
+    @staticmethod
+    def expire(now=None, batch_size=None):
+        """Dọn các giữ chỗ hết hạn theo lô. Trả về số vật tư-lượt đã nhả"""
+        now = now or datetime.now()
+        batch_size = batch_size or ReservationService.SWEEP_BATCH_SIZE
+        expired = 0
+        while True:
+            totals = ReservationService._close([StockReservation.expires_at < now], "expired", limit=batch_size)
+            ReservationService._decrement_reserved(totals)
+            db.session.commit()
+            if not totals:
+                break
+            ItemCache.invalidate(totals)
+            expired += sum(totals.values())
+        return expired
+
+    @staticmethod
+    def get_reservations(reference_type=None, reference_id=None, booking_id=None, status="active"):
+        query = StockReservation.query
+        if reference_type:
+            query = query.filter(StockReservation.reference_type == reference_type)
+        if reference_id:
+            query = query.filter(StockReservation.reference_id == reference_id)
+        if booking_id:
+            query = query.filter(StockReservation.booking_id == booking_id)
+        if status:
+            query = query.filter(StockReservation.status == status)
+        return query.order_by(StockReservation.id.asc()).all()
+
+    @staticmethod
+    def start_expiry_loop(app, interval_seconds=60):
+        """Chạy job dọn giữ chỗ hết hạn định kỳ trong thread nền của worker"""
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                with app.app_context():
+                    try:
+                        expired = ReservationService.expire()
+                        if expired:
+                            app.logger.info(f"Đã nhả {expired} vật tư giữ chỗ hết hạn")
+                    except Exception as e:
+                        app.logger.error(f"Reservation expiry error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,208 @@
+"""
+Cảnh báo tồn kho thấp / hết hàng dạng digest.
+
+Khi số lượng vật tư vượt ngưỡng (xuất kho, sửa số lượng, nhập danh mục), một dòng stock_alerts
+được ghi TRONG CÙNG transaction với thay đổi tồn kho: không có lời gọi HTTP nào trên đường ghi.
+Job nền chạy mỗi STOCK_ALERT_WINDOW_SECONDS giây:
+1. Nhận (claim) các sự kiện chưa gửi theo lô (UPDATE ... SKIP LOCKED ... RETURNING)
+2. Gộp theo chi nhánh, mỗi vật tư một dòng theo số lượng HIỆN TẠI (một query cho cả lô):
+   vật tư đã được nhập bù trong cửa sổ thì bỏ qua
+3. Mỗi admin nhận MỘT digest, tất cả gửi bằng một lời gọi bulk. Gửi lỗi thì nhả claim.
+"""
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, update
+from app import db
+from models.inventory_model import Inventory, StockAlert
+from services.notification_helper import NotificationHelper
+
+
+class StockAlertService:
+    """Service ghi nhận và gửi digest cảnh báo tồn kho"""
+
+    DEFAULT_WINDOW_SECONDS = 60
+    NOTIFY_BATCH_SIZE = 500
+    MAX_ITEMS_IN_MESSAGE = 10
+
+    @staticmethod
+    def _admin_user_ids():
+        return [1]
+
+    @staticmethod
+    def crossing(old_quantity, new_quantity, min_quantity):
+        """Loại ngưỡng vừa bị vượt xuống ('out_of_stock' / 'low_stock') hoặc None"""
+        if new_quantity == 0 and old_quantity > 0:
+            return "out_of_stock"
+        if new_quantity < min_quantity <= old_quantity:
+            return "low_stock"
+        return None
+
+    @staticmethod
+    def record_crossings(changes):
+        """
+        Ghi sự kiện cho các vật tư vừa vượt ngưỡng (không commit, chạy trong transaction của thay đổi tồn kho).
+        changes: danh sách dict {item_id, center_id, part_number, name, old_quantity, quantity, min_quantity}
+        """
+        rows = []
+        for change in changes:
+            alert_type = StockAlertService.crossing(change["old_quantity"], change["quantity"], change["min_quantity"])
+            if alert_type:
+                rows.append({
+                    "inventory_id": change["item_id"],
+                    "center_id": change["center_id"],
+                    "alert_type": alert_type,
+                    "part_number": change["part_number"],
+                    "name": change["name"],
+                    "quantity": change["quantity"],
+                    "min_quantity": change["min_quantity"]
+                })
+        if rows:
+            db.session.execute(insert(StockAlert), rows)
+        return len(rows)
+
+    # ===== GỬI DIGEST =====
+    @staticmethod
+    def _claim_pending(now, limit):
+        candidates = db.session.query(StockAlert.id).filter(
+            StockAlert.notified_at.is_(None)
+        ).order_by(StockAlert.id).limit(limit).with_for_update(skip_locked=True).scalar_subquery()
+
+        rows = db.session.execute(
+            update(StockAlert)
+            .where(StockAlert.id.in_(candidates))
+            .values(notified_at=now)
+            .returning(StockAlert.id, StockAlert.inventory_id, StockAlert.center_id, StockAlert.alert_type,
+                       StockAlert.part_number, StockAlert.name, StockAlert.quantity, StockAlert.min_quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return rows
+
+    @staticmethod
+    def _release_claim(alert_ids):
+        db.session.execute(
+            update(StockAlert)
+            .where(StockAlert.id.in_(alert_ids))
+            .values(notified_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    @staticmethod
+    def _current_levels(alerts):
+        """Trạng thái hiện tại của các vật tư trong lô; vật tư đã hồi phục trên ngưỡng bị loại"""
+        latest = {}
+        for alert in sorted(alerts, key=lambda a: a.id):
+            latest[alert.inventory_id] = alert._asdict()
+
+        for inventory_id, quantity, min_quantity in db.session.query(
+            Inventory.id, Inventory.quantity, Inventory.min_quantity
+        ).filter(Inventory.id.in_(list(latest))):
+            latest[inventory_id].update(quantity=quantity, min_quantity=min_quantity)
+
+        levels = []
+        for alert in latest.values():
+            if alert["quantity"] >= alert["min_quantity"] and alert["quantity"] > 0:
+                continue
+            alert["alert_type"] = "out_of_stock" if alert["quantity"] <= 0 else "low_stock"
+            levels.append(alert)
+        return levels
+
+    @staticmethod
+    def _describe(alerts, label, with_quantity):
+        shown = alerts[:StockAlertService.MAX_ITEMS_IN_MESSAGE]
+        parts = [
+            f"'{a['name']}' (#{a['part_number']}" + (f", còn {a['quantity']}/{a['min_quantity']})" if with_quantity else ")")
+            for a in shown
+        ]
+        more = len(alerts) - len(shown)
+        return f"{label}: " + ", ".join(parts) + (f" và {more} vật tư khác" if more > 0 else "")
+
+    @staticmethod
+    def build_digests(levels, admin_ids):
+        """Một thông báo cho mỗi admin, nội dung gộp theo chi nhánh (levels: kết quả _current_levels)"""
+        if not levels:
+            return []
+        by_center = {}
+        for alert in levels:
+            by_center.setdefault(alert["center_id"], {"out_of_stock": [], "low_stock": []})[alert["alert_type"]].append(alert)
+
+        lines = []
+        metadata = {}
+        for center_id in sorted(by_center):
+            groups = by_center[center_id]
+            segments = []
+            if groups["out_of_stock"]:
+                segments.append(StockAlertService._describe(groups["out_of_stock"], "HẾT HÀNG", False))
+            if groups["low_stock"]:
+                segments.append(StockAlertService._describe(groups["low_stock"], "Sắp hết", True))
+            lines.append(f"Chi nhánh {center_id} - " + "; ".join(segments))
+            metadata[str(center_id)] = {
+                alert_type: [a["inventory_id"] for a in group] for alert_type, group in groups.items()
+            }
+
+        out_count = sum(len(g["out_of_stock"]) for g in by_center.values())
+        low_count = sum(len(g["low_stock"]) for g in by_center.values())
+        title = "🚨 HẾT HÀNG KHẨN CẤP" if out_count else "⚠️ Cảnh báo tồn kho thấp"
+        if out_count and low_count:
+            title = f"🚨 Tồn kho: {out_count} hết hàng, {low_count} sắp hết"
+        single = levels[0] if len(levels) == 1 else None
+
+        return [{
+            "user_id": admin_id,
+            "notification_type": "inventory_alert",
+            "title": title,
+            "message": "\n".join(lines),
+            "channel": "in_app",
+            "priority": "urgent" if out_count else "high",
+            "related_entity_type": "inventory",
+            "related_entity_id": single["inventory_id"] if single else None,
+            "metadata": {"centers": metadata}
+        } for admin_id in admin_ids]
+
+    @staticmethod
+    def flush(now=None, batch_size=None):
+        """Gửi digest cho các sự kiện chưa gửi. Trả về số sự kiện đã gửi"""
+        now = now or datetime.now()
+        batch_size = batch_size or StockAlertService.NOTIFY_BATCH_SIZE
+        admin_ids = StockAlertService._admin_user_ids()
+        sent = 0
+        while True:
+            alerts = StockAlertService._claim_pending(now, batch_size)
+            if not alerts:
+                break
+            digests = StockAlertService.build_digests(StockAlertService._current_levels(alerts), admin_ids)
+            result = NotificationHelper.send_bulk(digests)
+            if not result.get("success"):
+                StockAlertService._release_claim([alert.id for alert in alerts])
+                current_app.logger.warning(f"Gửi digest tồn kho thất bại, sẽ thử lại ({len(alerts)} sự kiện)")
+                break
+            sent += len(alerts)
+            if len(alerts) < batch_size:
+                break
+        return sent
+
+    @staticmethod
+    def start_alert_loop(app, interval_seconds=None):
+        """Gửi digest định kỳ (mỗi cửa sổ gom) trong thread nền của worker"""
+        interval_seconds = interval_seconds or StockAlertService.DEFAULT_WINDOW_SECONDS
+
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                with app.app_context():
+                    try:
+                        sent = StockAlertService.flush()
+                        if sent:
+                            app.logger.info(f"Đã gửi digest cho {sent} cảnh báo tồn kho")
+                    except Exception as e:
+                        app.logger.error(f"Stock alert digest error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
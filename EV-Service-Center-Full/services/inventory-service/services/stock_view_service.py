@@ -0,0 +1,262 @@
+"""
+Tồn kho liên chi nhánh theo mã phụ tùng và gợi ý điều chuyển.
+
+part_stock_view giữ sẵn, cho mỗi part_number, tổng tồn kho / giữ chỗ / khả dụng và số chi nhánh.
+Mọi thay đổi tồn kho gọi apply_deltas() TRƯỚC khi commit với delta có dấu của các mã bị ảnh hưởng:
+một câu upsert cộng dồn (total = total + delta) cho cả lô, không đọc lại bảng inventory và không
+khóa trước dòng view. Hai transaction cùng cập nhật một mã ở hai chi nhánh chỉ cộng dồn vào nhau,
+không ghi đè kết quả của nhau; khóa dòng do chính câu upsert giữ, lấy sau khóa dòng inventory và
+theo thứ tự part_number, nên không tạo vòng chờ giữa các transaction.
+
+Chi tiết từng chi nhánh đọc thẳng từ inventory theo unique index (part_number, center_id): số dòng
+= số chi nhánh có mã đó, không quét bảng. Khoảng cách giữa các chi nhánh lấy từ tọa độ
+ServiceCenter của booking-service (cache trong bộ nhớ).
+"""
+import math
+import os
+import time
+import requests
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from models.inventory_model import Inventory, PartStock, ReorderSuggestion
+
+_centers_cache = {"loaded_at": 0.0, "centers": {}}
+
+
+class StockViewService:
+    """Service view tồn kho liên chi nhánh"""
+
+    CENTERS_TTL_SECONDS = 600
+    MAX_DEFICIT_PARTS = 200
+
+    # ===== CẬP NHẬT VIEW =====
+    @staticmethod
+    def _delta_statement():
+        insert_fn = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+        table = PartStock.__table__
+        stmt = insert_fn(table)
+        return stmt.on_conflict_do_update(
+            index_elements=[PartStock.part_number],
+            set_={
+                "total_quantity": table.c.total_quantity + stmt.excluded.total_quantity,
+                "total_reserved": table.c.total_reserved + stmt.excluded.total_reserved,
+                "total_available": table.c.total_available + stmt.excluded.total_available,
+                "center_count": table.c.center_count + stmt.excluded.center_count,
+                "updated_at": func.now(),
+            }
+        )
+
+    @staticmethod
+    def apply_deltas(changes):
+        """
+        Cộng delta có dấu vào dòng view của các mã (không commit, chạy trong transaction của thay đổi tồn kho).
+        changes: các dict {part_number, quantity, reserved, centers}; khóa thiếu coi như 0.
+        """
+        totals = {}
+        for change in changes:
+            if not change.get("part_number"):
+                continue
+            total = totals.setdefault(change["part_number"], [0, 0, 0])
+            total[0] += change.get("quantity", 0)
+            total[1] += change.get("reserved", 0)
+            total[2] += change.get("centers", 0)
+
+        rows = [{
+            "part_number": part,
+            "total_quantity": quantity,
+            "total_reserved": reserved,
+            "total_available": quantity - reserved,
+            "center_count": centers
+        } for part, (quantity, reserved, centers) in sorted(totals.items()) if quantity or reserved or centers]
+        if not rows:
+            return
+
+        db.session.execute(StockViewService._delta_statement(), rows)
+        emptied = [row["part_number"] for row in rows if row["center_count"] < 0]
+        if emptied:
+            # Mã không còn ở chi nhánh nào
+            PartStock.query.filter(
+                PartStock.part_number.in_(emptied), PartStock.center_count <= 0
+            ).delete(synchronize_session=False)
+
+    @staticmethod
+    def backfill():
+        """Dựng view lần đầu từ bảng inventory bằng một câu GROUP BY (chỉ chạy khi view còn trống)"""
+        if db.session.query(PartStock.id).first():
+            return 0
+        rows = [{
+            "part_number": part,
+            "total_quantity": int(quantity or 0),
+            "total_reserved": int(reserved or 0),
+            "total_available": int(quantity or 0) - int(reserved or 0),
+            "center_count": center_count
+        } for part, quantity, reserved, center_count in db.session.query(
+            Inventory.part_number,
+            func.sum(Inventory.quantity),
+            func.sum(Inventory.reserved_quantity),
+            func.count(Inventory.id)
+        ).group_by(Inventory.part_number)]
+        if rows:
+            db.session.execute(PartStock.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _center_rows(parts):
+        """Tồn kho từng chi nhánh của các mã, theo unique index (part_number, center_id)"""
+        by_part = {part: [] for part in parts}
+        if not by_part:
+            return by_part
+        for row in db.session.query(
+            Inventory.id, Inventory.part_number, Inventory.center_id, Inventory.quantity,
+            Inventory.reserved_quantity, Inventory.min_quantity
+        ).filter(Inventory.part_number.in_(list(by_part))).order_by(Inventory.part_number, Inventory.center_id):
+            reserved = row.reserved_quantity or 0
+            by_part[row.part_number].append({
+                "center_id": row.center_id,
+                "inventory_id": row.id,
+                "quantity": row.quantity,
+                "reserved_quantity": reserved,
+                "available_quantity": row.quantity - reserved,
+                "min_quantity": row.min_quantity
+            })
+        return by_part
+
+    # ===== CHI NHÁNH =====
+    @staticmethod
+    def _centers():
+        """center_id -> {name, latitude, longitude} từ booking-service, cache CENTERS_TTL_SECONDS giây"""
+        if time.monotonic() - _centers_cache["loaded_at"] < StockViewService.CENTERS_TTL_SECONDS:
+            return _centers_cache["centers"]
+        _centers_cache["loaded_at"] = time.monotonic()
+        try:
+            response = requests.get(
+                f"{current_app.config.get('BOOKING_SERVICE_URL', 'http://booking-service:8001')}/internal/bookings/centers",
+                headers={"X-Internal-Token": os.getenv("INTERNAL_SERVICE_TOKEN")},
+                timeout=3
+            )
+            if response.status_code == 200:
+                _centers_cache["centers"] = {
+                    c["id"]: {"name": c.get("name"), "latitude": c.get("latitude"), "longitude": c.get("longitude")}
+                    for c in response.json()
+                }
+            else:
+                current_app.logger.warning(f"Không lấy được danh sách chi nhánh: {response.status_code}")
+        except Exception as e:
+            current_app.logger.warning(f"Không lấy được danh sách chi nhánh: {str(e)}")
+        return _centers_cache["centers"]
+
+    @staticmethod
+    def _distance_km(centers, from_center_id, to_center_id):
+        """Khoảng cách đường chim bay (haversine); None nếu thiếu tọa độ"""
+        a, b = centers.get(from_center_id), centers.get(to_center_id)
+        if not a or not b or None in (a["latitude"], a["longitude"], b["latitude"], b["longitude"]):
+            return None
+        lat1, lon1, lat2, lon2 = map(math.radians, (a["latitude"], a["longitude"], b["latitude"], b["longitude"]))
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return round(2 * 6371.0 * math.asin(math.sqrt(h)), 1)
+
+    # ===== ĐỌC =====
+    @staticmethod
+    def get_availability(part_number, center_id=None):
+        """Tồn kho của một mã trên mọi chi nhánh; có center_id thì sắp các chi nhánh theo khoảng cách"""
+        view = PartStock.query.filter_by(part_number=part_number).first()
+        if not view:
+            return None
+        data = view.to_dict()
+        data["centers"] = StockViewService._center_rows([part_number])[part_number]
+        centers = StockViewService._centers()
+        for entry in data["centers"]:
+            entry["center_name"] = (centers.get(entry["center_id"]) or {}).get("name")
+            if center_id is not None:
+                entry["distance_km"] = StockViewService._distance_km(centers, center_id, entry["center_id"])
+        if center_id is not None:
+            data["centers"].sort(key=lambda e: (
+                e["center_id"] != center_id,
+                e["distance_km"] is None,
+                e["distance_km"] or 0
+            ))
+        return data
+
+    # ===== GỢI Ý ĐIỀU CHUYỂN =====
+    @staticmethod
+    def _targets(inventory_ids):
+        """Mức tồn mục tiêu: reorder point của job dự báo nếu có, ngược lại min_quantity"""
+        if not inventory_ids:
+            return {}
+        return dict(db.session.query(ReorderSuggestion.inventory_id, ReorderSuggestion.reorder_point).filter(
+            ReorderSuggestion.inventory_id.in_(inventory_ids)
+        ).all())
+
+    @staticmethod
+    def _match(part_number, part_centers, targets, centers, only_center_id=None):
+        """Ghép chi nhánh thiếu với chi nhánh dư gần nhất (tham lam, thiếu nhiều xử lý trước)"""
+        deficits, surpluses = [], []
+        for entry in part_centers:
+            target = targets.get(entry["inventory_id"], entry["min_quantity"])
+            gap = entry["available_quantity"] - target
+            if gap < 0 and (only_center_id is None or entry["center_id"] == only_center_id):
+                deficits.append([entry, -gap])
+            elif gap > 0:
+                surpluses.append([entry, gap])
+
+        transfers, unmet = [], []
+        for deficit, need in sorted(deficits, key=lambda d: -d[1]):
+            candidates = sorted(surpluses, key=lambda s: (
+                StockViewService._distance_km(centers, deficit["center_id"], s[0]["center_id"]) is None,
+                StockViewService._distance_km(centers, deficit["center_id"], s[0]["center_id"]) or 0,
+                -s[1]
+            ))
+            for surplus in candidates:
+                if need <= 0:
+                    break
+                quantity = min(need, surplus[1])
+                if quantity <= 0:
+                    continue
+                surplus[1] -= quantity
+                need -= quantity
+                transfers.append({
+                    "part_number": part_number,
+                    "from_center_id": surplus[0]["center_id"],
+                    "from_inventory_id": surplus[0]["inventory_id"],
+                    "to_center_id": deficit["center_id"],
+                    "to_inventory_id": deficit["inventory_id"],
+                    "quantity": quantity,
+                    "distance_km": StockViewService._distance_km(centers, surplus[0]["center_id"], deficit["center_id"])
+                })
+            if need > 0:
+                unmet.append({"part_number": part_number, "center_id": deficit["center_id"], "quantity": need})
+        return transfers, unmet
+
+    @staticmethod
+    def suggest_transfers(part_number=None, center_id=None):
+        """
+        Gợi ý điều chuyển cho một mã (mọi chi nhánh thiếu) hoặc cho một chi nhánh (mọi mã đang thiếu).
+        Trả về {"transfers": [...], "unmet": [...]}.
+        """
+        if part_number:
+            parts = [part_number]
+        else:
+            # Các mã đang dưới mức mục tiêu tại chi nhánh (index theo center_id của reorder_suggestions)
+            available = Inventory.quantity - Inventory.reserved_quantity
+            target = func.coalesce(ReorderSuggestion.reorder_point, Inventory.min_quantity)
+            parts = [p for (p,) in db.session.query(Inventory.part_number).outerjoin(
+                ReorderSuggestion, ReorderSuggestion.inventory_id == Inventory.id
+            ).filter(
+                Inventory.center_id == center_id, available < target
+            ).order_by(Inventory.part_number).limit(StockViewService.MAX_DEFICIT_PARTS)]
+
+        by_part = StockViewService._center_rows(parts)
+        inventory_ids = [entry["inventory_id"] for part_centers in by_part.values() for entry in part_centers]
+        targets = StockViewService._targets(inventory_ids)
+        centers = StockViewService._centers()
+
+        transfers, unmet = [], []
+        for part, part_centers in by_part.items():
+            part_transfers, part_unmet = StockViewService._match(part, part_centers, targets, centers, center_id)
+            transfers.extend(part_transfers)
+            unmet.extend(part_unmet)
+        return {"transfers": transfers, "unmet": unmet}
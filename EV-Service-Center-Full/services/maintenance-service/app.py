@@ -33,6 +33,17 @@ def create_app():
     app.config["BOOKING_SERVICE_URL"] = os.getenv("BOOKING_SERVICE_URL")
     app.config["USER_SERVICE_URL"] = os.getenv("USER_SERVICE_URL")
     app.config["INVENTORY_SERVICE_URL"] = os.getenv("INVENTORY_SERVICE_URL")
+    # Timeout (connect, read) theo host cho Internal API
+    app.config["INTERNAL_HTTP_TIMEOUTS"] = {
+        "booking-service": (1.0, 3.0),
+        "user-service": (1.0, 3.0),
+        "inventory-service": (1.0, 5.0),
+    }
+    # Chu kỳ bảo dưỡng định kỳ (mốc nào đến trước thì nhắc)
+    app.config["MAINTENANCE_INTERVAL_DAYS"] = int(os.getenv("MAINTENANCE_INTERVAL_DAYS", 180))
+    app.config["MAINTENANCE_INTERVAL_KM"] = int(os.getenv("MAINTENANCE_INTERVAL_KM", 10000))
+    # Giờ chạy job tổng hợp SLA hằng ngày
+    app.config["SLA_ROLLUP_RUN_HOUR"] = int(os.getenv("SLA_ROLLUP_RUN_HOUR", 1))
     
     # ===== KHỞI TẠO EXTENSIONS =====
     db.init_app(app)
@@ -42,7 +53,7 @@ def create_app():
 
     # ===== IMPORT MODELS & TẠO TABLES =====
     with app.app_context():
-        from models.maintenance_model import MaintenanceTask 
+        from models.maintenance_model import MaintenanceTask, ChecklistTemplate, TaskTransition, TaskSlaDaily, Vehicle
         db.create_all()
 
     # ===== ĐĂNG KÝ BLUEPRINTS (Controllers) =====
@@ -52,6 +63,23 @@ def create_app():
     app.register_blueprint(maintenance_bp)
     app.register_blueprint(internal_bp)
 
+    # ===== JOB NỀN (chỉ chạy trong worker Gunicorn) =====
+    if os.environ.get('GUNICORN_ENV') == 'true':
+        from services.sla_service import TaskSlaService
+        TaskSlaService.start_rollup_loop(app, app.config["SLA_ROLLUP_RUN_HOUR"])
+
+    # ===== CLI COMMAND: Gắn task cũ vào VIN thật (chạy một lần sau khi nâng cấp) =====
+    @app.cli.command("rekey-vehicles")
+    def rekey_vehicles_command():
+        """Lệnh CLI gắn task có mã VIN tạm vào VIN trong User Profile và tạo dòng vehicles"""
+        with app.app_context():
+            from services.vehicle_service import VehicleService
+
+            rekeyed, skipped = VehicleService.rekey_legacy_tasks()
+            print(f"✅ Đã gắn {rekeyed} task vào VIN thật.")
+            if skipped:
+                print(f"⚠️ {len(skipped)} chủ xe chưa có VIN trong Profile (hoặc không lấy được Profile), giữ mã tạm: {skipped}")
+
     # ===== HEALTH CHECK =====
     @app.route("/health", methods=["GET"])
     def health_check():
@@ -4,10 +4,10 @@ Internal API Controller for Maintenance Service
 """
 
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, timedelta
 from functools import wraps
 
 from services.maintenance_service import MaintenanceService as service
+from services.sla_service import TaskSlaService
 
 internal_bp = Blueprint("internal", __name__, url_prefix="/internal/maintenance")
 
@@ -29,15 +29,31 @@ def internal_token_required(f):
     return decorated_function
 
 
+# Danh sách id gửi qua body JSON: 1000 id trong query string vượt giới hạn dòng request của gunicorn (4094 byte)
+MAX_BATCH_IDS = 1000
+# Danh sách id trong query string (GET): giới hạn để dòng request không vượt 4094 byte
+MAX_QUERY_IDS = 300
+
+
+def _json_ids():
+    """Đọc {"ids": [...]} từ body JSON. Trả về (danh sách id đã sắp xếp, không trùng; error)"""
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return None, 'Body phải có dạng {"ids": [3, 5, 8]}'
+    if len(ids) > MAX_BATCH_IDS:
+        return None, f"Tối đa {MAX_BATCH_IDS} id mỗi lần"
+    return sorted(set(ids)), None
+
+
 @internal_bp.route("/due-soon", methods=["GET"])
 @internal_token_required
 def get_maintenance_due_soon():
     """
-    Lấy danh sách xe/task cần bảo dưỡng sớm
+    Lấy danh sách xe có mốc bảo dưỡng định kỳ rơi vào đúng ngày thứ N kể từ hôm nay
 
-    Logic nhắc nhở:
-    - Nhắc trước 7 ngày nếu có scheduled_date
-    - Nhắc khi gần hoàn thành task (status = in_progress và sắp xong)
+    Query params:
+        days: danh sách số ngày, mặc định "7,1"
+        after_id, limit: phân trang keyset theo task_id
 
     Returns:
         {
@@ -46,56 +62,36 @@ def get_maintenance_due_soon():
                 {
                     "id": 1,
                     "user_id": 123,
-                    "vehicle_info": {
-                        "license_plate": "30A-12345",
-                        "brand": "VinFast",
-                        "model": "VF8"
-                    },
-                    "due_date": "2025-12-01T00:00:00",
+                    "vehicle_info": {"vin": "...", "license_plate": "..."},
+                    "due_date": "2025-12-01T08:30:00",
+                    "days_left": 7,
+                    "due_mileage": 25000,
+                    "current_mileage": 15000,
                     "task_type": "Bảo dưỡng định kỳ",
-                    "description": "Kiểm tra hệ thống điện"
+                    "description": "Bảo dưỡng định kỳ"
                 }
-            ]
+            ],
+            "count": 1,
+            "next_after_id": null
         }
     """
     try:
-        # Tính ngày nhắc nhở (7 ngày trước)
-        remind_date = datetime.now() + timedelta(days=7)
-
-        maintenances = []
-
-        # Lấy tất cả tasks có scheduled_date trong 7 ngày tới
-        all_tasks = service.get_all_tasks()  # Giả sử có method này
-
-        for task in all_tasks:
-            # Chỉ nhắc cho tasks chưa hoàn thành
-            if task.status in ['completed', 'cancelled']:
-                continue
-
-            # Kiểm tra scheduled_date
-            if task.scheduled_date:
-                scheduled = datetime.fromisoformat(str(task.scheduled_date)) if isinstance(task.scheduled_date, str) else task.scheduled_date
-
-                # Nhắc nếu trong vòng 7 ngày tới
-                if datetime.now() <= scheduled <= remind_date:
-                    maintenances.append({
-                        "id": task.id,
-                        "user_id": task.user_id,
-                        "vehicle_info": {
-                            "license_plate": task.license_plate or "N/A",
-                            "brand": task.brand or "N/A",
-                            "model": task.model or "N/A"
-                        },
-                        "due_date": scheduled.isoformat(),
-                        "task_type": task.task_type or "Bảo dưỡng",
-                        "description": task.description or "Kiểm tra định kỳ",
-                        "status": task.status
-                    })
+        days = [int(d) for d in request.args.get("days", "7,1").split(",") if d.strip()]
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "Tham số days phải là danh sách số nguyên, ví dụ: 7,1"
+        }), 400
+    after_id = request.args.get("after_id", 0, type=int)
+    limit = min(request.args.get("limit", 500, type=int), 2000)
 
+    try:
+        maintenances = service.get_due_soon(days, after_id, limit)
         return jsonify({
             "success": True,
             "maintenances": maintenances,
-            "count": len(maintenances)
+            "count": len(maintenances),
+            "next_after_id": maintenances[-1]["id"] if len(maintenances) == limit else None
         }), 200
 
     except Exception as e:
@@ -130,18 +126,18 @@ def get_task_info(task_id):
         return jsonify({
             "success": True,
             "task": {
-                "id": task.id,
+                "id": task.task_id,
+                "booking_id": task.booking_id,
                 "user_id": task.user_id,
                 "technician_id": task.technician_id,
-                "license_plate": task.license_plate,
-                "brand": task.brand,
-                "model": task.model,
-                "task_type": task.task_type,
+                "vehicle_vin": task.vehicle_vin,
                 "description": task.description,
-                "status": task.status,
-                "priority": task.priority,
+                "status": str(task.status),
                 "scheduled_date": task.scheduled_date.isoformat() if task.scheduled_date else None,
-                "completed_date": task.completed_date.isoformat() if task.completed_date else None,
+                "completed_date": task.completed_at.isoformat() if task.completed_at else None,
+                "mileage_at_service": task.mileage_at_service,
+                "next_service_due": task.next_service_due.isoformat() if task.next_service_due else None,
+                "next_service_mileage": task.next_service_mileage,
                 "created_at": task.created_at.isoformat() if task.created_at else None
             }
         }), 200
@@ -170,35 +166,127 @@ def get_technician_stats(technician_id):
                 "total_tasks": 10,
                 "completed_tasks": 8,
                 "in_progress_tasks": 2,
+                "pending_tasks": 0,
+                "failed_tasks": 0,
                 "completion_rate": 80.0
             }
         }
     """
     try:
-        all_tasks = service.get_all_tasks()
+        stats = service.get_technician_stats([technician_id])
+        return jsonify({
+            "success": True,
+            "stats": stats[technician_id]
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error in get_technician_stats: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 
-        # Filter tasks by technician_id
-        tech_tasks = [t for t in all_tasks if t.technician_id == technician_id]
+@internal_bp.route("/technicians/stats", methods=["POST"])
+@internal_token_required
+def get_technicians_stats():
+    """
+    Thống kê tasks của nhiều technician trong một query (cho staff-service đồng bộ nhân viên)
 
-        total = len(tech_tasks)
-        completed = len([t for t in tech_tasks if t.status == 'completed'])
-        in_progress = len([t for t in tech_tasks if t.status == 'in_progress'])
+    Body:
+        {"ids": [3, 5, 8]} (tối đa 1000 technician_id)
 
-        completion_rate = (completed / total * 100) if total > 0 else 0.0
+    Returns:
+        {"success": true, "stats": {"3": {...}, "5": {...}}}
+    """
+    ids, error = _json_ids()
+    if error:
+        return jsonify({
+            "success": False,
+            "error": error
+        }), 400
 
+    try:
+        stats = service.get_technician_stats(ids)
         return jsonify({
             "success": True,
-            "stats": {
-                "total_tasks": total,
-                "completed_tasks": completed,
-                "in_progress_tasks": in_progress,
-                "pending_tasks": total - completed - in_progress,
-                "completion_rate": round(completion_rate, 2)
-            }
+            "stats": {str(technician_id): value for technician_id, value in stats.items()}
         }), 200
 
     except Exception as e:
-        current_app.logger.error(f"Error in get_technician_stats: {str(e)}")
+        current_app.logger.error(f"Error in get_technicians_stats: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@internal_bp.route("/bookings/parts", methods=["GET"])
+@internal_token_required
+def get_bookings_parts():
+    """
+    Phụ tùng đã dùng của nhiều booking trong một query (cho finance-service lập hóa đơn theo lô)
+
+    Query params:
+        ids: danh sách booking_id, ví dụ "10,11,12" (tối đa MAX_QUERY_IDS). Giữ GET để client được
+             retry như mọi lời gọi đọc; 300 id (kể cả id 10 chữ số, dấu phẩy mã hóa %2C) vẫn nằm
+             trong giới hạn dòng request 4094 byte của gunicorn
+
+    Returns:
+        {
+            "success": true,
+            "parts": {"10": [{"item_id": 5, "quantity": 2}], "11": []},
+            "missing": [12]
+        }
+    """
+    try:
+        ids = sorted({int(i) for i in request.args.get("ids", "").split(",") if i.strip()})
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "Tham số ids phải là danh sách số nguyên, ví dụ: 10,11,12"
+        }), 400
+    if len(ids) > MAX_QUERY_IDS:
+        return jsonify({
+            "success": False,
+            "error": f"Tối đa {MAX_QUERY_IDS} booking mỗi lần"
+        }), 400
+
+    try:
+        parts = service.get_task_parts_by_booking_ids(ids)
+        return jsonify({
+            "success": True,
+            "parts": {str(booking_id): booking_parts for booking_id, booking_parts in parts.items()},
+            "missing": [booking_id for booking_id in ids if booking_id not in parts]
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error in get_bookings_parts: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@internal_bp.route("/sla/rollup", methods=["POST"])
+@internal_token_required
+def run_sla_rollup():
+    """Chạy ngay job tổng hợp SLA (hôm qua và hôm nay); body tùy chọn {"days_back": 7} để tính lại nhiều ngày"""
+    days_back = (request.get_json(silent=True) or {}).get("days_back", 1)
+    if not isinstance(days_back, int) or not 0 <= days_back <= 366:
+        return jsonify({
+            "success": False,
+            "error": "days_back phải là số nguyên từ 0 đến 366"
+        }), 400
+
+    try:
+        return jsonify({
+            "success": True,
+            "days": TaskSlaService.run_once(days_back=days_back)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error in run_sla_rollup: {str(e)}")
         return jsonify({
             "success": False,
             "error": str(e)
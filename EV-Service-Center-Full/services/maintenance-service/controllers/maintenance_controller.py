@@ -1,9 +1,13 @@
 # File: services/maintenance-service/controllers/maintenance_controller.py
-from flask import Blueprint, request, jsonify, current_app
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
 from functools import wraps
 
 from services.maintenance_service import MaintenanceService as service
+from services.checklist_template_service import ChecklistTemplateService
+from services.sla_service import TaskSlaService
+from services.vehicle_service import VehicleService
 
 maintenance_bp = Blueprint("maintenance", __name__, url_prefix="/api/maintenance")
 
@@ -52,6 +56,22 @@ def _check_task_permission(task_id, current_user_id, claims, required_roles=None
 
     return task, is_authorized, is_admin, is_technician_owner
 
+def _parse_date_range():
+    """Đọc from/to (ISO date hoặc datetime) từ query string: (date_from, date_to, error)"""
+    try:
+        date_from = datetime.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        date_to = datetime.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return None, None, "from/to phải theo định dạng ISO, ví dụ 2025-01-31"
+    return date_from, date_to, None
+
+def _current_user_id_int():
+    """user_id trong JWT dạng số (ghi vào nhật ký trạng thái), None nếu không đọc được"""
+    try:
+        return int(get_jwt_identity())
+    except (ValueError, TypeError):
+        return None
+
 # --- Routes ---
 
 # 1. ADMIN: CREATE TASK (POST /api/maintenance/tasks)
@@ -69,10 +89,12 @@ def create_maintenance_task():
     try:
         booking_id = int(booking_id)
         technician_id = int(technician_id)
-    except ValueError:
-        return jsonify({"error": "booking_id và technician_id phải là số nguyên"}), 400
+        # user_id (tùy chọn): biết trước chủ xe thì lấy Booking và Profile song song
+        user_id = int(data["user_id"]) if data.get("user_id") is not None else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "booking_id, technician_id và user_id phải là số nguyên"}), 400
     
-    task, error = service.create_task_from_booking(booking_id, technician_id)
+    task, error = service.create_task_from_booking(booking_id, technician_id, user_id, _current_user_id_int())
     
     if error:
         status_code = 409 if "tồn tại" in error else 400
@@ -135,6 +157,16 @@ def update_task_status_route(task_id):
     if not new_status:
         return jsonify({"error": "Missing 'status' field."}), 400
 
+    # Số km hiện tại của xe (tùy chọn, dùng để tính mốc bảo dưỡng kế tiếp khi hoàn thành)
+    mileage = data.get("mileage")
+    if mileage is not None:
+        try:
+            mileage = int(mileage)
+        except (ValueError, TypeError):
+            return jsonify({"error": "mileage phải là số nguyên."}), 400
+        if mileage < 0:
+            return jsonify({"error": "mileage không được âm."}), 400
+
     current_user_id = get_jwt_identity()
     claims = get_jwt()
 
@@ -147,9 +179,9 @@ def update_task_status_route(task_id):
     if not is_authorized:
         return jsonify({"error": "Bạn không có quyền cập nhật công việc này."}), 403
 
-    task, error = service.update_task_status(task_id, new_status)
+    task, error = service.update_task_status(task_id, new_status, mileage, _current_user_id_int())
     if error:
-        status_code = 404 if "Không tìm thấy" in error else 400
+        status_code = 404 if "Không tìm thấy" in error else 409 if "Không thể chuyển" in error else 400
         return jsonify({"error": error}), status_code
 
     return jsonify({
@@ -158,6 +190,71 @@ def update_task_status_route(task_id):
     }), 200
 
 
+# 6. GET STATUS HISTORY (GET /api/maintenance/tasks/<id>/transitions)
+@maintenance_bp.route("/tasks/<int:task_id>/transitions", methods=["GET"])
+@jwt_required()
+def get_task_transitions_route(task_id):
+    task, is_authorized, _, _ = _check_task_permission(task_id, get_jwt_identity(), get_jwt())
+    if not task:
+        return jsonify({"error": "Không tìm thấy công việc."}), 404
+    if not is_authorized:
+        return jsonify({"error": "Bạn không có quyền xem công việc này."}), 403
+
+    return jsonify([t.to_dict() for t in TaskSlaService.get_transitions(task_id)]), 200
+
+# 7. ADMIN: SLA ANALYTICS (GET /api/maintenance/analytics/sla?from=2025-01-01&to=2025-01-31&center_id=1&phase=work)
+@maintenance_bp.route("/analytics/sla", methods=["GET"])
+@admin_required()
+def get_sla_analytics_route():
+    """Percentile thời gian chờ / thực hiện / tổng theo ngày, chi nhánh, loại dịch vụ (từ bảng tổng hợp hằng ngày)"""
+    date_from, date_to, error = _parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+    phase = request.args.get("phase")
+    if phase and phase not in ("wait", "work", "lead"):
+        return jsonify({"error": "phase phải là wait, work hoặc lead"}), 400
+
+    date_to = date_to.date() if date_to else datetime.now().date()
+    date_from = date_from.date() if date_from else date_to - timedelta(days=30)
+    rows = TaskSlaService.get_sla(
+        date_from, date_to,
+        center_id=request.args.get("center_id", type=int),
+        service_type=request.args.get("service_type"),
+        phase=phase
+    )
+    return jsonify({
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "rows": rows,
+        "count": len(rows)
+    }), 200
+
+
+# 8. VEHICLE HISTORY (GET /api/maintenance/vehicles/<vin>/history?before_id=&limit=20)
+@maintenance_bp.route("/vehicles/<vin>/history", methods=["GET"])
+@jwt_required()
+def get_vehicle_history_route(vin):
+    """
+    Lịch sử bảo dưỡng của xe (mới nhất trước) kèm phụ tùng và checklist: Admin, KTV hoặc chủ xe.
+    Task tạo trước khi nâng cấp chỉ hiện sau khi chạy `flask rekey-vehicles` (README); chủ xe chưa khai
+    VIN trong Profile thì task vẫn giữ mã tạm VIN_{booking}_{username} và không tra được theo VIN.
+    """
+    vehicle = VehicleService.get_vehicle(vin)
+    if not vehicle:
+        return jsonify({"error": "Không tìm thấy xe với VIN này."}), 404
+
+    claims = get_jwt()
+    if claims.get("role") not in ("admin", "technician") and str(vehicle.user_id) != str(get_jwt_identity()):
+        return jsonify({"error": "Bạn không có quyền xem lịch sử xe này."}), 403
+
+    history = VehicleService.get_history(
+        vehicle,
+        before_id=request.args.get("before_id", type=int),
+        limit=request.args.get("limit", 20, type=int)
+    )
+    return jsonify(history), 200
+
+
 # ============= Task Parts Endpoints =============
 
 @maintenance_bp.route("/tasks/<int:task_id>/parts", methods=["POST"])
@@ -227,9 +324,37 @@ def remove_part_route(part_id):
 @maintenance_bp.route("/completed-tasks-with-parts", methods=["GET"])
 @admin_required()
 def get_completed_tasks_with_parts_route():
-    """Admin lấy danh sách task completed với phụ tùng"""
-    tasks = service.get_completed_tasks_with_parts()
-    return jsonify(tasks), 200
+    """Admin lấy danh sách task completed với phụ tùng (phân trang bằng after_id, lọc from/to)"""
+    date_from, date_to, error = _parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+
+    limit = min(request.args.get("limit", 500, type=int), 2000)
+    tasks = service.get_completed_tasks_with_parts(
+        after_id=request.args.get("after_id", 0, type=int),
+        limit=limit,
+        date_from=date_from,
+        date_to=date_to
+    )
+    return jsonify({
+        "tasks": tasks,
+        "count": len(tasks),
+        "next_after_id": tasks[-1]["task_id"] if len(tasks) == limit else None
+    }), 200
+
+@maintenance_bp.route("/completed-tasks-with-parts/export", methods=["GET"])
+@admin_required()
+def export_completed_tasks_route():
+    """Admin xuất toàn bộ task completed với phụ tùng dạng NDJSON (stream, lọc from/to)"""
+    date_from, date_to, error = _parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+
+    return Response(
+        stream_with_context(service.iter_completed_tasks_export(date_from, date_to)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=completed_tasks.ndjson"}
+    )
 
 
 @maintenance_bp.route("/bookings/<int:booking_id>/parts", methods=["GET"])
@@ -294,6 +419,35 @@ def get_task_checklist_route(task_id):
     checklist = service.get_task_checklist(task_id)
     return jsonify([item.to_dict() for item in checklist]), 200
 
+@maintenance_bp.route("/tasks/<int:task_id>/checklist", methods=["PUT"])
+@jwt_required()
+def update_task_checklist_route(task_id):
+    """
+    Cập nhật cả checklist của task trong một lần (một lần kiểm tra quyền, một transaction).
+    Body: {"items": [{"id": 1, "status": "pass", "note": "..."}, {"item_name": "Gạt mưa", "status": "fail"}]}
+    Chỉ Admin hoặc KTV owner được phép. Trả về checklist sau cập nhật.
+    """
+    data = request.get_json() or {}
+
+    task, is_authorized, is_admin, is_technician_owner = _check_task_permission(
+        task_id, get_jwt_identity(), get_jwt(), required_roles=["technician_or_admin"]
+    )
+
+    if not task:
+        return jsonify({"error": "Task không tồn tại"}), 404
+
+    if not is_authorized:
+        return jsonify({"error": "Bạn không có quyền thực hiện hành động này"}), 403
+
+    checklist, error = service.update_checklist_bulk(task, data.get("items"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify({
+        "message": "Cập nhật checklist thành công",
+        "checklist": [item.to_dict() for item in checklist]
+    }), 200
+
 @maintenance_bp.route("/checklist/<int:item_id>", methods=["PUT"])
 @jwt_required()
 def update_checklist_item_route(item_id):
@@ -333,4 +487,33 @@ def remove_checklist_item_route(item_id):
         status_code = 403 if "quyền" in error else 404
         return jsonify({"error": error}), status_code
 
-    return jsonify({"message": "Xóa hạng mục kiểm tra thành công"}), 200
\ No newline at end of file
+    return jsonify({"message": "Xóa hạng mục kiểm tra thành công"}), 200
+
+
+# ============= Checklist Template Endpoints =============
+
+# ADMIN: GET CHECKLIST TEMPLATES (GET /api/maintenance/checklist-templates)
+@maintenance_bp.route("/checklist-templates", methods=["GET"])
+@jwt_required()
+@admin_required()
+def get_checklist_templates_route():
+    return jsonify({
+        "templates": ChecklistTemplateService.list_templates(),
+        "default_items": ChecklistTemplateService.DEFAULT_ITEMS
+    }), 200
+
+# ADMIN: SET CHECKLIST TEMPLATE (PUT /api/maintenance/checklist-templates/<service_type>)
+@maintenance_bp.route("/checklist-templates/<path:service_type>", methods=["PUT"])
+@jwt_required()
+@admin_required()
+def set_checklist_template_route(service_type):
+    data = request.json or {}
+    items, error = ChecklistTemplateService.set_template(service_type, data.get("items"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify({
+        "message": "Cập nhật mẫu checklist thành công.",
+        "service_type": service_type,
+        "items": items
+    }), 200
@@ -10,13 +10,23 @@ TASK_STATUSES = db.Enum(
 
 class MaintenanceTask(db.Model):
     __tablename__ = "maintenance_tasks"
+    __table_args__ = (
+        # Nhắc bảo dưỡng: range scan theo hạn kế tiếp, phân trang keyset theo task_id
+        db.Index("ix_maintenance_tasks_next_service_due", "next_service_due", "task_id"),
+        # Thống kê theo KTV: GROUP BY technician_id, status chỉ đọc index
+        db.Index("ix_maintenance_tasks_technician_status", "technician_id", "status"),
+        # Xuất lịch sử task hoàn thành: keyset theo task_id chỉ trên các dòng completed
+        db.Index("ix_maintenance_tasks_completed", "task_id", postgresql_where=db.text("status = 'completed'")),
+        # Lịch sử của một xe: keyset theo task_id giảm dần trong cùng VIN
+        db.Index("ix_maintenance_tasks_vehicle_vin_task", "vehicle_vin", "task_id"),
+    )
 
     task_id = db.Column(db.Integer, primary_key=True, index=True)
     # Booking ID là external key, 1 booking có thể có nhiều tasks (nhiều KTV)
     booking_id = db.Column(db.Integer, nullable=False, index=True)
     # User ID (technician) để dễ tra cứu
     user_id = db.Column(db.Integer, nullable=False, index=True) 
-    # Thông tin xe (VIN) lấy từ Booking/User Profile
+    # Thông tin xe (VIN) lấy từ User Profile (vehicles.vin)
     vehicle_vin = db.Column(db.String(100), nullable=False)
     
     # Mô tả công việc (Lấy từ Booking service_type)
@@ -31,6 +41,20 @@ class MaintenanceTask(db.Model):
         default="pending"
     )
 
+    # Chi nhánh thực hiện (center_id của Booking)
+    center_id = db.Column(db.Integer, nullable=True)
+    # Thời điểm vào trạng thái hiện tại (tính thời gian ở mỗi trạng thái)
+    status_changed_at = db.Column(db.DateTime, nullable=True)
+
+    # Lịch hẹn (start_time của Booking)
+    scheduled_date = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # Số km lúc bảo dưỡng (KTV nhập khi hoàn thành)
+    mileage_at_service = db.Column(db.Integer, nullable=True)
+    # Mốc bảo dưỡng kế tiếp; chỉ task hoàn thành mới nhất của mỗi xe giữ giá trị này
+    next_service_due = db.Column(db.DateTime, nullable=True)
+    next_service_mileage = db.Column(db.Integer, nullable=True)
+
     created_at = db.Column(db.DateTime, nullable=False, default=func.now())
     updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
 
@@ -44,11 +68,112 @@ class MaintenanceTask(db.Model):
             "description": self.description,
             "technician_id": self.technician_id,
             "status": str(self.status),
+            "center_id": self.center_id,
+            "status_changed_at": self.status_changed_at.isoformat() if self.status_changed_at else None,
+            "scheduled_date": self.scheduled_date.isoformat() if self.scheduled_date else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "mileage_at_service": self.mileage_at_service,
+            "next_service_due": self.next_service_due.isoformat() if self.next_service_due else None,
+            "next_service_mileage": self.next_service_mileage,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class Vehicle(db.Model):
+    """Xe theo VIN thật trong User Profile; history_version tăng mỗi khi lịch sử của xe thay đổi"""
+    __tablename__ = "vehicles"
+
+    id = db.Column(db.Integer, primary_key=True)
+    vin = db.Column(db.String(100), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True) # Chủ xe
+    vehicle_model = db.Column(db.String(100), nullable=True)
+    last_service_at = db.Column(db.DateTime, nullable=True)
+    last_mileage = db.Column(db.Integer, nullable=True)
+    history_version = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        return {
+            "vin": self.vin,
+            "user_id": self.user_id,
+            "vehicle_model": self.vehicle_model,
+            "last_service_at": self.last_service_at.isoformat() if self.last_service_at else None,
+            "last_mileage": self.last_mileage,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+class TaskTransition(db.Model):
+    """Nhật ký chuyển trạng thái của task (chỉ ghi thêm), ghi cùng transaction với thay đổi trạng thái"""
+    __tablename__ = "task_transitions"
+    __table_args__ = (
+        # Job tổng hợp SLA đọc theo khoảng ngày
+        db.Index("ix_task_transitions_changed_at", "changed_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False, index=True)
+    from_status = db.Column(db.String(20), nullable=True) # None = task vừa được tạo
+    to_status = db.Column(db.String(20), nullable=False)
+    changed_by = db.Column(db.Integer, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    # Số giây task đã ở from_status, và tuổi của task tại thời điểm chuyển
+    duration_seconds = db.Column(db.Integer, nullable=True)
+    task_age_seconds = db.Column(db.Integer, nullable=False, default=0)
+    # Sao chép từ task để tổng hợp không cần join
+    center_id = db.Column(db.Integer, nullable=True)
+    service_type = db.Column(db.String(255), nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "task_id": self.task_id,
+            "from_status": self.from_status,
+            "to_status": self.to_status,
+            "changed_by": self.changed_by,
+            "changed_at": self.changed_at.isoformat() if self.changed_at else None,
+            "duration_seconds": self.duration_seconds,
+            "task_age_seconds": self.task_age_seconds
+        }
+
+
+class TaskSlaDaily(db.Model):
+    """Percentile thời gian theo ngày x chi nhánh x loại dịch vụ x giai đoạn (job tổng hợp ghi lại mỗi ngày)"""
+    __tablename__ = "task_sla_daily"
+    __table_args__ = (
+        db.Index("ix_task_sla_daily_day", "day", "center_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    center_id = db.Column(db.Integer, nullable=True)
+    service_type = db.Column(db.String(255), nullable=True)
+    # wait: chờ (pending -> bắt đầu), work: thực hiện (in_progress -> completed), lead: tạo -> completed
+    phase = db.Column(db.String(10), nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    avg_seconds = db.Column(db.Float, nullable=False)
+    p50_seconds = db.Column(db.Float, nullable=False)
+    p90_seconds = db.Column(db.Float, nullable=False)
+    p99_seconds = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    def to_dict(self):
+        return {
+            "day": self.day.isoformat(),
+            "center_id": self.center_id,
+            "service_type": self.service_type,
+            "phase": self.phase,
+            "sample_count": self.sample_count,
+            "avg_seconds": round(self.avg_seconds, 1),
+            "p50_seconds": round(self.p50_seconds, 1),
+            "p90_seconds": round(self.p90_seconds, 1),
+            "p99_seconds": round(self.p99_seconds, 1)
+        }
+
+
 class TaskPart(db.Model):
     """Bảng lưu các phụ tùng đã sử dụng cho mỗi task"""
     __tablename__ = "task_parts"
@@ -90,3 +215,26 @@ class MaintenanceChecklist(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+class ChecklistTemplate(db.Model):
+    """Mẫu checklist theo loại dịch vụ (service_type của Booking), dùng khi tạo task"""
+    __tablename__ = "checklist_templates"
+    __table_args__ = (
+        db.UniqueConstraint("service_type", "item_name", name="uq_checklist_templates_service_item"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    service_type = db.Column(db.String(100), nullable=False, index=True)
+    item_name = db.Column(db.String(100), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0) # Thứ tự hiển thị
+    created_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "service_type": self.service_type,
+            "item_name": self.item_name,
+            "position": self.position,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,84 @@
+"""
+Mẫu checklist mặc định theo loại dịch vụ.
+
+Bảng checklist_templates nhỏ (vài chục dòng) nên được nạp một lần vào bộ nhớ của worker và làm
+mới sau TEMPLATES_TTL_SECONDS giây; ghi mẫu mới thì xóa cache ngay trên worker hiện tại.
+Tạo task không cần query mẫu: chỉ tra dict trong bộ nhớ.
+"""
+import time
+from sqlalchemy import insert
+from app import db
+from models.maintenance_model import ChecklistTemplate
+
+_templates_cache = {"loaded_at": 0.0, "templates": {}}
+
+
+class ChecklistTemplateService:
+    """Service quản lý mẫu checklist theo service_type"""
+
+    TEMPLATES_TTL_SECONDS = 300
+    DEFAULT_SERVICE_TYPE = "default"
+    DEFAULT_ITEMS = ["Lốp", "Phanh", "Pin", "Động cơ", "Hệ thống điện", "Hệ thống làm mát", "Ngoại thất/Thân vỏ"]
+    MAX_ITEMS = 100
+
+    @staticmethod
+    def _templates():
+        """service_type -> danh sách hạng mục theo thứ tự, cache TEMPLATES_TTL_SECONDS giây"""
+        if time.monotonic() - _templates_cache["loaded_at"] < ChecklistTemplateService.TEMPLATES_TTL_SECONDS:
+            return _templates_cache["templates"]
+        templates = {}
+        for service_type, item_name in db.session.query(
+            ChecklistTemplate.service_type, ChecklistTemplate.item_name
+        ).order_by(ChecklistTemplate.service_type, ChecklistTemplate.position, ChecklistTemplate.id):
+            templates.setdefault(service_type, []).append(item_name)
+        _templates_cache["templates"] = templates
+        _templates_cache["loaded_at"] = time.monotonic()
+        return templates
+
+    @staticmethod
+    def invalidate():
+        _templates_cache["loaded_at"] = 0.0
+
+    @staticmethod
+    def get_items(service_type):
+        """Hạng mục checklist cho một loại dịch vụ: mẫu riêng, mẫu 'default', rồi danh sách mặc định"""
+        templates = ChecklistTemplateService._templates()
+        return list(
+            templates.get(service_type)
+            or templates.get(ChecklistTemplateService.DEFAULT_SERVICE_TYPE)
+            or ChecklistTemplateService.DEFAULT_ITEMS
+        )
+
+    @staticmethod
+    def list_templates():
+        return dict(ChecklistTemplateService._templates())
+
+    @staticmethod
+    def set_template(service_type, items):
+        """Thay toàn bộ mẫu của một loại dịch vụ (danh sách rỗng = xóa mẫu, quay về mặc định)"""
+        service_type = (service_type or "").strip()
+        if not service_type:
+            return None, "Thiếu service_type"
+        if not isinstance(items, list) or not all(isinstance(i, str) and i.strip() for i in items):
+            return None, "items phải là danh sách tên hạng mục"
+        if len(items) > ChecklistTemplateService.MAX_ITEMS:
+            return None, f"Tối đa {ChecklistTemplateService.MAX_ITEMS} hạng mục mỗi mẫu"
+
+        names = list(dict.fromkeys(i.strip() for i in items))
+        if any(len(name) > 100 for name in names):
+            return None, "Tên hạng mục tối đa 100 ký tự"
+
+        try:
+            ChecklistTemplate.query.filter_by(service_type=service_type).delete(synchronize_session=False)
+            if names:
+                db.session.execute(insert(ChecklistTemplate), [
+                    {"service_type": service_type, "item_name": name, "position": position}
+                    for position, name in enumerate(names)
+                ])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Lỗi khi lưu mẫu checklist: {str(e)}"
+
+        ChecklistTemplateService.invalidate()
+        return names, None
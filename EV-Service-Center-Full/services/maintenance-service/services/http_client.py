@@ -0,0 +1,85 @@
+"""
+HTTP client dùng chung cho các lời gọi Internal API của Maintenance Service.
+
+- Một requests.Session cho mỗi worker => giữ kết nối keep-alive tới từng service.
+- Timeout riêng theo host (INTERNAL_HTTP_TIMEOUTS), không còn lời gọi nào chờ vô hạn.
+- Tự retry lỗi kết nối và 502/503/504 cho các phương thức idempotent (GET, PUT).
+- run_concurrently: chạy song song các lời gọi không phụ thuộc nhau.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app
+
+_session = None
+_session_lock = Lock()
+_io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="internal-http")
+
+
+class InternalHttpClient:
+    """Client keep-alive có timeout và retry cho Internal API"""
+
+    DEFAULT_TIMEOUT = (1.0, 5.0)  # (connect, read) giây
+    POOL_SIZE = 20
+
+    @staticmethod
+    def session():
+        global _session
+        if _session is None:
+            with _session_lock:
+                if _session is None:
+                    retry = Retry(
+                        total=2,
+                        connect=2,
+                        read=1,
+                        backoff_factor=0.1,
+                        status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset({"GET", "PUT"}),
+                        raise_on_status=False
+                    )
+                    adapter = HTTPAdapter(
+                        pool_connections=10,
+                        pool_maxsize=InternalHttpClient.POOL_SIZE,
+                        max_retries=retry
+                    )
+                    session = requests.Session()
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    _session = session
+        return _session
+
+    @staticmethod
+    def timeout_for(url):
+        host = urlparse(url).hostname
+        timeouts = current_app.config.get("INTERNAL_HTTP_TIMEOUTS") or {}
+        return timeouts.get(host, InternalHttpClient.DEFAULT_TIMEOUT)
+
+    @staticmethod
+    def request(method, url, **kwargs):
+        kwargs.setdefault("timeout", InternalHttpClient.timeout_for(url))
+        start = time.perf_counter()
+        try:
+            return InternalHttpClient.session().request(method, url, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            current_app.logger.debug(f"Internal {method} {url} took {elapsed_ms:.1f} ms")
+
+    @staticmethod
+    def run_concurrently(*calls):
+        """
+        Chạy song song các hàm (fn, *args) trong app context, trả về kết quả theo đúng thứ tự.
+        Dùng cho các lời gọi không phụ thuộc nhau (ví dụ: Booking và User Profile).
+        """
+        app = current_app._get_current_object()
+
+        def run(call):
+            fn, args = call[0], call[1:]
+            with app.app_context():
+                return fn(*args)
+
+        futures = [_io_executor.submit(run, call) for call in calls]
+        return [future.result() for future in futures]
@@ -1,10 +1,21 @@
+import json
 import requests
+from datetime import datetime, timedelta
 from flask import current_app
+from sqlalchemy import and_, func, insert, or_
 from app import db
-from models.maintenance_model import MaintenanceTask, TaskPart, MaintenanceChecklist
+from models.maintenance_model import MaintenanceTask, TaskPart, MaintenanceChecklist, Vehicle
+from services.checklist_template_service import ChecklistTemplateService
+from services.http_client import InternalHttpClient
+from services.sla_service import TaskSlaService
+from services.vehicle_service import VehicleService
 
 class MaintenanceService:
     """Service xử lý logic nghiệp vụ về Công việc bảo trì"""
+
+    REMIND_DAYS = (7, 1)
+    DEFAULT_INTERVAL_DAYS = 180
+    DEFAULT_INTERVAL_KM = 10000
     
     @staticmethod
     def _call_internal_api(service_url, endpoint, method="GET", json_data=None):
@@ -16,12 +27,18 @@ class MaintenanceService:
              return None, "Lỗi cấu hình Service URL hoặc Internal Token."
 
         try:
-            response = requests.request(method, url, headers=headers, json=json_data)
+            response = InternalHttpClient.request(method, url, headers=headers, json=json_data)
 
             if response.status_code == 200 or response.status_code == 201:
                 return response.json(), None
             else:
                 # Một số API trả về list trực tiếp hoặc dict không có key error
+                try:
+                    body = response.json()
+                    if isinstance(body, dict) and body.get("error"):
+                        return None, body["error"]
+                except ValueError:
+                    pass
                 return None, f"Lỗi Service (HTTP {response.status_code})"
         except requests.exceptions.RequestException as e:
             return None, f"Lỗi kết nối Service: {str(e)}"
@@ -55,7 +72,58 @@ class MaintenanceService:
         return MaintenanceTask.query.filter_by(technician_id=int(technician_id)).order_by(MaintenanceTask.created_at.desc()).all()
 
     @staticmethod
-    def create_task_from_booking(booking_id, technician_id):
+    def get_technician_stats(technician_ids):
+        """Thống kê task của nhiều KTV bằng một câu GROUP BY technician_id, status: {technician_id: stats}"""
+        counts = {technician_id: {} for technician_id in technician_ids}
+        if not counts:
+            return {}
+        rows = db.session.query(
+            MaintenanceTask.technician_id, MaintenanceTask.status, func.count()
+        ).filter(
+            MaintenanceTask.technician_id.in_(list(counts))
+        ).group_by(MaintenanceTask.technician_id, MaintenanceTask.status).all()
+        for technician_id, status, count in rows:
+            counts[technician_id][str(status)] = count
+
+        stats = {}
+        for technician_id, by_status in counts.items():
+            total = sum(by_status.values())
+            completed = by_status.get("completed", 0)
+            in_progress = by_status.get("in_progress", 0)
+            stats[technician_id] = {
+                "total_tasks": total,
+                "completed_tasks": completed,
+                "in_progress_tasks": in_progress,
+                "pending_tasks": by_status.get("pending", 0),
+                "failed_tasks": by_status.get("failed", 0),
+                "completion_rate": round(completed / total * 100, 2) if total > 0 else 0.0
+            }
+        return stats
+
+    @staticmethod
+    def _fetch_booking_and_user(booking_id, user_id=None):
+        """
+        Lấy Booking và User Profile. Biết trước user_id (ví dụ tạo hàng loạt theo chiến dịch triệu hồi)
+        thì hai lời gọi chạy song song; ngược lại phải chờ Booking để biết user_id.
+        """
+        if user_id is None:
+            booking_result = MaintenanceService._get_booking_details(booking_id)
+            if booking_result[1]:
+                return booking_result, (None, None)
+            return booking_result, MaintenanceService._get_user_profile(booking_result[0].get('user_id'))
+
+        booking_result, user_result = InternalHttpClient.run_concurrently(
+            (MaintenanceService._get_booking_details, booking_id),
+            (MaintenanceService._get_user_profile, user_id)
+        )
+        booking_data = booking_result[0]
+        if booking_data and str(booking_data.get('user_id')) != str(user_id):
+            # user_id truyền vào không khớp Booking: lấy lại đúng profile của chủ Booking
+            user_result = MaintenanceService._get_user_profile(booking_data.get('user_id'))
+        return booking_result, user_result
+
+    @staticmethod
+    def create_task_from_booking(booking_id, technician_id, user_id=None, created_by=None):
         existing_task = MaintenanceTask.query.filter_by(
             booking_id=booking_id,
             technician_id=technician_id
@@ -64,18 +132,21 @@ class MaintenanceService:
         if existing_task:
             return None, "Kỹ thuật viên này đã được phân công cho Booking này rồi."
 
-        booking_data, error = MaintenanceService._get_booking_details(booking_id)
+        (booking_data, error), (user_data, user_error) = MaintenanceService._fetch_booking_and_user(booking_id, user_id)
         if error:
             return None, f"Lỗi khi lấy Booking: {error}"
             
         user_id = booking_data.get('user_id')
         service_type = booking_data.get('service_type')
 
-        user_data, error = MaintenanceService._get_user_profile(user_id)
-        if error:
+        if user_error or not user_data:
             user_data = {} # Fallback nếu lỗi user service
         
-        vehicle_vin = f"VIN_{booking_id}_{user_data.get('username', 'Unknown')}" 
+        # VIN thật trong Profile của khách; Profile chưa khai báo VIN thì dùng mã tạm theo booking
+        real_vin = VehicleService.normalize_vin(user_data.get('vin_number'))
+        vehicle_vin = real_vin or f"VIN_{booking_id}_{user_data.get('username', 'Unknown')}" 
+        start_time = booking_data.get('start_time')
+        checklist_items = ChecklistTemplateService.get_items(service_type)
 
         try:
             new_task = MaintenanceTask(
@@ -84,20 +155,21 @@ class MaintenanceService:
                 vehicle_vin=vehicle_vin, 
                 description=service_type,
                 technician_id=technician_id,
-                status='pending'
+                status='pending',
+                center_id=booking_data.get('center_id'),
+                scheduled_date=datetime.fromisoformat(start_time) if start_time else None
             )
             db.session.add(new_task)
-            db.session.commit()
-            
-            # --- THÊM CHECKLIST MẶC ĐỊNH ---
-            default_checklist_items = ["Lốp", "Phanh", "Pin", "Động cơ", "Hệ thống điện", "Hệ thống làm mát", "Ngoại thất/Thân vỏ"]
-            for item_name in default_checklist_items:
-                checklist_item = MaintenanceChecklist(
-                    task_id=new_task.task_id,
-                    item_name=item_name,
-                    status="pending"
-                )
-                db.session.add(checklist_item)
+            db.session.flush()
+            TaskSlaService.record_transition(new_task, None, 'pending', created_by)
+            if real_vin:
+                VehicleService.upsert(real_vin, user_id, user_data.get('vehicle_model'))
+
+            # --- CHECKLIST THEO MẪU CỦA LOẠI DỊCH VỤ: một câu insert, cùng transaction với task ---
+            db.session.execute(insert(MaintenanceChecklist), [
+                {"task_id": new_task.task_id, "item_name": item_name, "status": "pending"}
+                for item_name in checklist_items
+            ])
             db.session.commit()
 
             return new_task, None
@@ -106,7 +178,70 @@ class MaintenanceService:
             return None, f"Lỗi khi tạo công việc bảo trì: {str(e)}"
 
     @staticmethod
-    def update_task_status(task_id, new_status):
+    def _schedule_next_service(task, mileage=None, now=None):
+        """
+        Ghi mốc bảo dưỡng kế tiếp khi task hoàn thành. Mốc của các lần bảo dưỡng trước của cùng xe
+        bị xóa, nên index next_service_due chỉ chứa một dòng cho mỗi xe.
+        """
+        now = now or datetime.now()
+        interval_days, interval_km = MaintenanceService._service_intervals()
+
+        MaintenanceTask.query.filter(
+            MaintenanceTask.vehicle_vin == task.vehicle_vin,
+            MaintenanceTask.task_id != task.task_id,
+            MaintenanceTask.next_service_due.isnot(None)
+        ).update({MaintenanceTask.next_service_due: None, MaintenanceTask.next_service_mileage: None}, synchronize_session=False)
+
+        task.completed_at = now
+        if mileage is not None:
+            task.mileage_at_service = mileage
+        VehicleService.touch(task.vehicle_vin, last_service_at=now, last_mileage=func.coalesce(mileage, Vehicle.last_mileage))
+        task.next_service_due = now + timedelta(days=interval_days)
+        task.next_service_mileage = task.mileage_at_service + interval_km if task.mileage_at_service is not None else None
+
+    @staticmethod
+    def _service_intervals():
+        """(số ngày, số km) giữa hai lần bảo dưỡng"""
+        return (
+            current_app.config.get("MAINTENANCE_INTERVAL_DAYS", MaintenanceService.DEFAULT_INTERVAL_DAYS),
+            current_app.config.get("MAINTENANCE_INTERVAL_KM", MaintenanceService.DEFAULT_INTERVAL_KM)
+        )
+
+    @staticmethod
+    def _reopen_service(task):
+        """
+        Task đã hoàn thành bị mở lại: bỏ mốc của nó và tính lại mốc bảo dưỡng kế tiếp của xe từ
+        task hoàn thành gần nhất còn lại (mốc của task đó đã bị xóa khi task này hoàn thành).
+        """
+        held_mark = task.next_service_due is not None
+        task.completed_at = None
+        task.next_service_due = None
+        task.next_service_mileage = None
+        if not held_mark:
+            # Một lần hoàn thành mới hơn của xe đang giữ mốc
+            VehicleService.touch(task.vehicle_vin)
+            return
+
+        serviced_at = func.coalesce(MaintenanceTask.completed_at, MaintenanceTask.updated_at)
+        previous = MaintenanceTask.query.filter(
+            MaintenanceTask.vehicle_vin == task.vehicle_vin,
+            MaintenanceTask.task_id != task.task_id,
+            MaintenanceTask.status == "completed"
+        ).order_by(serviced_at.desc(), MaintenanceTask.task_id.desc()).first()
+
+        if not previous:
+            VehicleService.touch(task.vehicle_vin, last_service_at=None)
+            return
+        interval_days, interval_km = MaintenanceService._service_intervals()
+        last_service_at = previous.completed_at or previous.updated_at
+        previous.next_service_due = last_service_at + timedelta(days=interval_days)
+        previous.next_service_mileage = (
+            previous.mileage_at_service + interval_km if previous.mileage_at_service is not None else None
+        )
+        VehicleService.touch(task.vehicle_vin, last_service_at=last_service_at)
+
+    @staticmethod
+    def update_task_status(task_id, new_status, mileage=None, changed_by=None):
         task = MaintenanceTask.query.get(task_id)
         if not task:
             return None, "Không tìm thấy Công việc bảo trì."
@@ -114,26 +249,60 @@ class MaintenanceService:
         valid_statuses = ["pending", "in_progress", "completed", "failed"]
         if new_status not in valid_statuses:
             return None, f"Trạng thái '{new_status}' không hợp lệ. Phải là: {', '.join(valid_statuses)}"
+
+        old_status = str(task.status)
+        if new_status == old_status:
+            return task, None
+        transition_error = TaskSlaService.check_transition(old_status, new_status)
+        if transition_error:
+            return None, transition_error
         
         try:
+            now = datetime.now()
+            if new_status == "completed":
+                MaintenanceService._schedule_next_service(task, mileage, now)
+            elif old_status == "completed":
+                MaintenanceService._reopen_service(task)
+            else:
+                VehicleService.touch(task.vehicle_vin)
+            TaskSlaService.record_transition(task, old_status, new_status, changed_by, now)
             task.status = new_status
             db.session.commit()
+
+            if new_status == "failed":
+                # Task bị hủy: nhả toàn bộ phụ tùng đang giữ chỗ
+                _, release_error = MaintenanceService._release_reservations(task.task_id)
+                if release_error:
+                    current_app.logger.warning(f"Không nhả được giữ chỗ của task {task.task_id}: {release_error}")
             return task, None
         except Exception as e:
             db.session.rollback()
             return None, f"Lỗi khi cập nhật trạng thái: {str(e)}"
 
     @staticmethod
-    def _check_inventory_stock(item_id):
+    def _reserve_inventory(task, item_id, quantity):
+        """Giữ chỗ phụ tùng cho task (có TTL) tại Inventory Service, thay cho kiểm tra rồi ghi"""
         inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
         if not inventory_url:
             return None, "Lỗi cấu hình INVENTORY_SERVICE_URL"
+        return MaintenanceService._call_internal_api(inventory_url, "/internal/inventory/reservations", "POST", {
+            "items": [{"item_id": item_id, "quantity": quantity}],
+            "reference_type": "task",
+            "reference_id": task.task_id,
+            "booking_id": task.booking_id
+        })
 
-        try:
-            # Gọi API nội bộ hoặc public của Inventory
-            return MaintenanceService._call_internal_api(inventory_url, f"/api/inventory/items/{item_id}")
-        except requests.exceptions.RequestException as e:
-            return None, f"Lỗi kết nối inventory service: {str(e)}"
+    @staticmethod
+    def _release_reservations(task_id, item_id=None):
+        """Nhả giữ chỗ phụ tùng của task (toàn bộ hoặc một phụ tùng)"""
+        inventory_url = current_app.config.get("INVENTORY_SERVICE_URL")
+        if not inventory_url:
+            return None, "Lỗi cấu hình INVENTORY_SERVICE_URL"
+        return MaintenanceService._call_internal_api(inventory_url, "/internal/inventory/reservations/release", "POST", {
+            "reference_type": "task",
+            "reference_id": task_id,
+            "item_id": item_id
+        })
 
     @staticmethod
     def add_part_to_task(task_id, item_id, quantity):
@@ -141,71 +310,198 @@ class MaintenanceService:
         if not task:
             return None, "Task không tồn tại"
 
-        inventory_data, error = MaintenanceService._check_inventory_stock(item_id)
+        # Giữ chỗ nguyên tử phần tăng thêm: hai KTV không thể cùng dùng đơn vị cuối cùng
+        _, error = MaintenanceService._reserve_inventory(task, item_id, quantity)
         if error:
-            return None, f"Lỗi kiểm tra kho: {error}"
-        if not inventory_data:
-            return None, "Phụ tùng không tồn tại trong kho"
+            return None, f"Lỗi giữ chỗ phụ tùng: {error}"
 
-        available_quantity = inventory_data.get("quantity", 0)
-        existing_part = TaskPart.query.filter_by(task_id=task_id, item_id=item_id).first()
-
-        current_qty = existing_part.quantity if existing_part else 0
-        if (current_qty + quantity) > available_quantity:
-             return None, f"Số lượng vượt quá tồn kho. Có sẵn: {available_quantity}"
-
-        # TODO: Gọi Inventory Service để trừ kho (Deduct)
-        
-        if existing_part:
-            existing_part.quantity += quantity
+        try:
+            existing_part = TaskPart.query.filter_by(task_id=task_id, item_id=item_id).first()
+            VehicleService.touch(task.vehicle_vin)
+            if existing_part:
+                existing_part.quantity += quantity
+                db.session.commit()
+                return existing_part, None
+
+            new_part = TaskPart(
+                task_id=task_id,
+                item_id=item_id,
+                quantity=quantity
+            )
+            db.session.add(new_part)
             db.session.commit()
-            return existing_part, None
-
-        new_part = TaskPart(
-            task_id=task_id,
-            item_id=item_id,
-            quantity=quantity
-        )
-        db.session.add(new_part)
-        db.session.commit()
-        return new_part, None
+            return new_part, None
+        except Exception as e:
+            db.session.rollback()
+            MaintenanceService._release_reservations(task_id, item_id)
+            return None, f"Lỗi khi thêm phụ tùng: {str(e)}"
 
     @staticmethod
     def get_task_parts(task_id):
         return TaskPart.query.filter_by(task_id=task_id).all()
 
     @staticmethod
-    def remove_part_from_task(part_id):
+    def remove_part_from_task(part_id, current_user_id=None, is_admin=False):
         part = TaskPart.query.filter_by(id=part_id).first()
         if not part:
             return False, "Phụ tùng không tồn tại"
+
+        # Kiểm tra quyền: Admin hoặc KTV owner của task
+        if not is_admin and current_user_id:
+            task = MaintenanceTask.query.get(part.task_id)
+            try:
+                if task and int(task.technician_id) != int(current_user_id):
+                    return False, "Bạn không có quyền xóa phụ tùng này"
+            except (ValueError, TypeError):
+                return False, "Lỗi xác thực người dùng"
+
+        task_id, item_id = part.task_id, part.item_id
+        VehicleService.touch_task(task_id)
         db.session.delete(part)
         db.session.commit()
+
+        _, release_error = MaintenanceService._release_reservations(task_id, item_id)
+        if release_error:
+            current_app.logger.warning(f"Không nhả được giữ chỗ phụ tùng {item_id} của task {task_id}: {release_error}")
         return True, None
 
     @staticmethod
-    def get_completed_tasks_with_parts():
-        # Tối ưu Query N+1 bằng join
-        results = db.session.query(MaintenanceTask, TaskPart)\
-            .outerjoin(TaskPart, MaintenanceTask.task_id == TaskPart.task_id)\
-            .filter(MaintenanceTask.status == 'completed').all()
-            
-        tasks_map = {}
-        for task, part in results:
-            if task.task_id not in tasks_map:
-                tasks_map[task.task_id] = task.to_dict()
-                tasks_map[task.task_id]['parts'] = []
-            if part:
-                tasks_map[task.task_id]['parts'].append(part.to_dict())
-        return list(tasks_map.values())
+    def _completed_tasks_query(date_from=None, date_to=None):
+        """Task hoàn thành, lọc theo ngày hoàn thành (task cũ chưa có completed_at dùng updated_at)"""
+        query = MaintenanceTask.query.filter(MaintenanceTask.status == 'completed')
+        completed_at = func.coalesce(MaintenanceTask.completed_at, MaintenanceTask.updated_at)
+        if date_from:
+            query = query.filter(completed_at >= date_from)
+        if date_to:
+            query = query.filter(completed_at < date_to)
+        return query
+
+    @staticmethod
+    def get_completed_tasks_with_parts(after_id=0, limit=500, date_from=None, date_to=None):
+        """Một trang task hoàn thành kèm phụ tùng (keyset theo task_id): 2 query cho mỗi trang"""
+        tasks = MaintenanceService._completed_tasks_query(date_from, date_to).filter(
+            MaintenanceTask.task_id > after_id
+        ).order_by(MaintenanceTask.task_id).limit(limit).all()
+        if not tasks:
+            return []
+
+        parts_by_task = {}
+        for part in TaskPart.query.filter(
+            TaskPart.task_id.in_([task.task_id for task in tasks])
+        ).order_by(TaskPart.task_id, TaskPart.id):
+            parts_by_task.setdefault(part.task_id, []).append(part.to_dict())
+
+        result = []
+        for task in tasks:
+            task_data = task.to_dict()
+            task_data['parts'] = parts_by_task.get(task.task_id, [])
+            result.append(task_data)
+        return result
+
+    @staticmethod
+    def iter_completed_tasks_export(date_from=None, date_to=None, batch_size=1000):
+        """
+        Xuất toàn bộ task hoàn thành kèm phụ tùng dạng NDJSON (mỗi dòng một task).
+        Một câu JOIN sắp theo task_id đọc qua server-side cursor (yield_per): bộ nhớ không phụ thuộc
+        số task, các dòng phụ tùng liên tiếp của cùng task được gộp lại khi đọc.
+        """
+        rows = MaintenanceService._completed_tasks_query(date_from, date_to).outerjoin(
+            TaskPart, TaskPart.task_id == MaintenanceTask.task_id
+        ).with_entities(
+            MaintenanceTask, TaskPart
+        ).order_by(MaintenanceTask.task_id, TaskPart.id).execution_options(
+            stream_results=True
+        ).yield_per(batch_size)
+
+        lines = []
+        current = None
+        for task, part in rows:
+            if current is None or current["task_id"] != task.task_id:
+                if current is not None:
+                    lines.append(json.dumps(current, ensure_ascii=False) + "\n")
+                    if len(lines) >= batch_size:
+                        yield "".join(lines)
+                        lines = []
+                current = task.to_dict()
+                current["parts"] = []
+            if part is not None:
+                current["parts"].append(part.to_dict())
+
+        if current is not None:
+            lines.append(json.dumps(current, ensure_ascii=False) + "\n")
+        if lines:
+            yield "".join(lines)
+
+    @staticmethod
+    def get_task_parts_by_booking_ids(booking_ids):
+        """
+        Phụ tùng đã dùng của nhiều booking, cộng dồn theo item_id trên MỌI task của booking (một query).
+        Task 'failed' bị bỏ qua vì giữ chỗ của chúng đã được nhả.
+        Trả về {booking_id: [{"item_id", "quantity"}]}; booking không có task nào không có trong kết quả.
+        """
+        if not booking_ids:
+            return {}
+        rows = db.session.query(
+            MaintenanceTask.booking_id, TaskPart.item_id, func.sum(TaskPart.quantity)
+        ).outerjoin(
+            TaskPart, TaskPart.task_id == MaintenanceTask.task_id
+        ).filter(
+            MaintenanceTask.booking_id.in_(list(booking_ids)),
+            MaintenanceTask.status != 'failed'
+        ).group_by(MaintenanceTask.booking_id, TaskPart.item_id).order_by(
+            MaintenanceTask.booking_id, TaskPart.item_id
+        ).all()
+
+        parts = {}
+        for booking_id, item_id, quantity in rows:
+            booking_parts = parts.setdefault(booking_id, [])
+            if item_id is not None:
+                booking_parts.append({"item_id": item_id, "quantity": int(quantity)})
+        return parts
 
     @staticmethod
     def get_task_parts_by_booking_id(booking_id):
-        task = MaintenanceTask.query.filter_by(booking_id=booking_id).first()
-        if not task:
+        parts = MaintenanceService.get_task_parts_by_booking_ids([booking_id])
+        if booking_id not in parts:
             return None, "Task không tồn tại cho booking này"
-        parts = TaskPart.query.filter_by(task_id=task.task_id).all()
-        return [p.to_dict() for p in parts], None
+        return parts[booking_id], None
+
+    # ============= Nhắc bảo dưỡng =============
+    @staticmethod
+    def get_due_soon(days=None, after_id=0, limit=500, now=None):
+        """
+        Xe có mốc bảo dưỡng kế tiếp rơi đúng vào ngày thứ N kể từ hôm nay (N thuộc days),
+        phân trang keyset theo task_id. Mỗi khoảng ngày là một range scan trên (next_service_due, task_id).
+        """
+        days = days or MaintenanceService.REMIND_DAYS
+        today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        windows = [
+            and_(
+                MaintenanceTask.next_service_due >= today + timedelta(days=d),
+                MaintenanceTask.next_service_due < today + timedelta(days=d + 1)
+            )
+            for d in days
+        ]
+        tasks = MaintenanceTask.query.filter(
+            or_(*windows),
+            MaintenanceTask.task_id > after_id
+        ).order_by(MaintenanceTask.task_id).limit(limit).all()
+
+        return [{
+            "id": task.task_id,
+            "user_id": task.user_id,
+            "vehicle_info": {
+                "vin": task.vehicle_vin,
+                "license_plate": task.vehicle_vin
+            },
+            "due_date": task.next_service_due.isoformat(),
+            "days_left": (task.next_service_due - today).days,
+            "due_mileage": task.next_service_mileage,
+            "current_mileage": task.mileage_at_service,
+            "last_service_date": task.completed_at.isoformat() if task.completed_at else None,
+            "task_type": "Bảo dưỡng định kỳ",
+            "description": task.description
+        } for task in tasks]
 
     # ============= Checklist Methods =============
     @staticmethod
@@ -214,6 +510,7 @@ class MaintenanceService:
         if not task: return None, "Task không tồn tại"
         new_item = MaintenanceChecklist(task_id=task_id, item_name=item_name, status=status, note=note)
         db.session.add(new_item)
+        VehicleService.touch(task.vehicle_vin)
         db.session.commit()
         return new_item, None
 
@@ -245,13 +542,68 @@ class MaintenanceService:
             item.status = status
         if note is not None:
             item.note = note
+        VehicleService.touch_task(item.task_id)
         db.session.commit()
         return item, None
 
+    @staticmethod
+    def update_checklist_bulk(task, entries):
+        """
+        Cập nhật cả checklist của task trong một transaction (quyền đã kiểm tra ở controller).
+        entries: [{"id", "status"?, "note"?}] để sửa hạng mục có sẵn, [{"item_name", "status"?, "note"?}] để thêm mới.
+        Trả về (checklist sau cập nhật, error)
+        """
+        if not isinstance(entries, list) or not entries:
+            return None, "items phải là danh sách hạng mục không rỗng"
+        if len(entries) > 200:
+            return None, "Tối đa 200 hạng mục mỗi lần"
+
+        existing = {item.id: item for item in MaintenanceChecklist.query.filter_by(task_id=task.task_id)}
+        updates, new_items = [], []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                return None, f"Hạng mục thứ {index + 1} không hợp lệ"
+            status, note = entry.get("status"), entry.get("note")
+            if status is not None and (not isinstance(status, str) or not status.strip() or len(status) > 50):
+                return None, f"Hạng mục thứ {index + 1}: status phải là chuỗi 1-50 ký tự"
+            if note is not None and (not isinstance(note, str) or len(note) > 255):
+                return None, f"Hạng mục thứ {index + 1}: note tối đa 255 ký tự"
+
+            if entry.get("id") is not None:
+                item = existing.get(entry["id"])
+                if item is None:
+                    return None, f"Hạng mục kiểm tra {entry['id']} không thuộc task này"
+                updates.append((item, status, note))
+            elif isinstance(entry.get("item_name"), str) and entry["item_name"].strip():
+                if len(entry["item_name"]) > 100:
+                    return None, f"Hạng mục thứ {index + 1}: item_name tối đa 100 ký tự"
+                new_items.append(MaintenanceChecklist(
+                    task_id=task.task_id, item_name=entry["item_name"].strip(), status=status or "pending", note=note
+                ))
+            else:
+                return None, f"Hạng mục thứ {index + 1} thiếu id hoặc item_name"
+
+        try:
+            for item, status, note in updates:
+                if status:
+                    item.status = status
+                if note is not None:
+                    item.note = note
+            db.session.add_all(new_items)
+            VehicleService.touch(task.vehicle_vin)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Lỗi khi cập nhật checklist: {str(e)}"
+
+        # Đọc lại cả danh sách bằng một query (các đối tượng đã hết hạn sau commit)
+        return MaintenanceChecklist.query.filter_by(task_id=task.task_id).order_by(MaintenanceChecklist.id).all(), None
+
     @staticmethod
     def remove_checklist_item(item_id):
         item = MaintenanceChecklist.query.get(item_id)
         if not item: return None, "Hạng mục kiểm tra không tồn tại"
+        VehicleService.touch_task(item.task_id)
         db.session.delete(item)
         db.session.commit()
         return True, None
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Nhật ký chuyển trạng thái task và chỉ số thời gian (SLA).
+
+Mỗi lần đổi trạng thái ghi một dòng task_transitions TRONG CÙNG transaction, kèm số giây task đã ở
+trạng thái cũ, nên không cần ghép lại lịch sử khi tính toán. Job hằng ngày tổng hợp percentile
+p50/p90/p99 theo chi nhánh x loại dịch vụ x giai đoạn vào task_sla_daily bằng percentile_cont của
+Postgres (các DB khác tính cùng công thức nội suy tuyến tính ở phía Python). Endpoint analytics chỉ
+đọc bảng tổng hợp.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, insert
+from app import db
+from models.maintenance_model import TaskTransition, TaskSlaDaily
+
+
+class TaskSlaService:
+    """Service nhật ký trạng thái và tổng hợp SLA của task"""
+
+    # Trạng thái hiện tại -> các trạng thái được phép chuyển sang
+    ALLOWED_TRANSITIONS = {
+        "pending": {"in_progress", "completed", "failed"},
+        "in_progress": {"pending", "completed", "failed"},
+        "completed": {"in_progress"},
+        "failed": {"pending"},
+    }
+    PERCENTILES = (0.5, 0.9, 0.99)
+    DEFAULT_RUN_HOUR = 1
+
+    @staticmethod
+    def check_transition(from_status, to_status):
+        """Thông báo lỗi nếu không được chuyển from_status -> to_status, ngược lại None"""
+        allowed = TaskSlaService.ALLOWED_TRANSITIONS.get(from_status, set())
+        if to_status not in allowed:
+            return f"Không thể chuyển trạng thái từ '{from_status}' sang '{to_status}'."
+        return None
+
+    @staticmethod
+    def record_transition(task, from_status, to_status, changed_by=None, now=None):
+        """Ghi một dòng nhật ký và mốc vào trạng thái mới (không commit, chạy trong transaction của task)"""
+        now = now or datetime.now()
+        entered_at = task.status_changed_at or task.created_at or now
+        created_at = task.created_at or now
+        db.session.add(TaskTransition(
+            task_id=task.task_id,
+            from_status=from_status,
+            to_status=to_status,
+            changed_by=changed_by,
+            changed_at=now,
+            duration_seconds=int((now - entered_at).total_seconds()) if from_status else None,
+            task_age_seconds=max(int((now - created_at).total_seconds()), 0),
+            center_id=task.center_id,
+            service_type=task.description
+        ))
+        task.status_changed_at = now
+
+    @staticmethod
+    def get_transitions(task_id):
+        return TaskTransition.query.filter_by(task_id=task_id).order_by(TaskTransition.id).all()
+
+    # ===== TỔNG HỢP =====
+    @staticmethod
+    def _phases():
+        """(giai đoạn, cột giá trị, điều kiện) cho từng giai đoạn được đo"""
+        return [
+            ("wait", TaskTransition.duration_seconds, and_(
+                TaskTransition.from_status == "pending",
+                TaskTransition.to_status.in_(("in_progress", "completed"))
+            )),
+            ("work", TaskTransition.duration_seconds, and_(
+                TaskTransition.from_status == "in_progress",
+                TaskTransition.to_status == "completed"
+            )),
+            ("lead", TaskTransition.task_age_seconds, TaskTransition.to_status == "completed"),
+        ]
+
+    @staticmethod
+    def _percentile(sorted_values, fraction):
+        """Nội suy tuyến tính giống percentile_cont của Postgres"""
+        position = (len(sorted_values) - 1) * fraction
+        lower = int(position)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+    @staticmethod
+    def _aggregate(phase, value, condition, start, end):
+        """Các dòng tổng hợp của một giai đoạn trong [start, end)"""
+        window = and_(condition, value.isnot(None), TaskTransition.changed_at >= start, TaskTransition.changed_at < end)
+        groups = (TaskTransition.center_id, TaskTransition.service_type)
+
+        if db.engine.dialect.name == "postgresql":
+            rows = db.session.query(
+                *groups, func.count(), func.avg(value),
+                *[func.percentile_cont(p).within_group(value) for p in TaskSlaService.PERCENTILES]
+            ).filter(window).group_by(*groups).all()
+            return [{
+                "center_id": row[0], "service_type": row[1], "phase": phase, "sample_count": row[2],
+                "avg_seconds": float(row[3]), "p50_seconds": float(row[4]),
+                "p90_seconds": float(row[5]), "p99_seconds": float(row[6])
+            } for row in rows]
+
+        values = {}
+        for center_id, service_type, seconds in db.session.query(*groups, value).filter(window):
+            values.setdefault((center_id, service_type), []).append(seconds)
+        rows = []
+        for (center_id, service_type), samples in values.items():
+            samples.sort()
+            p50, p90, p99 = (TaskSlaService._percentile(samples, p) for p in TaskSlaService.PERCENTILES)
+            rows.append({
+                "center_id": center_id, "service_type": service_type, "phase": phase,
+                "sample_count": len(samples), "avg_seconds": sum(samples) / len(samples),
+                "p50_seconds": p50, "p90_seconds": p90, "p99_seconds": p99
+            })
+        return rows
+
+    @staticmethod
+    def rollup_day(day):
+        """Tính lại toàn bộ dòng tổng hợp của một ngày (xóa rồi ghi trong một transaction)"""
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        rows = []
+        for phase, value, condition in TaskSlaService._phases():
+            rows.extend(TaskSlaService._aggregate(phase, value, condition, start, end))
+
+        TaskSlaDaily.query.filter(TaskSlaDaily.day == day).delete(synchronize_session=False)
+        if rows:
+            db.session.execute(insert(TaskSlaDaily), [dict(row, day=day) for row in rows])
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def run_once(now=None, days_back=1):
+        """Tổng hợp lại days_back ngày trước và hôm nay (phần đã qua). Trả về số dòng mỗi ngày"""
+        today = (now or datetime.now()).date()
+        return {
+            (today - timedelta(days=offset)).isoformat(): TaskSlaService.rollup_day(today - timedelta(days=offset))
+            for offset in range(days_back, -1, -1)
+        }
+
+    @staticmethod
+    def get_sla(date_from, date_to, center_id=None, service_type=None, phase=None):
+        """Các dòng tổng hợp theo ngày trong [date_from, date_to]"""
+        query = TaskSlaDaily.query.filter(TaskSlaDaily.day >= date_from, TaskSlaDaily.day <= date_to)
+        if center_id is not None:
+            query = query.filter(TaskSlaDaily.center_id == center_id)
+        if service_type:
+            query = query.filter(TaskSlaDaily.service_type == service_type)
+        if phase:
+            query = query.filter(TaskSlaDaily.phase == phase)
+        rows = query.order_by(
+            TaskSlaDaily.day, TaskSlaDaily.center_id, TaskSlaDaily.service_type, TaskSlaDaily.phase
+        ).all()
+        return [row.to_dict() for row in rows]
+
+    @staticmethod
+    def start_rollup_loop(app, run_hour=None, check_interval_seconds=600):
+        """Tổng hợp SLA mỗi ngày (sau run_hour giờ) trong thread nền; bỏ qua nếu hôm nay đã có worker chạy"""
+        run_hour = TaskSlaService.DEFAULT_RUN_HOUR if run_hour is None else run_hour
+        last_run_date = [None]
+
+        def loop():
+            while True:
+                time.sleep(check_interval_seconds)
+                now = datetime.now()
+                if now.hour < run_hour or last_run_date[0] == now.date():
+                    continue
+                with app.app_context():
+                    try:
+                        midnight = datetime.combine(now.date(), datetime.min.time())
+                        last_run = db.session.query(func.max(TaskSlaDaily.computed_at)).filter(
+                            TaskSlaDaily.day == now.date() - timedelta(days=1)
+                        ).scalar()
+                        if last_run and last_run >= midnight:
+                            last_run_date[0] = now.date()
+                            continue
+                        stats = TaskSlaService.run_once(now)
+                        last_run_date[0] = now.date()
+                        app.logger.info(f"SLA rollup job: {stats}")
+                    except Exception as e:
+                        app.logger.error(f"SLA rollup job error: {str(e)}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,181 @@
+"""
+Xe theo VIN và lịch sử bảo dưỡng của xe.
+
+Bảng vehicles giữ một dòng cho mỗi VIN thật (vin_number trong User Profile). Mọi thay đổi lịch sử
+của xe (tạo task, đổi trạng thái, phụ tùng, checklist) gọi touch_task()/touch() TRƯỚC khi commit để
+tăng history_version trong cùng transaction. Một trang lịch sử tốn 3 query theo index
+(task theo (vehicle_vin, task_id), phụ tùng và checklist theo task_id) và được cache trong LRU của
+worker theo (VIN, trang); entry chỉ được dùng khi history_version còn khớp, nên không bao giờ cũ
+dù ghi ở worker khác. Mỗi lần đọc vẫn tốn một lookup dòng vehicles theo khóa unique.
+"""
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from models.maintenance_model import MaintenanceTask, TaskPart, MaintenanceChecklist, Vehicle
+
+_lock = Lock()
+_lru = OrderedDict()  # (vin, before_id, limit) -> (history_version, page)
+
+
+class VehicleService:
+    """Service xe và lịch sử bảo dưỡng theo VIN"""
+
+    LRU_SIZE = 2000
+    MAX_PAGE_SIZE = 100
+
+    @staticmethod
+    def normalize_vin(vin):
+        """VIN viết hoa, bỏ khoảng trắng; None nếu rỗng"""
+        vin = "".join((vin or "").split()).upper()
+        return vin or None
+
+    # ===== GHI =====
+    @staticmethod
+    def upsert(vin, user_id, vehicle_model=None):
+        """Tạo hoặc cập nhật chủ xe / dòng xe (không commit, chạy trong transaction tạo task)"""
+        insert_fn = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert_fn(Vehicle.__table__).values(
+            vin=vin, user_id=user_id, vehicle_model=vehicle_model, history_version=1
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[Vehicle.vin],
+            set_={
+                "user_id": stmt.excluded.user_id,
+                "vehicle_model": func.coalesce(stmt.excluded.vehicle_model, Vehicle.__table__.c.vehicle_model),
+                "history_version": Vehicle.__table__.c.history_version + 1,
+                "updated_at": func.now(),
+            }
+        ))
+
+    @staticmethod
+    def touch(vin, **values):
+        """Đánh dấu lịch sử của xe đã thay đổi, kèm cập nhật thêm cột nếu có (không commit)"""
+        db.session.execute(
+            update(Vehicle)
+            .where(Vehicle.vin == vin)
+            .values(history_version=Vehicle.history_version + 1, **values)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def touch_task(task_id):
+        """touch() cho xe của một task, không cần nạp task (không commit)"""
+        vin = db.session.query(MaintenanceTask.vehicle_vin).filter(
+            MaintenanceTask.task_id == task_id
+        ).scalar_subquery()
+        db.session.execute(
+            update(Vehicle)
+            .where(Vehicle.vin == vin)
+            .values(history_version=Vehicle.history_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    # ===== NÂNG CẤP =====
+    @staticmethod
+    def rekey_legacy_tasks():
+        """
+        Gắn task tạo trước khi có bảng vehicles (vehicle_vin là mã tạm VIN_{booking}_{username}) vào VIN
+        thật trong Profile hiện tại của chủ xe và tạo dòng vehicles. Chạy một lần sau khi nâng cấp.
+        Mỗi xe chỉ giữ mốc bảo dưỡng kế tiếp mới nhất. Trả về (số task đã gắn, danh sách user_id chưa gắn được)
+        """
+        from services.maintenance_service import MaintenanceService
+
+        legacy = MaintenanceTask.vehicle_vin.like("VIN\\_%", escape="\\")
+        user_ids = [
+            user_id for (user_id,) in
+            db.session.query(MaintenanceTask.user_id).filter(legacy).distinct().order_by(MaintenanceTask.user_id)
+        ]
+
+        rekeyed, skipped = 0, []
+        for user_id in user_ids:
+            profile, error = MaintenanceService._get_user_profile(user_id)
+            vin = VehicleService.normalize_vin((profile or {}).get("vin_number"))
+            if error or not vin:
+                skipped.append(user_id)
+                continue
+
+            VehicleService.upsert(vin, user_id, profile.get("vehicle_model"))
+            rekeyed += MaintenanceTask.query.filter(
+                MaintenanceTask.user_id == user_id, legacy
+            ).update({MaintenanceTask.vehicle_vin: vin}, synchronize_session=False)
+
+            # Mỗi mã tạm có thể đã có mốc riêng: chỉ giữ mốc muộn nhất của xe
+            keep = MaintenanceTask.query.filter(
+                MaintenanceTask.vehicle_vin == vin, MaintenanceTask.next_service_due.isnot(None)
+            ).order_by(MaintenanceTask.next_service_due.desc(), MaintenanceTask.task_id.desc()).first()
+            if keep:
+                MaintenanceTask.query.filter(
+                    MaintenanceTask.vehicle_vin == vin,
+                    MaintenanceTask.next_service_due.isnot(None),
+                    MaintenanceTask.task_id != keep.task_id
+                ).update({
+                    MaintenanceTask.next_service_due: None,
+                    MaintenanceTask.next_service_mileage: None
+                }, synchronize_session=False)
+
+            last_service_at = db.session.query(func.max(MaintenanceTask.completed_at)).filter(
+                MaintenanceTask.vehicle_vin == vin, MaintenanceTask.status == "completed"
+            ).scalar()
+            VehicleService.touch(vin, last_service_at=func.coalesce(last_service_at, Vehicle.last_service_at))
+            db.session.commit()
+
+        return rekeyed, skipped
+
+    # ===== ĐỌC =====
+    @staticmethod
+    def get_vehicle(vin):
+        return Vehicle.query.filter_by(vin=VehicleService.normalize_vin(vin)).first()
+
+    @staticmethod
+    def _load_page(vin, before_id, limit):
+        query = MaintenanceTask.query.filter(MaintenanceTask.vehicle_vin == vin)
+        if before_id:
+            query = query.filter(MaintenanceTask.task_id < before_id)
+        tasks = query.order_by(MaintenanceTask.task_id.desc()).limit(limit).all()
+        task_ids = [task.task_id for task in tasks]
+
+        parts, checklist = {}, {}
+        if task_ids:
+            for part in TaskPart.query.filter(TaskPart.task_id.in_(task_ids)).order_by(TaskPart.id):
+                parts.setdefault(part.task_id, []).append(part.to_dict())
+            for item in MaintenanceChecklist.query.filter(
+                MaintenanceChecklist.task_id.in_(task_ids)
+            ).order_by(MaintenanceChecklist.id):
+                checklist.setdefault(item.task_id, []).append(item.to_dict())
+
+        history = []
+        for task in tasks:
+            entry = task.to_dict()
+            entry["parts"] = parts.get(task.task_id, [])
+            entry["checklist"] = checklist.get(task.task_id, [])
+            history.append(entry)
+        return {
+            "tasks": history,
+            "next_before_id": task_ids[-1] if len(task_ids) == limit else None
+        }
+
+    @staticmethod
+    def get_history(vehicle, before_id=None, limit=20):
+        """Một trang lịch sử (mới nhất trước) kèm phụ tùng và kết quả checklist; cache theo history_version"""
+        limit = max(1, min(limit, VehicleService.MAX_PAGE_SIZE))
+        key = (vehicle.vin, before_id or 0, limit)
+        with _lock:
+            entry = _lru.get(key)
+            if entry is not None and entry[0] == vehicle.history_version:
+                _lru.move_to_end(key)
+                page = entry[1]
+            else:
+                page = None
+
+        if page is None:
+            page = VehicleService._load_page(vehicle.vin, before_id, limit)
+            with _lock:
+                _lru[key] = (vehicle.history_version, page)
+                _lru.move_to_end(key)
+                while len(_lru) > VehicleService.LRU_SIZE:
+                    _lru.popitem(last=False)
+
+        return dict(page, vehicle=vehicle.to_dict())
@@ -23,4 +23,22 @@ def internal_create_notification():
     return jsonify({
         "message": "Notification created successfully",
         "notification": notification.to_dict()
-    }), 201
\ No newline at end of file
+    }), 201
+
+@internal_bp.route("/bulk", methods=["POST"])
+def internal_create_notifications_bulk():
+    """
+    Internal API to create many notifications in one request (tối đa 10.000, một transaction).
+    ids: id của từng notification, cùng thứ tự với danh sách gửi lên.
+    """
+    data = request.get_json(silent=True) or {}
+
+    ids, error = NotificationService.create_notifications_bulk(data.get("notifications"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    return jsonify({
+        "message": "Notifications created successfully",
+        "created": len(ids),
+        "ids": ids
+    }), 201
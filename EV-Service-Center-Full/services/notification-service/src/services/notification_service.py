@@ -1,6 +1,7 @@
 import json
 from datetime import datetime
 from flask import current_app
+from sqlalchemy import insert
 
 # Import db from root app.py
 import sys
@@ -54,6 +55,92 @@ class NotificationService:
             db.session.rollback()
             return None, f"Error creating notification: {str(e)}"
     
+    BULK_MAX_ITEMS = 10000
+    BULK_CHUNK_SIZE = 1000
+    NOTIFICATION_TYPES = ("booking_status", "inventory_alert", "payment", "reminder", "system")
+    CHANNELS = ("in_app", "email", "sms", "push")
+    PRIORITIES = ("low", "medium", "high", "urgent")
+
+    @staticmethod
+    def _bulk_row(index, data, now):
+        """Kiểm tra và chuyển một phần tử request thành dòng insert. Trả về (row, error)"""
+        if not isinstance(data, dict) or not all(data.get(k) not in (None, "") for k in ("user_id", "title", "message")):
+            return None, f"Item {index}: missing required fields: user_id, title, message"
+        try:
+            user_id = int(data["user_id"])
+        except (TypeError, ValueError):
+            return None, f"Item {index}: user_id must be an integer"
+
+        notification_type = data.get("notification_type", "system")
+        channel = data.get("channel", "in_app")
+        priority = data.get("priority", "medium")
+        if notification_type not in NotificationService.NOTIFICATION_TYPES:
+            return None, f"Item {index}: invalid notification_type '{notification_type}'"
+        if channel not in NotificationService.CHANNELS:
+            return None, f"Item {index}: invalid channel '{channel}'"
+        if priority not in NotificationService.PRIORITIES:
+            return None, f"Item {index}: invalid priority '{priority}'"
+        if len(str(data["title"])) > 255:
+            return None, f"Item {index}: title must be at most 255 characters"
+
+        extra_data_value = None
+        if data.get("metadata"):
+            extra_data_value = json.dumps(data.get("metadata"))
+        elif data.get("extra_data"):
+            extra_data_value = json.dumps(data.get("extra_data")) if isinstance(data.get("extra_data"), dict) else data.get("extra_data")
+
+        try:
+            scheduled_at = datetime.fromisoformat(data["scheduled_at"]) if data.get("scheduled_at") else None
+        except (TypeError, ValueError):
+            return None, f"Item {index}: scheduled_at must be an ISO datetime"
+
+        return {
+            "user_id": user_id,
+            "notification_type": notification_type,
+            "title": str(data["title"]),
+            "message": str(data["message"]),
+            "channel": channel,
+            "priority": priority,
+            "related_entity_type": data.get("related_entity_type"),
+            "related_entity_id": data.get("related_entity_id"),
+            "extra_data": extra_data_value,
+            "scheduled_at": scheduled_at,
+            # Không hẹn giờ => gửi ngay (đánh dấu sent trong cùng transaction)
+            "status": "pending" if scheduled_at else "sent",
+            "sent_at": None if scheduled_at else now
+        }, None
+
+    @staticmethod
+    def create_notifications_bulk(items):
+        """
+        Create many notifications in one transaction. Returns (ids in request order, error).
+        Toàn bộ request được kiểm tra trước; sau đó ghi bằng INSERT nhiều dòng ... RETURNING id,
+        mỗi câu BULK_CHUNK_SIZE dòng, tất cả trong một transaction (một phần tử lỗi => không ghi gì).
+        """
+        if not isinstance(items, list) or not items:
+            return None, "Field 'notifications' must be a non-empty list"
+        if len(items) > NotificationService.BULK_MAX_ITEMS:
+            return None, f"At most {NotificationService.BULK_MAX_ITEMS} notifications per request"
+
+        now = datetime.now()
+        rows = []
+        for index, data in enumerate(items):
+            row, error = NotificationService._bulk_row(index, data, now)
+            if error:
+                return None, error
+            rows.append(row)
+
+        stmt = insert(Notification).returning(Notification.id, sort_by_parameter_order=True)
+        try:
+            ids = []
+            for begin in range(0, len(rows), NotificationService.BULK_CHUNK_SIZE):
+                ids.extend(db.session.scalars(stmt, rows[begin:begin + NotificationService.BULK_CHUNK_SIZE]).all())
+            db.session.commit()
+            return ids, None
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Error creating notifications: {str(e)}"
+
     @staticmethod
     def _send_notification(notification):
         """Internal method to send notification"""
@@ -23,6 +23,7 @@ class ReminderScheduler:
         self.BOOKING_SERVICE_URL = os.getenv('BOOKING_SERVICE_URL', 'http://booking-service:8001')
         self.MAINTENANCE_SERVICE_URL = os.getenv('MAINTENANCE_SERVICE_URL', 'http://maintenance-service:8003')
         self.PAYMENT_SERVICE_URL = os.getenv('PAYMENT_SERVICE_URL', 'http://payment-service:8004')
+        self.FINANCE_SERVICE_URL = os.getenv('FINANCE_SERVICE_URL', 'http://finance-service:8002')
         self.INTERNAL_TOKEN = os.getenv('INTERNAL_SERVICE_TOKEN')
 
     def init_app(self, app):
@@ -80,8 +81,8 @@ class ReminderScheduler:
     def check_maintenance_reminders(self):
         """
         Kiểm tra và tạo nhắc nhở bảo dưỡng định kỳ
-        - Nhắc theo km: khi gần đến mốc bảo dưỡng
-        - Nhắc theo thời gian: khi gần đến chu kỳ bảo dưỡng
+        - Nhắc trước 7 ngày và 1 ngày so với mốc bảo dưỡng kế tiếp
+        - Mốc do Maintenance Service lưu (next_service_due), đọc theo trang bằng index
         """
         if not self.app:
             logger.error("App context not available")
@@ -91,53 +92,55 @@ class ReminderScheduler:
             try:
                 logger.info("🔍 Checking maintenance reminders...")
 
-                # Gọi API lấy danh sách booking cần nhắc nhở
                 headers = {'X-Internal-Token': self.INTERNAL_TOKEN}
-                response = requests.get(
-                    f"{self.MAINTENANCE_SERVICE_URL}/internal/maintenance/due-soon",
-                    headers=headers,
-                    timeout=10
-                )
+                after_id = 0
+                total = 0
+
+                while after_id is not None:
+                    response = requests.get(
+                        f"{self.MAINTENANCE_SERVICE_URL}/internal/maintenance/due-soon",
+                        params={'days': '7,1', 'after_id': after_id, 'limit': 500},
+                        headers=headers,
+                        timeout=10
+                    )
+                    if response.status_code != 200:
+                        logger.warning(f"Failed to fetch maintenance data: {response.status_code}")
+                        break
 
-                if response.status_code == 200:
                     data = response.json()
                     maintenances = data.get('maintenances', [])
+                    self._create_maintenance_reminders(maintenances)
+                    total += len(maintenances)
+                    after_id = data.get('next_after_id')
 
-                    logger.info(f"Found {len(maintenances)} maintenance due soon")
-
-                    for maintenance in maintenances:
-                        self._create_maintenance_reminder(maintenance)
-                else:
-                    logger.warning(f"Failed to fetch maintenance data: {response.status_code}")
+                logger.info(f"Found {total} maintenance due soon")
 
             except Exception as e:
                 logger.error(f"Error checking maintenance reminders: {e}")
 
-    def _create_maintenance_reminder(self, maintenance):
-        """Tạo notification nhắc nhở bảo dưỡng"""
-        try:
-            user_id = maintenance.get('user_id')
-            vehicle_info = maintenance.get('vehicle_info', {})
-            due_date = maintenance.get('due_date')
-            due_mileage = maintenance.get('due_mileage')
-            current_mileage = maintenance.get('current_mileage')
-
-            # Tính toán thông tin
-            if due_mileage and current_mileage:
-                km_left = due_mileage - current_mileage
-                km_msg = f"Còn {km_left} km nữa"
-            else:
-                km_msg = ""
-
-            if due_date:
-                days_left = (datetime.fromisoformat(due_date) - datetime.now()).days
-                time_msg = f"Còn {days_left} ngày"
-            else:
-                time_msg = ""
-
-            # Tạo title và message
-            title = f"⚠️ Nhắc nhở bảo dưỡng xe {vehicle_info.get('license_plate', 'N/A')}"
-            message = f"""
+    def _build_maintenance_reminder(self, maintenance):
+        """Tạo (chưa lưu) notification nhắc nhở bảo dưỡng cho một xe"""
+        user_id = maintenance.get('user_id')
+        vehicle_info = maintenance.get('vehicle_info') or {}
+        due_date = maintenance.get('due_date')
+        due_mileage = maintenance.get('due_mileage')
+        current_mileage = maintenance.get('current_mileage')
+        days_left = maintenance.get('days_left')
+
+        # Tính toán thông tin
+        if due_mileage and current_mileage:
+            km_msg = f"Mốc {due_mileage:,} km (lần bảo dưỡng trước: {current_mileage:,} km)"
+        else:
+            km_msg = ""
+
+        if days_left is None and due_date:
+            days_left = (datetime.fromisoformat(due_date) - datetime.now()).days
+        time_msg = f"Còn {days_left} ngày" if days_left is not None else ""
+
+        # Tạo title và message
+        vehicle_label = vehicle_info.get('license_plate') or vehicle_info.get('vin') or 'N/A'
+        title = f"⚠️ Nhắc nhở bảo dưỡng xe {vehicle_label}"
+        message = f"""
 Xe của bạn sắp đến thời gian bảo dưỡng định kỳ.
 
 📊 Thông tin:
@@ -147,35 +150,38 @@ Xe của bạn sắp đến thời gian bảo dưỡng định kỳ.
 💡 Khuyến nghị: Vui lòng đặt lịch bảo dưỡng sớm để đảm bảo xe hoạt động tốt nhất.
 
 👉 Đặt lịch ngay tại mục "Lịch Hẹn"
-            """.strip()
-
-            # Tạo notification
-            notification = Notification(
-                user_id=user_id,
-                notification_type='reminder',
-                title=title,
-                message=message,
-                channel='in_app',
-                status='pending',
-                priority='high',
-                related_entity_type='maintenance',
-                related_entity_id=maintenance.get('id'),
-                scheduled_at=datetime.now()
-            )
-
-            db.session.add(notification)
-            db.session.commit()
-
-            logger.info(f"✅ Created maintenance reminder for user {user_id}")
+        """.strip()
+
+        return Notification(
+            user_id=user_id,
+            notification_type='reminder',
+            title=title,
+            message=message,
+            channel='in_app',
+            status='pending',
+            priority='high' if days_left is not None and days_left <= 1 else 'medium',
+            related_entity_type='maintenance',
+            related_entity_id=maintenance.get('id'),
+            scheduled_at=datetime.now()
+        )
 
+    def _create_maintenance_reminders(self, maintenances):
+        """Lưu nhắc nhở bảo dưỡng cho một trang kết quả trong một transaction"""
+        if not maintenances:
+            return
+        try:
+            db.session.add_all([self._build_maintenance_reminder(maintenance) for maintenance in maintenances])
+            db.session.commit()
+            logger.info(f"✅ Created {len(maintenances)} maintenance reminders")
         except Exception as e:
-            logger.error(f"Error creating maintenance reminder: {e}")
+            logger.error(f"Error creating maintenance reminders: {e}")
             db.session.rollback()
 
     def check_payment_reminders(self):
         """
-        Kiểm tra và tạo nhắc nhở thanh toán/gia hạn
+        Kiểm tra và tạo nhắc nhở thanh toán hóa đơn
         - Nhắc trước 7 ngày, 3 ngày, 1 ngày
+        - Hạn thanh toán do Finance Service lưu (due_date), đọc theo trang bằng index
         """
         if not self.app:
             logger.error("App context not available")
@@ -185,57 +191,54 @@ Xe của bạn sắp đến thời gian bảo dưỡng định kỳ.
             try:
                 logger.info("🔍 Checking payment reminders...")
 
-                # Gọi API lấy các payment sắp đến hạn
                 headers = {'X-Internal-Token': self.INTERNAL_TOKEN}
-                response = requests.get(
-                    f"{self.PAYMENT_SERVICE_URL}/internal/payments/due-soon",
-                    headers=headers,
-                    timeout=10
-                )
+                after_id = 0
+                total = 0
+
+                while after_id is not None:
+                    response = requests.get(
+                        f"{self.FINANCE_SERVICE_URL}/internal/invoices/due-soon",
+                        params={'days': '1,3,7', 'after_id': after_id, 'limit': 500},
+                        headers=headers,
+                        timeout=10
+                    )
+                    if response.status_code != 200:
+                        logger.warning(f"Failed to fetch invoice due data: {response.status_code}")
+                        break
 
-                if response.status_code == 200:
                     data = response.json()
-                    payments = data.get('payments', [])
+                    invoices = data.get('invoices', [])
+                    self._create_payment_reminders(invoices)
+                    total += len(invoices)
+                    after_id = data.get('next_after_id')
 
-                    logger.info(f"Found {len(payments)} payments due soon")
-
-                    for payment in payments:
-                        self._create_payment_reminder(payment)
-                else:
-                    logger.warning(f"Failed to fetch payment data: {response.status_code}")
+                logger.info(f"Found {total} invoices due soon")
 
             except Exception as e:
                 logger.error(f"Error checking payment reminders: {e}")
 
-    def _create_payment_reminder(self, payment):
-        """Tạo notification nhắc nhở thanh toán"""
-        try:
-            user_id = payment.get('user_id')
-            due_date = payment.get('due_date')
-            amount = payment.get('amount')
-            service_name = payment.get('service_name', 'Dịch vụ')
-            payment_id = payment.get('id')
-
-            # Tính số ngày còn lại
-            if due_date:
-                days_left = (datetime.fromisoformat(due_date) - datetime.now()).days
-            else:
-                days_left = 0
-
-            # Xác định priority
-            if days_left <= 1:
-                priority = 'urgent'
-                urgency = '🚨 Khẩn cấp'
-            elif days_left <= 3:
-                priority = 'high'
-                urgency = '⚠️ Quan trọng'
-            else:
-                priority = 'medium'
-                urgency = '📢 Thông báo'
-
-            # Tạo title và message
-            title = f"{urgency} - Nhắc thanh toán {service_name}"
-            message = f"""
+    def _build_payment_reminder(self, invoice):
+        """Tạo (chưa lưu) notification nhắc nhở thanh toán cho một hóa đơn"""
+        user_id = invoice.get('user_id')
+        due_date = invoice.get('due_date')
+        amount = invoice.get('amount') or 0
+        service_name = invoice.get('service_name', 'Dịch vụ')
+        days_left = invoice.get('days_left', 0)
+
+        # Xác định priority
+        if days_left <= 1:
+            priority = 'urgent'
+            urgency = '🚨 Khẩn cấp'
+        elif days_left <= 3:
+            priority = 'high'
+            urgency = '⚠️ Quan trọng'
+        else:
+            priority = 'medium'
+            urgency = '📢 Thông báo'
+
+        # Tạo title và message
+        title = f"{urgency} - Nhắc thanh toán {service_name}"
+        message = f"""
 Bạn có khoản thanh toán sắp đến hạn:
 
 💰 Số tiền: {amount:,.0f} VNĐ
@@ -245,29 +248,31 @@ Bạn có khoản thanh toán sắp đến hạn:
 {f'⚠️ Lưu ý: Vui lòng thanh toán trước hạn để tránh gián đoạn dịch vụ.' if days_left <= 3 else ''}
 
 👉 Thanh toán ngay tại mục "Thanh Toán"
-            """.strip()
-
-            # Tạo notification
-            notification = Notification(
-                user_id=user_id,
-                notification_type='payment',
-                title=title,
-                message=message,
-                channel='in_app',
-                status='pending',
-                priority=priority,
-                related_entity_type='payment',
-                related_entity_id=payment_id,
-                scheduled_at=datetime.now()
-            )
-
-            db.session.add(notification)
-            db.session.commit()
-
-            logger.info(f"✅ Created payment reminder for user {user_id}")
+        """.strip()
+
+        return Notification(
+            user_id=user_id,
+            notification_type='payment',
+            title=title,
+            message=message,
+            channel='in_app',
+            status='pending',
+            priority=priority,
+            related_entity_type='invoice',
+            related_entity_id=invoice.get('id'),
+            scheduled_at=datetime.now()
+        )
 
+    def _create_payment_reminders(self, invoices):
+        """Lưu nhắc nhở thanh toán cho một trang hóa đơn trong một transaction"""
+        if not invoices:
+            return
+        try:
+            db.session.add_all([self._build_payment_reminder(invoice) for invoice in invoices])
+            db.session.commit()
+            logger.info(f"✅ Created {len(invoices)} payment reminders")
         except Exception as e:
-            logger.error(f"Error creating payment reminder: {e}")
+            logger.error(f"Error creating payment reminders: {e}")
             db.session.rollback()
 
     def send_scheduled_notifications(self):
@@ -36,6 +36,8 @@ def create_app():
     app.config["BOOKING_SERVICE_URL"] = os.getenv("BOOKING_SERVICE_URL")
     # ✅ THÊM DÒNG NÀY: Đọc biến môi trường MOMO QR và đưa vào cấu hình Flask
     app.config["MOMO_QR_CODE_URL"] = os.getenv("MOMO_QR_CODE_URL")
+    # Job đối soát có tự sửa trạng thái Invoice hay chỉ báo cáo
+    app.config["RECONCILIATION_AUTO_REPAIR"] = os.getenv("RECONCILIATION_AUTO_REPAIR", "false").lower() == "true"
     
     # ===== KHỞI TẠO EXTENSIONS =====
     db.init_app(app)
@@ -59,7 +61,7 @@ def create_app():
     # ===== IMPORT MODELS & TẠO TABLES (CHỈ TRONG CLI/LẦN ĐẦU) =====
     # KHÔNG gọi db.create_all() ở đây khi chạy Gunicorn để tránh worker crash
     with app.app_context():
-        from models.payment_model import PaymentTransaction
+        from models.payment_model import PaymentTransaction, ReconciliationCheckpoint, ReconciliationMismatch
         # db.create_all() # <-- BỎ DÒNG NÀY ĐI
 
     # ===== ĐĂNG KÝ BLUEPRINTS (Controllers) =====
@@ -81,6 +83,6 @@ if __name__ == '__main__':
     app = create_app()
     with app.app_context():
         # Chỉ chạy db.create_all() khi chạy trực tiếp hoặc trong môi trường CLI
-        from models.payment_model import PaymentTransaction
+        from models.payment_model import PaymentTransaction, ReconciliationCheckpoint, ReconciliationMismatch
         db.create_all() 
     app.run(host='0.0.0.0', port=8004, debug=True)
\ No newline at end of file
@@ -45,6 +45,11 @@ class PaymentTransaction(db.Model):
     # Mô tả dữ liệu cần thiết cho FE (QR data, Bank info,...)
     payment_data_json = db.Column(db.Text, nullable=True) 
 
+    # Index phục vụ job đối soát: quét giao dịch thành công theo thứ tự invoice_id
+    __table_args__ = (
+        db.Index("ix_payment_status_invoice", "status", "invoice_id"),
+    )
+
     def to_dict(self):
         """Chuyển đổi đối tượng sang dictionary để trả về API"""
         return {
@@ -58,4 +63,65 @@ class PaymentTransaction(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "payment_data": self.payment_data_json # Frontend sẽ parse chuỗi JSON này
-        }
\ No newline at end of file
+        }
+
+class ReconciliationCheckpoint(db.Model):
+    """Lưu tiến độ của job đối soát Payment <-> Invoice để có thể chạy tiếp sau khi bị gián đoạn"""
+    __tablename__ = "reconciliation_checkpoints"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    job_name = db.Column(db.String(100), nullable=False, unique=True)
+    # invoice_id lớn nhất đã đối soát xong (keyset của cả 2 luồng dữ liệu)
+    last_invoice_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default="idle")  # idle, running, completed, failed
+
+    checked_count = db.Column(db.Integer, nullable=False, default=0)
+    mismatch_count = db.Column(db.Integer, nullable=False, default=0)
+    repaired_count = db.Column(db.Integer, nullable=False, default=0)
+
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "job_name": self.job_name,
+            "last_invoice_id": self.last_invoice_id,
+            "status": self.status,
+            "checked_count": self.checked_count,
+            "mismatch_count": self.mismatch_count,
+            "repaired_count": self.repaired_count,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ReconciliationMismatch(db.Model):
+    """Một sai lệch phát hiện được khi đối soát (ghi xuống DB thay vì giữ trong bộ nhớ)"""
+    __tablename__ = "reconciliation_mismatches"
+
+    id = db.Column(db.Integer, primary_key=True, index=True)
+    job_name = db.Column(db.String(100), nullable=False, index=True)
+    invoice_id = db.Column(db.Integer, nullable=False, index=True)
+    # payment_not_applied, paid_without_payment, orphan_payment, amount_mismatch
+    mismatch_type = db.Column(db.String(50), nullable=False)
+    invoice_status = db.Column(db.String(20), nullable=True)
+    invoice_amount = db.Column(db.Float, nullable=True)
+    paid_amount = db.Column(db.Float, nullable=True)
+    repaired = db.Column(db.Boolean, nullable=False, default=False)
+    detected_at = db.Column(db.DateTime, nullable=False, default=func.now())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "job_name": self.job_name,
+            "invoice_id": self.invoice_id,
+            "mismatch_type": self.mismatch_type,
+            "invoice_status": self.invoice_status,
+            "invoice_amount": self.invoice_amount,
+            "paid_amount": self.paid_amount,
+            "repaired": self.repaired,
+            "detected_at": self.detected_at.isoformat() if self.detected_at else None
+        }
@@ -36,6 +36,29 @@ def init_scheduler(app):
         replace_existing=True
     )
 
+    def reconcile_payments_invoices():
+        """Đối soát Payment <-> Invoice hằng đêm (tự chạy tiếp nếu lần trước dừng giữa chừng)"""
+        from services.reconciliation_service import ReconciliationService
+        with app.app_context():
+            try:
+                ReconciliationService.run(
+                    repair=app.config.get("RECONCILIATION_AUTO_REPAIR", False),
+                    resume=True
+                )
+            except Exception as e:
+                logger.error(f"Reconciliation scheduler error: {str(e)}")
+
+    # Thêm job đối soát chạy lúc 2:00 sáng mỗi ngày
+    scheduler.add_job(
+        func=reconcile_payments_invoices,
+        trigger="cron",
+        hour=2,
+        minute=0,
+        id="reconcile_payments_invoices",
+        name="Đối soát giao dịch thanh toán với hóa đơn",
+        replace_existing=True
+    )
+
     scheduler.start()
     logger.info("✅ Payment expiration scheduler started - checking every 1 minute")
 
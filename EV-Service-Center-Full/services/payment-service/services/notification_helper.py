@@ -7,6 +7,7 @@ class NotificationHelper:
     """Helper class để gửi notifications từ các services"""
     
     NOTIFICATION_SERVICE_URL = "http://notification-service:8005"
+    BULK_MAX_ITEMS = 10000
     
     @staticmethod
     def send_notification(
@@ -73,20 +74,45 @@ class NotificationHelper:
         message: str,
         **kwargs
     ) -> Dict[str, int]:
-        """Send notification to multiple users"""
-        success = 0
-        failed = 0
-        
-        for user_id in user_ids:
-            if NotificationHelper.send_notification(
-                user_id=user_id,
-                notification_type=notification_type,
-                title=title,
-                message=message,
-                **kwargs
-            ):
-                success += 1
-            else:
-                failed += 1
-        
-        return {"success": success, "failed": failed}
\ No newline at end of file
+        """Send notification to multiple users (một request bulk thay vì một request mỗi người)"""
+        result = NotificationHelper.send_bulk([
+            dict(kwargs, user_id=user_id, notification_type=notification_type, title=title, message=message)
+            for user_id in user_ids
+        ])
+        return {"success": result["created"], "failed": len(user_ids) - result["created"]}
+
+    @staticmethod
+    def send_bulk(notifications: list) -> Dict[str, Any]:
+        """
+        Send many notifications in one request (POST /internal/notifications/bulk)
+
+        Args:
+            notifications: list of dicts with the same fields as send_notification
+
+        Returns:
+            {"success": bool, "created": int, "ids": [notification id, same order as input]}
+        """
+        if not notifications:
+            return {"success": True, "created": 0, "ids": []}
+        url = f"{NotificationHelper.NOTIFICATION_SERVICE_URL}/internal/notifications/bulk"
+        headers = {
+            "X-Internal-Token": os.getenv("INTERNAL_SERVICE_TOKEN"),
+            "Content-Type": "application/json"
+        }
+        ids = []
+        try:
+            # Notification Service nhận tối đa BULK_MAX_ITEMS phần tử mỗi request
+            for begin in range(0, len(notifications), NotificationHelper.BULK_MAX_ITEMS):
+                chunk = notifications[begin:begin + NotificationHelper.BULK_MAX_ITEMS]
+                response = requests.post(url, json={"notifications": chunk}, headers=headers, timeout=30)
+                if response.status_code != 201:
+                    current_app.logger.warning(f"Failed to send bulk notifications: {response.text}")
+                    return {"success": False, "created": len(ids), "ids": ids}
+                ids.extend(response.json().get("ids", []))
+
+            current_app.logger.info(f"Bulk notifications sent: {len(ids)}")
+            return {"success": True, "created": len(ids), "ids": ids}
+
+        except Exception as e:
+            current_app.logger.error(f"Error sending bulk notifications: {str(e)}")
+            return {"success": False, "created": len(ids), "ids": ids}
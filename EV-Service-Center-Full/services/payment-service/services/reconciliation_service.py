@@ -0,0 +1,271 @@
+"""
+Đối soát giao dịch thanh toán (Payment Service) với hóa đơn (Finance Service).
+
+Cả hai luồng dữ liệu được đọc theo từng trang keyset, sắp xếp theo invoice_id,
+rồi merge-join trong một lượt duyệt tuyến tính. Bộ nhớ sử dụng chỉ phụ thuộc vào
+kích thước trang, không phụ thuộc vào số lượng bản ghi. Tiến độ được lưu vào
+checkpoint sau mỗi trang để job có thể chạy tiếp khi bị gián đoạn.
+
+Dòng checkpoint đồng thời là lease: chỉ tiến trình đổi được status sang "running" (compare-and-set)
+mới được chạy, và updated_at được làm mới sau mỗi trang. Lease của tiến trình chết giữa chừng hết
+hạn sau LEASE_SECONDS, lần chạy sau tiếp tục từ checkpoint.
+"""
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models.payment_model import PaymentTransaction, ReconciliationCheckpoint, ReconciliationMismatch
+from services.payment_service import PaymentService
+
+
+class ReconciliationService:
+    """Service xử lý đối soát Payment <-> Invoice"""
+
+    JOB_NAME = "payment_invoice_nightly"
+    PAGE_SIZE = 1000
+    # Sai số cho phép khi so sánh số tiền (VNĐ, kiểu Float)
+    AMOUNT_TOLERANCE = 0.5
+    # Chỉ tự sửa các hóa đơn còn đang chờ thanh toán, không đụng tới hóa đơn đã hủy
+    REPAIRABLE_STATUSES = ("pending", "issued", "overdue")
+    # Lease hết hạn nếu checkpoint không được làm mới trong khoảng này (tiến trình chạy đã chết)
+    LEASE_SECONDS = 600
+
+    # --- Luồng dữ liệu ---
+    @staticmethod
+    def _iter_paid_invoices(after_invoice_id, page_size):
+        """Duyệt (invoice_id, tổng tiền đã thanh toán thành công) theo thứ tự invoice_id"""
+        last_id = after_invoice_id
+        while True:
+            rows = db.session.query(
+                PaymentTransaction.invoice_id,
+                func.sum(PaymentTransaction.amount).label("paid_amount")
+            ).filter(
+                PaymentTransaction.status == "success",
+                PaymentTransaction.invoice_id > last_id
+            ).group_by(PaymentTransaction.invoice_id)\
+             .order_by(PaymentTransaction.invoice_id.asc())\
+             .limit(page_size).all()
+
+            for row in rows:
+                yield row.invoice_id, float(row.paid_amount or 0.0)
+
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1].invoice_id
+
+    @staticmethod
+    def _iter_invoices(after_invoice_id, page_size):
+        """Duyệt hóa đơn từ Finance Service theo từng trang keyset"""
+        finance_url = current_app.config.get("FINANCE_SERVICE_URL")
+        last_id = after_invoice_id
+        while True:
+            data, error = PaymentService._call_internal_api(
+                finance_url,
+                f"/internal/invoices/page?after_id={last_id}&limit={page_size}"
+            )
+            if error:
+                raise RuntimeError(f"Không lấy được danh sách hóa đơn: {error}")
+
+            for invoice in data.get("invoices", []):
+                yield invoice
+
+            next_after_id = data.get("next_after_id")
+            if not next_after_id:
+                return
+            last_id = next_after_id
+
+    # --- Checkpoint ---
+    @staticmethod
+    def _get_checkpoint(job_name):
+        checkpoint = ReconciliationCheckpoint.query.filter_by(job_name=job_name).first()
+        if not checkpoint:
+            checkpoint = ReconciliationCheckpoint(job_name=job_name, last_invoice_id=0, status="idle")
+            db.session.add(checkpoint)
+            db.session.flush()
+        return checkpoint
+
+    @staticmethod
+    def claim(job_name=None, resume=True):
+        """
+        Giành lease của job và chuẩn bị checkpoint cho lần chạy.
+        Trả về (checkpoint, error); error nếu một lần chạy khác vẫn đang giữ lease.
+        """
+        job_name = job_name or ReconciliationService.JOB_NAME
+        try:
+            checkpoint = ReconciliationService._get_checkpoint(job_name)
+            db.session.commit()
+        except IntegrityError:
+            # Tiến trình khác vừa tạo dòng checkpoint
+            db.session.rollback()
+            checkpoint = ReconciliationService._get_checkpoint(job_name)
+
+        previous_status = checkpoint.status
+        now = datetime.utcnow()
+        claimed = ReconciliationCheckpoint.query.filter(
+            ReconciliationCheckpoint.id == checkpoint.id,
+            or_(
+                ReconciliationCheckpoint.status != "running",
+                ReconciliationCheckpoint.updated_at < now - timedelta(seconds=ReconciliationService.LEASE_SECONDS)
+            )
+        ).update({"status": "running", "updated_at": now}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return None, "Đối soát đang chạy, vui lòng thử lại sau."
+
+        if not (resume and previous_status in ("running", "failed")):
+            # Lần chạy mới: xóa báo cáo cũ và quét lại từ đầu
+            ReconciliationMismatch.query.filter_by(job_name=job_name).delete(synchronize_session=False)
+            checkpoint.last_invoice_id = 0
+            checkpoint.checked_count = 0
+            checkpoint.mismatch_count = 0
+            checkpoint.repaired_count = 0
+            checkpoint.started_at = now
+        checkpoint.finished_at = None
+        checkpoint.updated_at = now
+        db.session.commit()
+        return checkpoint, None
+
+    @staticmethod
+    def get_status(job_name=None):
+        checkpoint = ReconciliationCheckpoint.query.filter_by(job_name=job_name or ReconciliationService.JOB_NAME).first()
+        return checkpoint.to_dict() if checkpoint else None
+
+    @staticmethod
+    def get_mismatches(job_name=None, after_id=0, limit=100):
+        return ReconciliationMismatch.query.filter(
+            ReconciliationMismatch.job_name == (job_name or ReconciliationService.JOB_NAME),
+            ReconciliationMismatch.id > after_id
+        ).order_by(ReconciliationMismatch.id.asc()).limit(limit).all()
+
+    # --- So khớp ---
+    @staticmethod
+    def _compare(invoice, paid_amount):
+        """Trả về loại sai lệch (hoặc None) cho một cặp hóa đơn/giao dịch cùng invoice_id"""
+        if invoice is None:
+            return "orphan_payment"
+
+        status = invoice.get("status")
+        if paid_amount is None:
+            return "paid_without_payment" if status == "paid" else None
+
+        if status != "paid":
+            return "payment_not_applied"
+        if abs((invoice.get("total_amount") or 0.0) - paid_amount) > ReconciliationService.AMOUNT_TOLERANCE:
+            return "amount_mismatch"
+        return None
+
+    @staticmethod
+    def _record_mismatch(job_name, invoice_id, mismatch_type, invoice, paid_amount, repair):
+        repaired = False
+        if repair and mismatch_type == "payment_not_applied" \
+                and invoice.get("status") in ReconciliationService.REPAIRABLE_STATUSES:
+            _, error = PaymentService._update_invoice_status(invoice_id, "paid")
+            if error:
+                current_app.logger.error(f"Reconciliation: failed to repair Invoice {invoice_id}: {error}")
+            else:
+                repaired = True
+
+        db.session.add(ReconciliationMismatch(
+            job_name=job_name,
+            invoice_id=invoice_id,
+            mismatch_type=mismatch_type,
+            invoice_status=invoice.get("status") if invoice else None,
+            invoice_amount=invoice.get("total_amount") if invoice else None,
+            paid_amount=paid_amount,
+            repaired=repaired
+        ))
+        return repaired
+
+    @staticmethod
+    def run(repair=False, resume=True, job_name=None, page_size=None):
+        """
+        Chạy đối soát đồng bộ (dùng cho scheduler). Nếu lần chạy trước chưa hoàn tất và resume=True,
+        tiếp tục từ invoice_id đã checkpoint thay vì quét lại từ đầu.
+        Trả về (checkpoint_dict, error).
+        """
+        job_name = job_name or ReconciliationService.JOB_NAME
+        _, error = ReconciliationService.claim(job_name, resume)
+        if error:
+            return ReconciliationService.get_status(job_name), error
+        return ReconciliationService._run_claimed(job_name, repair, page_size)
+
+    @staticmethod
+    def start(app, repair=False, resume=True, job_name=None, page_size=None):
+        """
+        Giành lease rồi chạy đối soát trong thread nền (dùng cho endpoint nội bộ).
+        Trả về (checkpoint_dict, error) ngay sau khi giành được lease.
+        """
+        job_name = job_name or ReconciliationService.JOB_NAME
+        checkpoint, error = ReconciliationService.claim(job_name, resume)
+        if error:
+            return ReconciliationService.get_status(job_name), error
+        result = checkpoint.to_dict()
+
+        def worker():
+            with app.app_context():
+                try:
+                    ReconciliationService._run_claimed(job_name, repair, page_size)
+                finally:
+                    db.session.remove()
+
+        threading.Thread(target=worker, daemon=True).start()
+        return result, None
+
+    @staticmethod
+    def _run_claimed(job_name, repair, page_size=None):
+        """Merge-join từ checkpoint hiện tại; chỉ gọi sau khi claim() thành công"""
+        page_size = page_size or ReconciliationService.PAGE_SIZE
+        checkpoint = ReconciliationService._get_checkpoint(job_name)
+
+        start_after = checkpoint.last_invoice_id
+        payments = ReconciliationService._iter_paid_invoices(start_after, page_size)
+        invoices = ReconciliationService._iter_invoices(start_after, page_size)
+
+        try:
+            payment = next(payments, None)
+            invoice = next(invoices, None)
+            processed = 0
+
+            while payment is not None or invoice is not None:
+                if payment is None or (invoice is not None and invoice["id"] < payment[0]):
+                    key, current_invoice, paid_amount = invoice["id"], invoice, None
+                    invoice = next(invoices, None)
+                elif invoice is None or payment[0] < invoice["id"]:
+                    key, current_invoice, paid_amount = payment[0], None, payment[1]
+                    payment = next(payments, None)
+                else:
+                    key, current_invoice, paid_amount = invoice["id"], invoice, payment[1]
+                    invoice = next(invoices, None)
+                    payment = next(payments, None)
+
+                mismatch_type = ReconciliationService._compare(current_invoice, paid_amount)
+                if mismatch_type:
+                    checkpoint.mismatch_count += 1
+                    if ReconciliationService._record_mismatch(job_name, key, mismatch_type, current_invoice, paid_amount, repair):
+                        checkpoint.repaired_count += 1
+
+                checkpoint.checked_count += 1
+                checkpoint.last_invoice_id = key
+                processed += 1
+                if processed % page_size == 0:
+                    # Làm mới lease cùng lúc lưu tiến độ
+                    checkpoint.updated_at = datetime.utcnow()
+                    db.session.commit()
+
+            checkpoint.status = "completed"
+            checkpoint.finished_at = datetime.utcnow()
+            db.session.commit()
+            current_app.logger.info(
+                f"✅ Reconciliation done: {checkpoint.checked_count} checked, "
+                f"{checkpoint.mismatch_count} mismatches, {checkpoint.repaired_count} repaired"
+            )
+            return checkpoint.to_dict(), None
+        except Exception as e:
+            db.session.rollback()
+            checkpoint = ReconciliationService._get_checkpoint(job_name)
+            checkpoint.status = "failed"
+            db.session.commit()
+            current_app.logger.error(f"❌ Reconciliation failed at invoice {checkpoint.last_invoice_id}: {str(e)}")
+            return checkpoint.to_dict(), f"Lỗi khi đối soát: {str(e)}"
@@ -13,24 +13,31 @@ MAINTENANCE_SERVICE_URL = os.getenv("MAINTENANCE_SERVICE_URL", "http://maintenan
 INTERNAL_SERVICE_TOKEN = os.getenv("INTERNAL_SERVICE_TOKEN")
 
 
-def get_technician_completed_tasks(user_id):
-    """Lấy số tasks hoàn thành từ maintenance-service"""
+def get_technicians_completed_tasks(user_ids):
+    """
+    Lấy số tasks hoàn thành của nhiều technician từ maintenance-service (một lời gọi cho mỗi 1000 người).
+    Trả về {user_id: completed_tasks}, hoặc None nếu không lấy được.
+    """
+    completed = {}
     try:
-        response = requests.get(
-            f"{MAINTENANCE_SERVICE_URL}/internal/maintenance/technician/{user_id}/stats",
-            headers={"X-Internal-Token": INTERNAL_SERVICE_TOKEN},
-            timeout=5
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                return data.get('stats', {}).get('completed_tasks', 0)
+        # Endpoint nhận tối đa 1000 id mỗi lần
+        for begin in range(0, len(user_ids), 1000):
+            response = requests.post(
+                f"{MAINTENANCE_SERVICE_URL}/internal/maintenance/technicians/stats",
+                json={"ids": user_ids[begin:begin + 1000]},
+                headers={"X-Internal-Token": INTERNAL_SERVICE_TOKEN},
+                timeout=5
+            )
+            data = response.json() if response.status_code == 200 else {}
+            if not data.get('success'):
+                return None
+            for user_id, stats in data.get('stats', {}).items():
+                completed[int(user_id)] = stats.get('completed_tasks', 0)
 
-        return 0
+        return completed
     except Exception as e:
-        print(f"Error fetching technician stats for user {user_id}: {e}")
-        return 0
+        print(f"Error fetching technician stats: {e}")
+        return None
 
 
 def sync_staff_from_users():
@@ -49,15 +56,21 @@ def sync_staff_from_users():
         users_data = response.json()
         users = users_data.get('users', [])
 
+        # Chỉ lấy technician và admin
+        users = [u for u in users if u.get('role', '').lower() in ['technician', 'admin']]
+
+        # Một lời gọi thống kê cho mọi technician, một query cho mọi staff hiện có
+        technician_ids = [u['id'] for u in users if u.get('role', '').lower() == 'technician']
+        completed_by_user = get_technicians_completed_tasks(technician_ids)
+        existing_staff = {
+            s.user_id: s for s in Staff.query.filter(Staff.user_id.in_([u['id'] for u in users])).all()
+        } if users else {}
+
         staff_list = []
 
         for user in users:
             user_role = user.get('role', '').lower()
 
-            # Chỉ lấy technician và admin
-            if user_role not in ['technician', 'admin']:
-                continue
-
             # Map role từ user sang staff
             staff_role_map = {
                 'technician': 'technician',
@@ -66,16 +79,18 @@ def sync_staff_from_users():
             staff_role = staff_role_map.get(user_role, 'technician')
 
             # Kiểm tra xem staff đã tồn tại chưa (dựa vào user_id)
-            staff = Staff.query.filter_by(user_id=user['id']).first()
+            staff = existing_staff.get(user['id'])
 
             # Ensure full_name is never None
             full_name = user.get('full_name') or user.get('username') or f"User {user['id']}"
             email = user.get('email') or f"user{user['id']}@example.com"
 
-            # Lấy số tasks hoàn thành từ maintenance-service (chỉ cho technician)
+            # Số tasks hoàn thành (chỉ cho technician); None = maintenance-service lỗi, giữ số cũ
             completed_tasks = 0
-            if user_role == 'technician':
-                completed_tasks = get_technician_completed_tasks(user['id'])
+            if user_role == 'technician' and completed_by_user is not None:
+                completed_tasks = completed_by_user.get(user['id'], 0)
+            elif user_role == 'technician':
+                completed_tasks = None
 
             if not staff:
                 # Tạo mới staff từ user
@@ -88,7 +103,7 @@ def sync_staff_from_users():
                     specialization='general',  # Default
                     status='active',
                     employee_code=f"EMP{user['id']:04d}",
-                    total_tasks_completed=completed_tasks
+                    total_tasks_completed=completed_tasks or 0
                 )
                 db.session.add(staff)
             else:
@@ -97,7 +112,8 @@ def sync_staff_from_users():
                 staff.email = email
                 staff.phone = user.get('phone')
                 staff.role = staff_role
-                staff.total_tasks_completed = completed_tasks
+                if completed_tasks is not None:
+                    staff.total_tasks_completed = completed_tasks
 
             staff_list.append(staff)
 
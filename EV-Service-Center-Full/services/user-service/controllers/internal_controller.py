@@ -21,11 +21,15 @@ def internal_get_user(user_id):
     if not user:
         return jsonify({"error": "Không tìm thấy người dùng"}), 404
 
+    profile = user.profile
     return jsonify({
         "id": user.user_id,
         "username": user.username,
         "email": user.email,
-        "role": user.role
+        "role": user.role,
+        "full_name": profile.full_name if profile else None,
+        "vehicle_model": profile.vehicle_model if profile else None,
+        "vin_number": profile.vin_number if profile else None
     })
 
 